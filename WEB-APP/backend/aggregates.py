@@ -0,0 +1,99 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+def _product_state(stock, min_threshold, max_capacity):
+    """Per-product low stock flag, critical flag and fill ratio"""
+    return stock <= min_threshold, stock <= min_threshold * 0.5, stock / max_capacity
+
+
+class StockAggregates:
+    """Per-store and network-wide stock counters kept in step with writes.
+
+    Each product contributes a low stock flag, a critical flag and a fill
+    ratio to its store's totals. The contributions are remembered per
+    product, so a stock change only subtracts the old values and adds the
+    new ones instead of rescanning the table. ``verify`` recomputes
+    everything from the inventory and reports any drift without changing
+    the counters; ``rebuild`` replaces them with the recomputed values.
+    """
+
+    def __init__(self, inventory):
+        self.inventory = inventory
+        products = inventory.products
+        self._store_index = pd.Index(products['store_id'].cat.categories)
+        self._store_codes = products['store_id'].cat.codes.to_numpy()
+        self._min_threshold = products['min_threshold'].to_numpy()
+        self._max_capacity = products['max_capacity'].to_numpy()
+        # One trailing all-zero store so unknown store IDs read as empty
+        self._n_stores = len(self._store_index) + 1
+        self.product_count = np.bincount(self._store_codes, minlength=self._n_stores).astype(np.int64)
+        self._lock = threading.Lock()
+        self.rebuild()
+
+    def _recount(self):
+        """Per-product state and per-store counters computed from the inventory"""
+        stock = self.inventory.products['current_stock'].to_numpy()
+        low, critical, fill = _product_state(stock, self._min_threshold, self._max_capacity)
+        counters = (
+            np.bincount(self._store_codes, low, self._n_stores).astype(np.int64),
+            np.bincount(self._store_codes, critical, self._n_stores).astype(np.int64),
+            np.bincount(self._store_codes, fill, self._n_stores)
+        )
+        return (low, critical, fill), counters
+
+    def rebuild(self):
+        """Recompute every counter from the inventory"""
+        with self._lock:
+            (self._low, self._critical, self._fill), counters = self._recount()
+            self.low_count, self.critical_count, self.fill_sum = counters
+
+    def update(self, product_ids):
+        """Fold stock changes of these products into the counters"""
+        rows = self.inventory.product_rows(product_ids)
+        rows = rows[rows >= 0]
+        if not len(rows):
+            return
+        with self._lock:
+            stock = np.asarray(self.inventory.stock_at(rows))
+            low, critical, fill = _product_state(stock, self._min_threshold[rows], self._max_capacity[rows])
+            stores = self._store_codes[rows]
+            np.add.at(self.low_count, stores, low.astype(np.int64) - self._low[rows])
+            np.add.at(self.critical_count, stores, critical.astype(np.int64) - self._critical[rows])
+            np.add.at(self.fill_sum, stores, fill - self._fill[rows])
+            self._low[rows], self._critical[rows], self._fill[rows] = low, critical, fill
+
+    def stores(self, store_ids):
+        """Counters for each store as a dict of arrays"""
+        pos = self._store_index.get_indexer(store_ids)
+        with self._lock:
+            return {
+                'low_stock': self.low_count[pos],
+                'critical_stock': self.critical_count[pos],
+                'fill_sum': self.fill_sum[pos],
+                'products': self.product_count[pos]
+            }
+
+    def network(self):
+        """Counters summed over every store"""
+        with self._lock:
+            products = int(self.product_count.sum())
+            return {
+                'products': products,
+                'low_stock': int(self.low_count.sum()),
+                'critical_stock': int(self.critical_count.sum()),
+                'avg_fill': float(self.fill_sum.sum() / products) if products else float('nan')
+            }
+
+    def verify(self, rtol=1e-9):
+        """Recompute every counter from scratch and return the stores that have drifted.
+
+        The counters are left as they are; ``rebuild`` replaces them.
+        """
+        with self._lock:
+            _, (low, critical, fill) = self._recount()
+            mismatched = (low != self.low_count) | (critical != self.critical_count)
+            mismatched |= ~np.isclose(fill, self.fill_sum, rtol=rtol, atol=1e-9, equal_nan=True)
+        return [str(store_id) for store_id in self._store_index[np.flatnonzero(mismatched[:-1])]]
@@ -0,0 +1,180 @@
+import json
+import queue
+import threading
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+# Alert levels per product; critical is at half the minimum threshold
+NONE, LOW, CRITICAL = 0, 1, 2
+SEVERITY = {NONE: 'low', LOW: 'medium', CRITICAL: 'high'}
+
+
+def alert_levels(stock, min_threshold):
+    return np.where(stock <= min_threshold * 0.5, CRITICAL, np.where(stock <= min_threshold, LOW, NONE))
+
+
+class AlertDetector:
+    """Low-stock alert state per product, updated as stock changes.
+
+    Levels are computed for every product once at load; afterwards only
+    products whose stock changed are re-checked, and a delta is published
+    when one crosses a threshold: ``new`` (none to low or critical),
+    ``escalated`` (low to critical), ``eased`` (critical to low) and
+    ``resolved`` (back above the minimum).
+    """
+
+    def __init__(self, inventory, stream=None):
+        self.inventory = inventory
+        self.stream = stream
+        products = inventory.products
+        self._store_ids = products['store_id'].astype(str).to_numpy()
+        self._names = products['name'].astype(str).to_numpy()
+        self._min_threshold = products['min_threshold'].to_numpy()
+        self._levels = alert_levels(products['current_stock'].to_numpy(), self._min_threshold).astype(np.int8)
+        # When each open alert was raised, so repeated reads return stable alerts
+        raised = datetime.now().isoformat()
+        self._raised_at = np.where(self._levels > NONE, raised, None).astype(object)
+        self._lock = threading.Lock()
+
+    def update(self, product_ids):
+        """Re-check products after a stock change and publish any crossings"""
+        rows = self.inventory.product_rows(product_ids)
+        return self._check(rows[rows >= 0])
+
+    def resync(self):
+        """Re-check every product, e.g. after stock was changed by another process"""
+        return self._check(np.arange(len(self._levels)))
+
+    def _check(self, rows):
+        if not len(rows):
+            return []
+
+        with self._lock:
+            stock = np.asarray(self.inventory.stock_at(rows))
+            levels = alert_levels(stock, self._min_threshold[rows])
+            changed = levels != self._levels[rows]
+            if not changed.any():
+                return []
+
+            now = datetime.now().isoformat()
+            deltas = []
+            for row, current, previous, level in zip(rows[changed], stock[changed], self._levels[rows[changed]],
+                                                     levels[changed]):
+                if level == NONE:
+                    change = 'resolved'
+                elif previous == NONE:
+                    change = 'new'
+                else:
+                    change = 'escalated' if level > previous else 'eased'
+                if previous == NONE:
+                    self._raised_at[row] = now
+                deltas.append(dict(self._alert(row, int(current), level, now), change=change))
+                if level == NONE:
+                    self._raised_at[row] = None
+            self._levels[rows[changed]] = levels[changed]
+
+        if self.stream is not None:
+            self.stream.publish(deltas)
+        return deltas
+
+    def active(self, start, end):
+        """Open alerts for the product rows in ``[start, end)``"""
+        with self._lock:
+            rows = start + np.flatnonzero(self._levels[start:end] > NONE)
+            stock = self.inventory.stock_at(rows)
+            return [self._alert(row, current, self._levels[row], self._raised_at[row]) for row, current in zip(rows, stock)]
+
+    def _alert(self, row, stock, level, timestamp):
+        product_id = self.inventory.product_ids_at([row])[0]
+        if level == NONE:
+            message = f"{self._names[row]} back above minimum stock - {stock} units"
+        else:
+            message = f"{self._names[row]} running low - only {stock} units left"
+        return {
+            'id': f"alert_{product_id}",
+            'storeId': self._store_ids[row],
+            'productId': product_id,
+            'type': 'low_stock',
+            'message': message,
+            'severity': SEVERITY[int(level)],
+            'timestamp': timestamp
+        }
+
+
+class AlertStream:
+    """Fan-out of alert deltas to per-store and network-wide subscribers.
+
+    Every subscriber owns a bounded queue and its request thread blocks on
+    it, so idle dashboards cost nothing until an alert is published. A
+    short history of recent deltas lets reconnecting clients resume from
+    their ``Last-Event-ID``. A subscriber whose queue fills up is cut off
+    and resumes the same way.
+    """
+
+    def __init__(self, history=1000, queue_size=1000):
+        self.queue_size = queue_size
+        self._recent = deque(maxlen=history)
+        self._subscribers = {}  # store_id, or None for the whole network -> set of queues
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def publish(self, alerts):
+        with self._lock:
+            for alert in alerts:
+                self._seq += 1
+                event = (self._seq, alert)
+                self._recent.append(event)
+                for channel in (alert['storeId'], None):
+                    for subscriber in list(self._subscribers.get(channel, ())):
+                        self._deliver(channel, subscriber, event)
+
+    def subscribe(self, store_id=None, last_event_id=None):
+        """Queue of ``(seq, alert)`` events for one store, or all stores with None"""
+        subscriber = queue.Queue(self.queue_size)
+        with self._lock:
+            if last_event_id is not None:
+                for seq, alert in self._recent:
+                    if seq > last_event_id and store_id in (None, alert['storeId']):
+                        self._deliver(store_id, subscriber, (seq, alert))
+            self._subscribers.setdefault(store_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, store_id, subscriber):
+        with self._lock:
+            self._subscribers.get(store_id, set()).discard(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def events(self, store_id=None, last_event_id=None, keepalive=15.0):
+        """Server-sent event stream of alert deltas"""
+        subscriber = self.subscribe(store_id, last_event_id)
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = subscriber.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event is None:
+                    return   # fell behind; the client reconnects with Last-Event-ID
+                seq, alert = event
+                yield f"id: {seq}\nevent: {alert['change']}\ndata: {json.dumps(alert)}\n\n"
+        finally:
+            self.unsubscribe(store_id, subscriber)
+
+    def _deliver(self, channel, subscriber, event):
+        try:
+            subscriber.put_nowait(event)
+        except queue.Full:
+            self._subscribers.get(channel, set()).discard(subscriber)
+            try:
+                while True:
+                    subscriber.get_nowait()
+            except queue.Empty:
+                pass
+            subscriber.put_nowait(None)
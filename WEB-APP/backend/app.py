@@ -1,37 +1,162 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import os
 import json
+import threading
+import time
 from sklearn.linear_model import LinearRegression
 from sklearn.preprocessing import StandardScaler
 import warnings
-warnings.filterwarnings('ignore')
+# Only library deprecation notices are silenced; runtime warnings like invalid values still show
+warnings.filterwarnings('ignore', category=FutureWarning)
+warnings.filterwarnings('ignore', category=DeprecationWarning)
 import math
+try:
+    import orjson
+except ImportError:  # optional; NDJSON exports fall back to the json module
+    orjson = None
 from collections import defaultdict
+from forecasting import ForecastCache, IncrementalForecaster, covered_days, predict_shortage_days, simulate_stockouts
+from datastore import InventoryStore, preparation_version
+from jobs import JobManager, balanced_shards, forecast_shard, rebalance_setup, rebalance_shard, simulation_shard
+from journal import Journal
+from tablecache import TableCache
+from sales_ingest import stream_sales_history
+from ledger import InventoryLedger, LedgerError
+from aggregates import StockAggregates
+from alerts import CRITICAL, LOW, NONE, AlertDetector, AlertStream, alert_levels
+from holiday_calendar import HolidayCalendar
+from metrics import Metrics, Profiler
+from responsecache import ResponseCache
+from routing import build_travel_times, plan_routes
+from geoindex import StoreGeoIndex
+from rebalancing import StoreDistanceMatrix, allocate_in_order, dedupe_lanes, product_lanes, solve_lanes
 
 app = Flask(__name__)
 CORS(app)
 
+# Directory of the CSV tables and runtime state, overridable to serve another dataset
+DATA_DIR = os.environ.get('INVENTORY_DATA_DIR', 'data')
+
 # Configuration for CSV file paths
 CSV_CONFIG = {
-    'stores': 'data/stores.csv',
-    'products': 'data/products.csv',
-    'sales_history': 'data/sales_history.csv',
-    'holidays': 'data/holidays.csv',
-    'warehouse_inventory': 'data/warehouse_inventory.csv',
-    'store_distances': 'data/store_distances.csv',
-    'pending_orders': 'data/pending_orders.csv',
-    'transfer_history': 'data/transfer_history.csv'
+    'stores': os.path.join(DATA_DIR, 'stores.csv'),
+    'products': os.path.join(DATA_DIR, 'products.csv'),
+    'sales_history': os.path.join(DATA_DIR, 'sales_history.csv'),
+    'holidays': os.path.join(DATA_DIR, 'holidays.csv'),
+    'warehouse_inventory': os.path.join(DATA_DIR, 'warehouse_inventory.csv'),
+    'store_distances': os.path.join(DATA_DIR, 'store_distances.csv'),
+    'pending_orders': os.path.join(DATA_DIR, 'pending_orders.csv'),
+    'transfer_history': os.path.join(DATA_DIR, 'transfer_history.csv')
+}
+
+# Binary copies of the parsed CSVs for fast startup
+TABLE_CACHE_CONFIG = {
+    'enabled': True,
+    'directory': os.path.join(DATA_DIR, '.tablecache'),
+    'verify': False  # re-check column checksums on every load
+}
+
+# How sales_history.csv is ingested: 'table' loads it whole, 'stream'
+# reads it in chunks into a per-product daily series
+SALES_INGEST_CONFIG = {
+    'mode': 'table',
+    'chunksize': 1000000,
+    'retention_days': 365  # days of history kept in 'stream' mode, None for all
+}
+
+# Incremental sales-trend forecasting
+FORECAST_CONFIG = {
+    'decay': 1.0  # weight kept by each older day; 1.0 weighs all history equally
+}
+
+# Write-ahead journal for transfers and warehouse orders
+JOURNAL_CONFIG = {
+    'directory': os.path.join(DATA_DIR, 'journal'),
+    'commit_interval': 0.002,  # seconds a commit waits to batch more writes
+    'compact_every': 10000     # events between snapshots
+}
+
+# Computed dashboard and suggestion responses
+RESPONSE_CACHE_CONFIG = {
+    'ttl': 5.0   # seconds a result is served before recomputing, if data hasn't changed sooner
+}
+
+# Bulk product export settings
+BULK_EXPORT_CONFIG = {
+    'batch_size': 5000   # products serialized per streamed chunk
+}
+
+# Background full recompute of forecasts and rebalancing plans
+RECOMPUTE_CONFIG = {
+    'workers': None,          # pool processes, defaults to the CPU count
+    'shards_per_worker': 4,   # more shards than workers keeps every core busy to the end
+    'nightly_at': '02:00'     # local time of the scheduled recompute, None to disable
 }
 
+# Monte Carlo stockout simulation
+SIMULATION_CONFIG = {
+    'paths': 1000,                             # demand paths per product
+    'days': 30,                                # days simulated ahead
+    'max_paths': 100000,
+    'max_days': 365,
+    'service_levels': (0.5, 0.9, 0.95, 0.99),
+    'block_mb': 16,                            # memory of each block of products simulated together
+    'max_request_samples': 500000000,          # products x paths x days a request may simulate; more needs a job
+    'top_products': 100                        # riskiest products listed in a network result
+}
+
+# Store-to-store travel times and truck routing
+ROUTING_CONFIG = {
+    'method': 'auto',          # 'graph', 'haversine', 'table', or 'auto' for the best available
+    'graph_path': os.path.join(DATA_DIR, 'road_edges.csv'),   # source,target,travel_time (seconds)
+    'nodes_path': os.path.join(DATA_DIR, 'road_nodes.csv'),   # node_id,latitude,longitude
+    'cache_dir': os.path.join(DATA_DIR, '.routecache'),
+    'speed_kmh': 40.0,         # average truck speed for distance-based estimates
+    'detour_factor': 1.3,      # road distance per straight-line km
+    'truck_capacity': 500,     # units per truck
+    'max_stops': 6
+}
+
+# Server-sent alert stream settings
+ALERT_STREAM_CONFIG = {
+    'keepalive': 15.0,     # seconds between comment lines on an idle stream
+    'history': 1000,       # recent deltas kept for Last-Event-ID resume
+    'queue_size': 1000     # per-subscriber backlog before it is cut off
+}
+
+# Latency histograms at /metrics and on-demand request profiling
+METRICS_CONFIG = {
+    'buckets': (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),  # seconds
+    'profiling': True,           # allow ?profile=1 or an "X-Profile: 1" header to profile a request
+    'profile_interval': 0.005,   # seconds between stack samples
+    'profiles_kept': 50
+}
+
+metrics = Metrics(METRICS_CONFIG['buckets'])
+profiler = Profiler(METRICS_CONFIG['profile_interval'], METRICS_CONFIG['profiles_kept'])
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, recording response serialization as a stage"""
+    
+    def response(self, *args, **kwargs):
+        with metrics.stage('json_serialization'):
+            return super().response(*args, **kwargs)
+
+app.json = TimedJSONProvider(app)
+
 class InventoryPredictor:
-    def __init__(self):
+    def __init__(self, cache=None, forecaster=None):
         self.model = LinearRegression()
         self.scaler = StandardScaler()
+        self.cache = cache
+        self.forecaster = forecaster
         
+    @metrics.timed('model_fit')
     def predict_shortage(self, sales_data, current_stock, holiday_impact=1.0):
         """Predict when a product will run out of stock"""
         now = datetime.now()
@@ -67,10 +192,64 @@ class InventoryPredictor:
         # If still in stock after 30 days
         return (now + timedelta(days=30)).isoformat()
 
+    @metrics.timed('model_fit')
+    def predict_shortage_batch(self, sales_matrix, lengths, current_stock, holiday_impact=1.0):
+        """Predict stockout dates for many products in one vectorized pass.
+
+        Rows of ``sales_matrix`` hold each product's ordered sales (see
+        ``build_sales_matrix``). The holiday impact is constant over a
+        product's history, so like in ``predict_shortage`` it does not change
+        the fitted trend.
+        """
+        now = datetime.now()
+        days = predict_shortage_days(sales_matrix, lengths, current_stock)
+        return [(now + timedelta(days=int(d))).isoformat() for d in days]
+
+    def predict_shortage_cached(self, product_ids, current_stock, holiday_impact, load_sales=None):
+        """Like ``predict_shortage_batch`` but only forecasts cache misses.
+
+        Misses are answered from the incremental forecaster when one is
+        set, otherwise by refitting the history returned by
+        ``load_sales(product_ids) -> (sales_matrix, lengths)``.
+        """
+        now = datetime.now()
+        product_ids = np.asarray(product_ids)
+        current_stock = np.asarray(current_stock)
+        holiday_impact = np.broadcast_to(np.asarray(holiday_impact, dtype=float), product_ids.shape)
+
+        if self.cache is None:
+            days = np.full(len(product_ids), -1, dtype=np.int64)
+        else:
+            days = self.cache.lookup(product_ids, current_stock, holiday_impact)
+
+        missing = days < 0
+        if missing.any():
+            with metrics.stage('model_fit'):
+                if self.forecaster is not None:
+                    days[missing] = self.forecaster.predict_days(product_ids[missing], current_stock[missing])
+                else:
+                    sales_matrix, lengths = load_sales(product_ids[missing])
+                    days[missing] = predict_shortage_days(sales_matrix, lengths, current_stock[missing])
+            if self.cache is not None:
+                self.cache.store(product_ids[missing], current_stock[missing],
+                                 holiday_impact[missing], days[missing])
+
+        # Forecasts only span a few distinct day counts, so each date is formatted once
+        distinct, inverse = np.unique(days, return_inverse=True)
+        dates = np.array([(now + timedelta(days=int(d))).isoformat() for d in distinct], dtype=object)
+        return dates[inverse].tolist()
+
 class EmergencyRebalancer:
-    def __init__(self):
+    SOLVERS = ('optimal', 'greedy')
+
+    def __init__(self, solver='optimal', geo_index=None):
         self.safety_buffer = 0.2  # 20% safety buffer
         self.max_transfer_distance = 50  # km
+        self.solver = solver
+        self.geo_index = geo_index  # StoreGeoIndex when stores have coordinates
+        self.lane_batch_size = 2000000  # candidate store lanes expanded at a time
+        self._distance_matrix = None  # (distances_df, StoreDistanceMatrix)
+        self._store_lanes = None  # (distance matrix, geo index, max distance, lanes)
         
     def calculate_priority_score(self, shortage_qty, urgency_factor, availability_score):
         """Calculate emergency priority score"""
@@ -84,10 +263,127 @@ class EmergencyRebalancer:
             ((distances_df['store1_id'] == store1_id) & (distances_df['store2_id'] == store2_id)) |
             ((distances_df['store1_id'] == store2_id) & (distances_df['store2_id'] == store1_id))
         ]
-        return distance_row['distance_km'].iloc[0] if not distance_row.empty else 999
+        if not distance_row.empty:
+            return distance_row['distance_km'].iloc[0]
+        if self.geo_index is not None:
+            distance = self.geo_index.distance(store1_id, store2_id)
+            if distance is not None:
+                return distance
+        return 999
+    
+    def get_distance_matrix(self, distances_df):
+        """Distance matrix for a distances table, built once and reused"""
+        if self._distance_matrix is None or self._distance_matrix[0] is not distances_df:
+            self._distance_matrix = (distances_df, StoreDistanceMatrix(distances_df))
+        return self._distance_matrix[1]
     
-    def find_rebalance_opportunities(self, products_df, distances_df):
+    @metrics.timed('rebalance_matching')
+    def find_rebalance_opportunities(self, products_df, distances_df, solver=None):
         """Find store-to-store rebalancing opportunities"""
+        solver = solver or self.solver
+        if solver not in self.SOLVERS:
+            raise ValueError(f"Unknown rebalance solver: {solver}")
+        if solver == 'greedy':
+            return self.find_greedy_rebalance(products_df, distances_df)
+        return self.find_optimal_rebalance(products_df, distances_df)
+    
+    def find_optimal_rebalance(self, products_df, distances_df):
+        """Solve each product as a min-cost transportation problem
+        
+        Donor surplus is consumed as it is assigned, so one store is never
+        promised to more receivers than it can supply. Quantities are whole
+        units: shortages round up and surpluses round down. Products are
+        planned together in batches of about ``lane_batch_size`` candidate
+        lanes, see ``solve_lanes``.
+        """
+        distances = self.get_distance_matrix(distances_df)
+        
+        stock = products_df['current_stock'].to_numpy(dtype=float)
+        threshold = products_df['min_threshold'].to_numpy(dtype=float)
+        safety_level = threshold * (1 + self.safety_buffer)
+        shortage = np.where(stock <= threshold, np.ceil(safety_level - stock), 0).astype(np.int64)
+        surplus = np.where(stock > safety_level, np.floor(stock - safety_level), 0).astype(np.int64)
+        urgency = np.where(stock <= threshold * 0.5, 3, 2)
+        
+        store_ids = products_df['store_id'].to_numpy()
+        name_codes, names = pd.factorize(products_df['name'])
+        store_index, lane_from, lane_to, lane_km = self.store_lanes(distances)
+        store_code = store_index.get_indexer(store_ids.astype(str))
+        
+        # Donors and receivers by product, cut into runs of products with similar lane counts
+        donors = np.flatnonzero(surplus > 0)
+        donors = donors[np.argsort(name_codes[donors], kind='stable')]
+        receivers = np.flatnonzero(shortage > 0)
+        receivers = receivers[np.argsort(name_codes[receivers], kind='stable')]
+        degree = np.append(np.bincount(lane_from, minlength=len(store_index)), 0)
+        load = np.bincount(name_codes[donors], weights=degree[store_code[donors]], minlength=len(names))
+        n_batches = int(np.ceil(load.sum() / self.lane_batch_size)) or 1
+        
+        plans = []
+        for first, last in balanced_shards(load, n_batches):
+            batch_donors = donors[np.searchsorted(name_codes[donors], first):
+                                  np.searchsorted(name_codes[donors], last)]
+            batch_receivers = receivers[np.searchsorted(name_codes[receivers], first):
+                                        np.searchsorted(name_codes[receivers], last)]
+            pair_from, pair_to, pair_km = product_lanes(batch_donors, batch_receivers, store_code, name_codes,
+                                                        lane_from, lane_to, lane_km, len(store_index))
+            plans.append(solve_lanes(pair_from, pair_to, pair_km, surplus, shortage, urgency))
+        if not plans:
+            return []
+        from_row, to_row, quantity, km = (np.concatenate(column) for column in zip(*plans))
+        
+        # Product by product, each in donor then receiver order
+        order = np.lexsort((to_row, from_row, name_codes[from_row]))
+        rebalance_suggestions = [
+            {
+                'from_store': store_ids[i],
+                'to_store': store_ids[j],
+                'product_name': names[name_codes[i]],
+                'transfer_qty': int(qty),
+                'distance': round(float(d), 2),
+                'priority': self.calculate_priority_score(int(shortage[j]), int(urgency[j]), int(surplus[i]))
+            }
+            for i, j, qty, d in zip(from_row[order], to_row[order], quantity[order], km[order])
+        ]
+        
+        # Sort by priority score (highest first)
+        return sorted(rebalance_suggestions, key=lambda x: x['priority'], reverse=True)
+    
+    def store_lanes(self, distances):
+        """Store pairs within transfer reach as ``(store_index, from, to, km)``, built once and reused
+        
+        Without store coordinates the pairs come from the distance table.
+        With a geo index, straight-line distances are added for pairs
+        missing from the table; table distances win where both exist.
+        """
+        cached = self._store_lanes
+        if (cached is not None and cached[0] is distances and cached[1] is self.geo_index
+                and cached[2] == self.max_transfer_distance):
+            return cached[3]
+        
+        store_index = distances.store_index
+        table = distances.matrix[:-1, :-1]
+        lane_from, lane_to = np.nonzero(np.isfinite(table))
+        lane_km = table[lane_from, lane_to].astype(float)
+        if self.geo_index is not None:
+            geo_ids = self.geo_index.store_index
+            store_index = store_index.append(geo_ids[~geo_ids.isin(store_index)])
+            near_from, near_to, near_km = self.geo_index.pairs_within(geo_ids, geo_ids, self.max_transfer_distance)
+            geo_pos = store_index.get_indexer(geo_ids)
+            lane_from, lane_to, lane_km = dedupe_lanes(
+                np.concatenate([lane_from, geo_pos[near_from]]),
+                np.concatenate([lane_to, geo_pos[near_to]]),
+                np.concatenate([lane_km, near_km]),
+                len(store_index)
+            )
+        
+        reachable = (lane_km <= self.max_transfer_distance) & (lane_from != lane_to)
+        lanes = (store_index, lane_from[reachable], lane_to[reachable], lane_km[reachable])
+        self._store_lanes = (distances, self.geo_index, self.max_transfer_distance, lanes)
+        return lanes
+    
+    def find_greedy_rebalance(self, products_df, distances_df):
+        """Match each shortage to its nearest surplus store (fast fallback)"""
         rebalance_suggestions = []
         
         # Group products by product name across stores
@@ -157,41 +453,67 @@ class EmergencyRebalancer:
         # Sort by priority score (highest first)
         return sorted(rebalance_suggestions, key=lambda x: x['priority'], reverse=True)
     
+    @metrics.timed('warehouse_allocation')
     def generate_warehouse_orders(self, products_df, warehouse_df):
-        """Generate warehouse orders for products that can't be rebalanced"""
-        warehouse_orders = []
-        
-        for _, product in products_df.iterrows():
-            if product['current_stock'] <= product['min_threshold']:
-                # Check if warehouse has stock
-                warehouse_stock = warehouse_df[
-                    warehouse_df['product_name'] == product['name']
-                ]
-                
-                if not warehouse_stock.empty:
-                    warehouse_item = warehouse_stock.iloc[0]
-                    if warehouse_item['available_stock'] > 0:
-                        order_qty = min(
-                            product['max_capacity'] - product['current_stock'],
-                            warehouse_item['available_stock']
-                        )
-                        
-                        urgency = 'high' if product['current_stock'] <= product['min_threshold'] * 0.5 else 'medium'
-                        delivery_time = 24 if urgency == 'high' else 48  # hours
-                        
-                        warehouse_orders.append({
-                            'store_id': product['store_id'],
-                            'product_name': product['name'],
-                            'product_id': product['product_id'],
-                            'order_qty': order_qty,
-                            'urgency': urgency,
-                            'estimated_delivery': (datetime.now() + timedelta(hours=delivery_time)).isoformat(),
-                            'warehouse_location': warehouse_item['warehouse_location']
-                        })
-        
-        return sorted(warehouse_orders, key=lambda x: x['urgency'] == 'high', reverse=True)
+        """Generate warehouse orders for products that can't be rebalanced
+        
+        Low-stock products are served most urgent first (critical, then by
+        lowest stock relative to threshold) from every warehouse carrying the
+        product, drawing down what is left as orders are allocated. When one
+        warehouse can't cover a product the order is split across several.
+        """
+        stock = products_df['current_stock'].to_numpy()
+        threshold = products_df['min_threshold'].to_numpy()
+        need = np.maximum(products_df['max_capacity'].to_numpy() - stock, 0)
+        low_stock = (stock <= threshold) & (need > 0)
+        
+        warehouse_stock = warehouse_df['available_stock'].to_numpy()
+        in_stock = warehouse_stock > 0
+        
+        # Shared product name codes for both tables
+        names = pd.Index(pd.unique(products_df['name'].to_numpy()[low_stock]))
+        product_group = names.get_indexer(products_df['name'].to_numpy()[low_stock])
+        warehouse_group = names.get_indexer(warehouse_df['product_name'].to_numpy()[in_stock])
+        
+        product_rows = np.flatnonzero(low_stock)
+        critical = stock[product_rows] <= threshold[product_rows] * 0.5
+        fill_ratio = stock[product_rows] / np.maximum(threshold[product_rows], 1)
+        order = np.lexsort((fill_ratio, ~critical, product_group))
+        product_rows, product_group, critical = product_rows[order], product_group[order], critical[order]
+        
+        warehouse_rows = np.flatnonzero(in_stock)
+        carried = warehouse_group >= 0
+        warehouse_rows, warehouse_group = warehouse_rows[carried], warehouse_group[carried]
+        order = np.argsort(warehouse_group, kind='stable')
+        warehouse_rows, warehouse_group = warehouse_rows[order], warehouse_group[order]
+        
+        demand_idx, supply_idx, order_qty = allocate_in_order(
+            need[product_rows], product_group,
+            warehouse_stock[warehouse_rows], warehouse_group
+        )
+        
+        now = datetime.now()
+        deliveries = {
+            'high': (now + timedelta(hours=24)).isoformat(),
+            'medium': (now + timedelta(hours=48)).isoformat()
+        }
+        orders = pd.DataFrame({
+            'store_id': products_df['store_id'].to_numpy()[product_rows[demand_idx]],
+            'product_name': products_df['name'].to_numpy()[product_rows[demand_idx]],
+            'product_id': products_df['product_id'].to_numpy()[product_rows[demand_idx]],
+            'order_qty': order_qty,
+            'urgency': np.where(critical[demand_idx], 'high', 'medium'),
+            'warehouse_location': warehouse_df['warehouse_location'].to_numpy()[warehouse_rows[supply_idx]]
+        })
+        orders.insert(5, 'estimated_delivery', orders['urgency'].map(deliveries))
+        orders = orders.sort_values('urgency', key=lambda u: u != 'high', kind='stable')
+        
+        return orders.to_dict('records')
+
+
 predictor = InventoryPredictor()
 rebalancer = EmergencyRebalancer()
+response_cache = ResponseCache(RESPONSE_CACHE_CONFIG['ttl'])
 
 def load_csv_data(file_path):
     """Load CSV data with error handling"""
@@ -296,98 +618,276 @@ def create_sample_data(file_path):
     elif filename == 'transfer_history.csv':
         return pd.DataFrame(columns=['transfer_id', 'from_store', 'to_store', 'product_name', 'quantity', 'status', 'created_at', 'completed_at'])
 
-# Load data
-stores_df = load_csv_data(CSV_CONFIG['stores'])
-products_df = load_csv_data(CSV_CONFIG['products'])
-sales_df = load_csv_data(CSV_CONFIG['sales_history'])
-holidays_df = load_csv_data(CSV_CONFIG['holidays'])
-warehouse_df = load_csv_data(CSV_CONFIG['warehouse_inventory'])
-distances_df = load_csv_data(CSV_CONFIG['store_distances'])
-pending_orders_df = load_csv_data(CSV_CONFIG['pending_orders'])
-transfer_history_df = load_csv_data(CSV_CONFIG['transfer_history'])
+# Load data into the indexed in-memory store
+table_cache = None
+if TABLE_CACHE_CONFIG['enabled']:
+    table_cache = TableCache(TABLE_CACHE_CONFIG['directory'], TABLE_CACHE_CONFIG['verify'], preparation_version())
+daily_sales = None
+if SALES_INGEST_CONFIG['mode'] == 'stream' and os.path.exists(CSV_CONFIG['sales_history']):
+    daily_sales = stream_sales_history(
+        CSV_CONFIG['sales_history'],
+        SALES_INGEST_CONFIG['chunksize'],
+        SALES_INGEST_CONFIG['retention_days'],
+        progress=lambda p: print(f"Ingesting sales history: {p['bytes'] * 100 // max(p['total_bytes'], 1)}% "
+                                 f"({p['rows']} rows, {p['elapsed']}s)")
+    )
+inventory = InventoryStore.load(CSV_CONFIG, load_csv_data, table_cache, daily_sales)
+stores_df = inventory.tables['stores']
+products_df = inventory.tables['products']
+sales_df = inventory.tables['sales_history']
+holidays_df = inventory.tables['holidays']
+warehouse_df = inventory.tables['warehouse_inventory']
+distances_df = inventory.tables['store_distances']
+pending_orders_df = inventory.tables['pending_orders']
+transfer_history_df = inventory.tables['transfer_history']
+holiday_calendar = HolidayCalendar(holidays_df)
+rebalancer.geo_index = StoreGeoIndex.from_stores(stores_df)
+
+# Running per-product sales trends, updated as new sales arrive
+forecaster = IncrementalForecaster(products_df['product_id'].astype(str), FORECAST_CONFIG['decay'])
+forecaster.load_history(inventory.sales_matrix, inventory.last_sale_days)
+predictor.forecaster = forecaster
+predictor.cache = ForecastCache(products_df['product_id'].astype(str), maxsize=200000)
+
+# Threshold crossings are pushed to alert stream subscribers
+alert_stream = AlertStream(ALERT_STREAM_CONFIG['history'], ALERT_STREAM_CONFIG['queue_size'])
+alert_detector = AlertDetector(inventory, alert_stream)
+# Store and network stock counters read by the overview endpoints
+aggregates = StockAggregates(inventory)
+
+def on_ledger_event(event):
+    """Keep derived state in step with journaled writes"""
+    response_cache.invalidate()
+    if event.get('stock'):
+        aggregates.update(list(event['stock']))
+        alert_detector.update(list(event['stock']))
+    if event['type'] == 'sales':
+        forecaster.observe(list(event['sales']), list(event['sales'].values()), event['date'])
+        predictor.cache.sales_changed(event['sales'])
+
+# Replay journaled writes on top of the CSV data
+ledger = InventoryLedger(
+    inventory,
+    Journal(JOURNAL_CONFIG['directory'], JOURNAL_CONFIG['commit_interval']),
+    JOURNAL_CONFIG['compact_every'],
+    {table: CSV_CONFIG[table] for table in ('transfer_history', 'pending_orders')}
+)
+ledger.subscribe(on_ledger_event)
+ledger.register_state('forecaster', forecaster.observed_state, forecaster.restore_observed)
+ledger.start()
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    if METRICS_CONFIG['profiling'] and '1' in (request.args.get('profile'), request.headers.get('X-Profile')):
+        g.profile = profiler.start()
+
+@app.after_request
+def record_request_metrics(response):
+    # Routes are labelled by rule so that IDs in URLs don't multiply the series
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    started = g.get('request_started')
+    if started is not None:
+        metrics.observe_request(route, request.method, response.status_code, time.perf_counter() - started)
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop(route, request.method, response.status_code)
+        response.headers['X-Profile-Id'] = profile.id
+    return response
+
+@app.teardown_request
+def stop_request_profile(exc):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request and stage latency histograms in Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """List recently captured request profiles"""
+    return jsonify([profile.summary() for profile in profiler.list()])
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Get a request profile as hot functions, or as folded stacks with ?format=folded"""
+    profile = profiler.get(profile_id)
+    if profile is None:
+        return jsonify({'error': f'Unknown profile: {profile_id}'}), 404
+    if request.args.get('format') == 'folded':
+        return Response(profile.folded(), mimetype='text/plain')
+    return jsonify(dict(profile.summary(), top=profile.top()))
 
 @app.route('/api/stores', methods=['GET'])
 def get_stores():
     """Get all stores with alert counts"""
     stores_list = []
     
-    for _, store in stores_df.iterrows():
-        store_products = products_df[products_df['store_id'] == store['store_id']]
-        alert_count = len(store_products[store_products['current_stock'] <= store_products['min_threshold']])
-        
+    alert_counts = aggregates.stores(stores_df['store_id'].astype(str))['low_stock']
+    
+    for (_, store), alert_count in zip(stores_df.iterrows(), alert_counts):
         stores_list.append({
             'id': store['store_id'],
             'name': store['store_name'],
             'location': store['location'],
             'manager': store['manager'],
             'totalValue': int(store['total_value']),
-            'alertCount': alert_count
+            'alertCount': int(alert_count)
         })
     
     return jsonify(stores_list)
 
+def predict_product_shortages(products):
+    """Predicted stockout dates for a slice of products_df, reusing cached forecasts"""
+    return predictor.predict_shortage_cached(
+        products['product_id'].astype(str).to_numpy(),
+        products['current_stock'].to_numpy(),
+        get_category_holiday_impacts(products['category']),
+        inventory.sales_matrix
+    )
+
+# API fields of a product, each computed a column at a time from a slice of products_df
+PRODUCT_FIELDS = {
+    'id': lambda products: products['product_id'].astype(str).tolist(),
+    'storeId': lambda products: products['store_id'].astype(str).tolist(),
+    'name': lambda products: products['name'].astype(str).tolist(),
+    'category': lambda products: products['category'].astype(str).tolist(),
+    'currentStock': lambda products: products['current_stock'].astype(int).tolist(),
+    'minThreshold': lambda products: products['min_threshold'].astype(int).tolist(),
+    'maxCapacity': lambda products: products['max_capacity'].astype(int).tolist(),
+    'price': lambda products: products['price'].astype(float).tolist(),
+    'lastRestocked': lambda products: products['last_restocked'].astype(str).tolist(),
+    'predictedOutOfStock': predict_product_shortages,
+    'trend': lambda products: products['trend'].astype(str).tolist(),
+    'holidayImpact': lambda products: products['holiday_impact'].astype(float).tolist()
+}
+STORE_PRODUCT_FIELDS = [field for field in PRODUCT_FIELDS if field != 'storeId']
+STOCK_STATES = {'ok': NONE, 'low': LOW, 'critical': CRITICAL}
+
+def product_records(products, fields):
+    """API records for a slice of products_df with only the requested fields"""
+    columns = [PRODUCT_FIELDS[field](products) for field in fields]
+    return [dict(zip(fields, values)) for values in zip(*columns)]
+
+def ndjson_line(record):
+    if orjson is not None:
+        return orjson.dumps(record) + b'\n'
+    return json.dumps(record, separators=(',', ':')).encode() + b'\n'
+
 @app.route('/api/stores/<store_id>/products', methods=['GET'])
 def get_store_products(store_id):
     """Get all products for a specific store"""
-    store_products = products_df[products_df['store_id'] == store_id]
-    products_list = []
-    
-    for _, product in store_products.iterrows():
-        # Get sales history for prediction
-        product_sales = sales_df[sales_df['product_id'] == product['product_id']]
-        sales_data = product_sales.sort_values('date')['units_sold'].tolist()
-        
-        # Get holiday impact
-        holiday_impact = get_holiday_impact(product['category'])
-        
-        # Predict shortage
-        predicted_out = predictor.predict_shortage(
-            sales_data, 
-            product['current_stock'], 
-            holiday_impact
-        )
+    with metrics.stage('data_slicing'):
+        store_products = inventory.store_products(store_id)
+    return jsonify(product_records(store_products, STORE_PRODUCT_FIELDS))
+
+@metrics.timed('data_slicing')
+def select_product_rows(args):
+    """Ascending products_df rows matching the stores, category and state filters"""
+    matches = np.zeros(len(products_df), dtype=bool)
+    stores = args.get('stores', 'all')
+    if stores == 'all':
+        matches[:] = True
+    else:
+        store_ids = stores.split(',')
+        starts, ends = inventory.store_bounds(store_ids)
+        unknown = [store_id for store_id, start, end in zip(store_ids, starts, ends) if start == end]
+        if unknown:
+            raise ValueError(f"Unknown stores: {', '.join(unknown)}")
+        for start, end in zip(starts, ends):
+            matches[start:end] = True
+    
+    if args.get('category'):
+        matches &= products_df['category'].isin(args['category'].split(',')).to_numpy()
+    
+    if args.get('state'):
+        states = args['state'].split(',')
+        unknown = [state for state in states if state not in STOCK_STATES]
+        if unknown:
+            raise ValueError(f"Unknown stock states: {', '.join(unknown)}")
+        levels = alert_levels(products_df['current_stock'].to_numpy(), products_df['min_threshold'].to_numpy())
+        matches &= np.isin(levels, [STOCK_STATES[state] for state in states])
+    
+    return np.flatnonzero(matches)
+
+@app.route('/api/products/bulk', methods=['GET'])
+def export_products():
+    """Stream products across stores as NDJSON, one product per line
+    
+    Query parameters: ``stores`` (comma-separated IDs or ``all``),
+    ``category``, ``state`` (``ok``, ``low``, ``critical``), ``fields``,
+    ``cursor`` and ``limit``. When more products match than ``limit``,
+    the ``X-Next-Cursor`` header holds the cursor for the next page.
+    """
+    try:
+        fields = request.args.get('fields')
+        fields = fields.split(',') if fields else list(PRODUCT_FIELDS)
+        unknown = [field for field in fields if field not in PRODUCT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        cursor = int(request.args.get('cursor', 0))
+        limit = request.args.get('limit')
+        limit = int(limit) if limit is not None else None
+        if cursor < 0 or (limit is not None and limit <= 0):
+            raise ValueError('cursor must be >= 0 and limit > 0')
         
-        products_list.append({
-            'id': product['product_id'],
-            'name': product['name'],
-            'category': product['category'],
-            'currentStock': int(product['current_stock']),
-            'minThreshold': int(product['min_threshold']),
-            'maxCapacity': int(product['max_capacity']),
-            'price': float(product['price']),
-            'lastRestocked': product['last_restocked'],
-            'predictedOutOfStock': predicted_out,
-            'trend': product['trend'],
-            'holidayImpact': float(product['holiday_impact'])
-        })
+        rows = select_product_rows(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    rows = rows[np.searchsorted(rows, cursor):]
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        next_cursor = int(rows[limit])
+        rows = rows[:limit]
+    
+    def generate():
+        batch_size = BULK_EXPORT_CONFIG['batch_size']
+        for start in range(0, len(rows), batch_size):
+            products = products_df.iloc[rows[start:start + batch_size]]
+            with metrics.stage('json_serialization'):
+                chunk = b''.join(ndjson_line(record) for record in product_records(products, fields))
+            yield chunk
     
-    return jsonify(products_list)
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['X-Result-Count'] = str(len(rows))
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
 
 @app.route('/api/stores/<store_id>/alerts', methods=['GET'])
 def get_store_alerts(store_id):
     """Get alerts for a specific store"""
-    store_products = products_df[products_df['store_id'] == store_id]
-    alerts = []
-    
-    for _, product in store_products.iterrows():
-        if product['current_stock'] <= product['min_threshold']:
-            severity = 'high' if product['current_stock'] <= product['min_threshold'] * 0.5 else 'medium'
-            alerts.append({
-                'id': f"alert_{product['product_id']}",
-                'storeId': store_id,
-                'productId': product['product_id'],
-                'type': 'low_stock',
-                'message': f"{product['name']} running low - only {product['current_stock']} units left",
-                'severity': severity,
-                'timestamp': datetime.now().isoformat()
-            })
-    
-    return jsonify(alerts)
+    start, end = inventory.store_slice(store_id)
+    return jsonify(alert_detector.active(start, end))
+
+@app.route('/api/stores/<store_id>/alerts/stream', methods=['GET'])
+def stream_store_alerts(store_id):
+    """Stream a store's alert changes as server-sent events"""
+    return alert_event_stream(store_id)
+
+@app.route('/api/alerts/stream', methods=['GET'])
+def stream_network_alerts():
+    """Stream alert changes for every store as server-sent events"""
+    return alert_event_stream(None)
+
+def alert_event_stream(store_id):
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    events = alert_stream.events(store_id, last_event_id, ALERT_STREAM_CONFIG['keepalive'])
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/api/stores/<store_id>/insights', methods=['GET'])
 def get_ai_insights(store_id):
     """Get AI insights for a specific store"""
-    store_products = products_df[products_df['store_id'] == store_id]
+    with metrics.stage('data_slicing'):
+        store_products = inventory.store_products(store_id)
     
     low_stock_products = store_products[store_products['current_stock'] <= store_products['min_threshold']]
     high_demand_products = store_products[store_products['holiday_impact'] > 1.5]
@@ -418,32 +918,494 @@ def get_ai_insights(store_id):
     
     return jsonify(insights)
 
-def get_holiday_impact(category):
-    """Calculate holiday impact for a category"""
-    upcoming_holidays = holidays_df[pd.to_datetime(holidays_df['date']) > datetime.now()]
+@app.route('/api/stores/<store_id>/nearby', methods=['GET'])
+def get_nearby_stores(store_id):
+    """Get stores within radius_km of a store, or its k nearest stores"""
+    try:
+        geo_index = rebalancer.geo_index
+        if geo_index is None or geo_index.indexer([store_id])[0] < 0:
+            return jsonify({'error': f'No coordinates for store: {store_id}'}), 404
+
+        if 'k' in request.args:
+            nearby = geo_index.nearest(store_id, int(request.args['k']))
+        else:
+            radius_km = float(request.args.get('radius_km', rebalancer.max_transfer_distance))
+            if radius_km < 0:
+                raise ValueError('radius_km must not be negative')
+            nearby = geo_index.within(store_id, radius_km)
+        return jsonify([{'store_id': other, 'distance_km': round(km, 2)} for other, km in nearby])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/datastore/memory', methods=['GET'])
+def get_datastore_memory():
+    """Get the memory footprint of the in-memory data store"""
+    return jsonify(inventory.memory_usage())
+
+@app.route('/api/forecast/cache', methods=['GET'])
+def get_forecast_cache_stats():
+    """Get forecast cache hit/miss counters"""
+    return jsonify(predictor.cache.stats())
+
+@metrics.timed('holiday_lookup')
+def get_category_holiday_impacts(categories):
+    """Holiday impact per row of a category column"""
+    return holiday_calendar.impacts(categories)
+
+@app.route('/api/holidays/impact', methods=['GET'])
+def get_holiday_impacts():
+    """Get peak and combined holiday multipliers per category over the next N days"""
+    try:
+        days = int(request.args.get('days', 30))
+        categories = request.args.get('categories')
+        categories = categories.split(',') if categories else list(holiday_calendar.categories)
+        
+        with metrics.stage('holiday_lookup'):
+            peak = holiday_calendar.peak_impacts(categories, days)
+            combined = holiday_calendar.combined_impacts(categories, days)
+        return jsonify({
+            'days': days,
+            'holidays': [
+                {'name': name, 'date': date, 'impactMultiplier': multiplier}
+                for name, date, multiplier in holiday_calendar.upcoming(days)
+            ],
+            'categories': [
+                {'category': category, 'peakImpact': float(p), 'combinedImpact': round(float(c), 4)}
+                for category, p, c in zip(categories, peak, combined)
+            ]
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sales/batch', methods=['POST'])
+def ingest_sales_batch():
+    """Ingest a day of sales and refresh the affected forecasts"""
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        sales = defaultdict(int)
+        for sale in data['sales']:
+            sales[sale['product_id']] += sale['units_sold']
+        date = str(np.datetime64(data.get('date') or datetime.now().strftime('%Y-%m-%d'), 'D'))
+        
+        # The forecasts can only take sales from each product's latest day on
+        back_dated = [product_id for product_id, late in zip(sales, forecaster.back_dated(list(sales), date)) if late]
+        if back_dated:
+            return jsonify({'error': f'Sales dated {date} are older than the latest sales of: {", ".join(back_dated)}'}), 400
+        
+        unknown = ledger.record_sales(sales, date)
+        skipped = set(unknown)
+        product_ids = [product_id for product_id in sales if product_id not in skipped]
+        
+        updated = products_df.iloc[inventory.product_rows(product_ids)]
+        predictions = predictor.predict_shortage_cached(
+            np.array(product_ids, dtype=object),
+            updated['current_stock'].to_numpy(),
+            get_category_holiday_impacts(updated['category'])
+        )
+        
+        return jsonify({
+            'success': True,
+            'updated': len(product_ids),
+            'unknown': unknown,
+            'products': [
+                {'id': product_id, 'currentStock': int(stock), 'predictedOutOfStock': predicted_out}
+                for product_id, stock, predicted_out in zip(product_ids, updated['current_stock'], predictions)
+            ]
+        })
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def cached_json(key, compute):
+    """JSON response for a cached result, answering 304 when the client's copy is current"""
+    value, etag = response_cache.get_tagged(key, compute)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)   # the client's copy is current, skip the body
+    else:
+        response = jsonify(value)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def rebalance_opportunities(solver=None):
+    """All rebalancing suggestions, shared by concurrent and repeated requests"""
+    solver = solver or rebalancer.solver
     
-    for _, holiday in upcoming_holidays.iterrows():
-        affected_categories = holiday['affected_categories'].split(',')
-        if category in affected_categories:
-            return holiday['impact_multiplier']
+    def compute():
+        published = jobs.published(('rebalance', solver), current=True)
+        if published is not None:
+            return published[1]   # published by a recompute job, nothing written since
+        return rebalancer.find_rebalance_opportunities(products_df, distances_df, solver)
     
-    return 1.0
+    return response_cache.get(('rebalance', solver), compute)
+
+def warehouse_orders():
+    """All warehouse order suggestions, shared by concurrent and repeated requests"""
+    return response_cache.get(
+        'warehouse_orders',
+        lambda: rebalancer.generate_warehouse_orders(products_df, warehouse_df)
+    )
 
 @app.route('/api/rebalance/suggestions', methods=['GET'])
 def get_rebalance_suggestions():
     """Get store-to-store rebalancing suggestions"""
+    solver = request.args.get('solver')
+    if solver is not None and solver not in EmergencyRebalancer.SOLVERS:
+        return jsonify({'error': f'Unknown solver: {solver}'}), 400
+    
+    try:
+        # Top 10 suggestions
+        return cached_json(('suggestions', solver), lambda: rebalance_opportunities(solver)[:10])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/cache/responses', methods=['GET'])
+def get_response_cache_stats():
+    """Get response cache hit/miss counters"""
+    return jsonify(response_cache.stats())
+
+# Jobs publish their results here; under serve.py they run in the loader and workers ask it
+jobs = JobManager(RECOMPUTE_CONFIG['workers'], data_version=lambda: response_cache.version)
+
+def plan_recompute(job):
+    """Shard a network-wide forecast and rebalance recompute for the job pool
+    
+    Forecast shards are runs of whole stores with similar product counts;
+    rebalance shards are groups of product names, since each product is
+    planned independently. Inputs are snapshotted here, and the finished
+    forecasts only replace cached ones for products without newer sales.
+    """
+    solver = job.params.get('solver') or rebalancer.solver
+    n_shards = jobs.workers * RECOMPUTE_CONFIG['shards_per_worker']
+    version = response_cache.version
+    
+    products = products_df
+    product_ids = products['product_id'].astype(str).to_numpy()
+    versions = predictor.cache.versions(product_ids)
+    stock = products['current_stock'].to_numpy().copy()
+    impacts = get_category_holiday_impacts(products['category'])
+    intercept, slope, count, total = forecaster.snapshot(forecaster.positions(product_ids))
+    
+    starts, ends = inventory.store_bounds(products['store_id'].cat.categories)
+    tasks = []
+    for first, last in balanced_shards(ends - starts, n_shards):
+        rows = slice(starts[first], ends[last - 1])
+        tasks.append((forecast_shard, (intercept[rows], slope[rows], count[rows], total[rows], stock[rows])))
+    n_forecast_shards = len(tasks)
+    
+    name_codes, names = pd.factorize(products['name'])
+    for shard_names in np.array_split(np.arange(len(names)), min(n_shards, max(len(names), 1))):
+        tasks.append((rebalance_shard, (np.flatnonzero(np.isin(name_codes, shard_names)), solver)))
+    
+    def finish(results):
+        days = np.concatenate(results[:n_forecast_shards]) if n_forecast_shards else np.zeros(0, dtype=np.int64)
+        predictor.cache.store(product_ids, stock, impacts, days, versions)
+        jobs.publish('forecasts', {'stock': stock, 'impacts': impacts, 'days': days}, version)
+        
+        # Same order as one unsharded pass: by priority, ties in product order
+        name_rank = {name: rank for rank, name in enumerate(names)}
+        suggestions = [suggestion for shard in results[n_forecast_shards:] for suggestion in shard]
+        suggestions.sort(key=lambda x: name_rank[x['product_name']])
+        suggestions.sort(key=lambda x: x['priority'], reverse=True)
+        jobs.publish(('rebalance', solver), suggestions, version)
+        
+        return {
+            'products': len(days),
+            'rebalanceSuggestions': len(suggestions),
+            'solver': solver,
+            'dataVersion': version
+        }
+    
+    # Shards get only their product rows; the rebalancer builds its matrix once per pool process
+    setup = (rebalance_setup, (rebalancer, products.assign(current_stock=stock), distances_df))
+    return tasks, finish, setup
+
+def adopt_published_forecasts():
+    """Cache the forecasts of the last recompute job if nothing has been written since it ran
+
+    For processes that didn't run the job themselves, like serve.py workers.
+    """
+    product_ids = products_df['product_id'].astype(str).to_numpy()
+    versions = predictor.cache.versions(product_ids)
+    published = jobs.published('forecasts', current=True)
+    if published is not None:
+        forecasts = published[1]
+        predictor.cache.store(product_ids, forecasts['stock'], forecasts['impacts'], forecasts['days'], versions)
+
+jobs.register('recompute', plan_recompute)
+if RECOMPUTE_CONFIG['nightly_at']:
+    jobs.schedule_daily(RECOMPUTE_CONFIG['nightly_at'], 'recompute')
+
+@app.route('/api/jobs/recompute', methods=['POST'])
+def start_recompute_job():
+    """Start a background recompute of every forecast and the rebalancing plan"""
+    data = request.get_json(silent=True) or {}
+    solver = data.get('solver')
+    if solver is not None and solver not in EmergencyRebalancer.SOLVERS:
+        return jsonify({'error': f'Unknown solver: {solver}'}), 400
+    
+    job = jobs.submit('recompute', {'solver': solver})
+    return jsonify(job.to_dict()), 202
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """List recent background jobs"""
+    return jsonify([job.to_dict() for job in jobs.list()])
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status and progress of a background job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job: {job_id}'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running background job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job: {job_id}'}), 404
+    if not jobs.cancel(job_id):
+        return jsonify({'error': f'Job {job_id} already {job.status}'}), 409
+    return jsonify(job.to_dict())
+
+def simulation_options(params):
+    """Validated paths, days and seed of a simulation request"""
+    paths = int(params.get('paths', SIMULATION_CONFIG['paths']))
+    days = int(params.get('days', SIMULATION_CONFIG['days']))
+    seed = params.get('seed')
+    if not 0 < paths <= SIMULATION_CONFIG['max_paths']:
+        raise ValueError(f"paths must be between 1 and {SIMULATION_CONFIG['max_paths']}")
+    if not 0 < days <= SIMULATION_CONFIG['max_days']:
+        raise ValueError(f"days must be between 1 and {SIMULATION_CONFIG['max_days']}")
+    return paths, days, int(seed) if seed is not None else None
+
+def simulation_inputs(products, days):
+    """Demand model, stock and holiday days of a slice of products_df, as simulate_stockouts takes them"""
+    product_ids = products['product_id'].astype(str).to_numpy()
+    model = forecaster.snapshot(forecaster.positions(product_ids), spread=True)
+    with metrics.stage('holiday_lookup'):
+        holiday_days = holiday_calendar.holiday_days(products['category'], days)
+    return model, products['current_stock'].to_numpy().copy(), products['holiday_impact'].to_numpy(dtype=float), holiday_days
+
+def service_level_records(stock_needed, days_covered):
+    levels = SIMULATION_CONFIG['service_levels']
+    return [
+        [{'level': level, 'stockNeeded': round(float(needed), 2), 'daysCovered': int(covered)}
+         for level, needed, covered in zip(levels, row_needed, row_covered)]
+        for row_needed, row_covered in zip(stock_needed, days_covered)
+    ]
+
+@app.route('/api/simulation/stockouts', methods=['GET'])
+def simulate_product_stockouts():
+    """Simulate stockout probability curves for the products of some stores
+    
+    Takes the ``stores``, ``category`` and ``state`` filters of the bulk
+    export, plus ``paths``, ``days`` and ``seed``. Whole-network runs
+    larger than a request should do go through ``POST /api/jobs/simulation``.
+    """
     try:
-        suggestions = rebalancer.find_rebalance_opportunities(products_df, distances_df)
-        return jsonify(suggestions[:10])  # Return top 10 suggestions
+        paths, days, seed = simulation_options(request.args)
+        rows = select_product_rows(request.args)
+        if len(rows) * paths * days > SIMULATION_CONFIG['max_request_samples']:
+            raise ValueError(f'{len(rows)} products x {paths} paths x {days} days is too large for one request; '
+                             'narrow the filters or start a simulation job')
+        
+        products = products_df.iloc[rows]
+        model, stock, impact, holiday_days = simulation_inputs(products, days)
+        levels = SIMULATION_CONFIG['service_levels']
+        with metrics.stage('simulation'):
+            curve, stock_needed = simulate_stockouts(*model, stock, impact, holiday_days, days, paths, levels,
+                                                     seed, SIMULATION_CONFIG['block_mb'] << 20, rows)
+            days_covered = covered_days(curve, levels)
+        
+        return jsonify({
+            'paths': paths,
+            'days': days,
+            'serviceLevels': list(levels),
+            'summary': {
+                'products': len(rows),
+                'expectedStockouts': [round(float(total), 2) for total in curve.sum(axis=0)]
+            },
+            'products': [
+                {'id': product_id, 'storeId': store_id, 'currentStock': int(current),
+                 'stockoutProbability': [round(float(p), 4) for p in row_curve], 'serviceLevels': row_levels}
+                for product_id, store_id, current, row_curve, row_levels in zip(
+                    products['product_id'].astype(str), products['store_id'].astype(str), stock, curve,
+                    service_level_records(stock_needed, days_covered))
+            ]
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+def plan_simulation(job):
+    """Shard a network-wide stockout simulation for the job pool
+    
+    Shards are runs of whole stores, and inside a pool process products
+    are simulated a memory-bounded block at a time. Every product draws
+    from its own random stream, keyed on its row and spawned from the
+    job's seed, so results don't depend on the sharding and match a
+    request simulation with the same seed.
+    """
+    paths, days = job.params['paths'], job.params['days']
+    n_shards = jobs.workers * RECOMPUTE_CONFIG['shards_per_worker']
+    version = response_cache.version
+    
+    products = products_df
+    model, stock, impact, holiday_days = simulation_inputs(products, days)
+    options = {'horizon': days, 'paths': paths, 'service_levels': SIMULATION_CONFIG['service_levels'],
+               'block_bytes': SIMULATION_CONFIG['block_mb'] << 20}
+    
+    starts, ends = inventory.store_bounds(products['store_id'].cat.categories)
+    shards = balanced_shards(ends - starts, n_shards)
+    seed = np.random.SeedSequence(job.params.get('seed'))
+    tasks = []
+    for first, last in shards:
+        rows = slice(starts[first], ends[last - 1])
+        tasks.append((simulation_shard, (tuple(column[rows] for column in model), stock[rows], impact[rows],
+                                         holiday_days[rows], dict(options, seed=seed,
+                                                                  streams=np.arange(rows.start, rows.stop)))))
+    
+    def finish(results):
+        curve = np.concatenate([shard[0] for shard in results]) if results else np.zeros((0, days), dtype=np.float32)
+        stock_needed = (np.concatenate([shard[1] for shard in results]) if results
+                        else np.zeros((0, len(options['service_levels'])), dtype=np.float32))
+        jobs.publish('simulation', {
+            'jobId': job.id,
+            'paths': paths,
+            'days': days,
+            'finishedAt': datetime.now().isoformat(),
+            'store_codes': products['store_id'].cat.codes.to_numpy(),
+            'stores': products['store_id'].cat.categories.astype(str),
+            'curve': curve,
+            'stock_needed': stock_needed
+        }, version)
+        return {
+            'products': len(curve),
+            'paths': paths,
+            'days': days,
+            'expectedStockouts': round(float(curve[:, -1].sum()), 2) if len(curve) else 0.0,
+            'dataVersion': version
+        }
+    
+    return tasks, finish
+
+jobs.register('simulation', plan_simulation)
+
+@app.route('/api/jobs/simulation', methods=['POST'])
+def start_simulation_job():
+    """Start a background stockout simulation of every product in the network"""
+    try:
+        paths, days, seed = simulation_options(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    job = jobs.submit('simulation', {'paths': paths, 'days': days, 'seed': seed})
+    return jsonify(job.to_dict()), 202
+
+@app.route('/api/simulation/network', methods=['GET'])
+def get_network_simulation():
+    """Get the latest network-wide simulation: risk per store and the riskiest products"""
+    try:
+        published = jobs.published('simulation')
+        if published is None:
+            return jsonify({'error': 'No simulation has finished yet; start one with POST /api/jobs/simulation'}), 404
+        result = published[1]
+        limit = int(request.args.get('limit', SIMULATION_CONFIG['top_products']))
+        if limit < 0:
+            raise ValueError('limit must not be negative')
+        
+        curve, codes = result['curve'], result['store_codes']
+        horizon_risk = curve[:, -1]
+        levels = SIMULATION_CONFIG['service_levels']
+        store_expected = np.bincount(codes, weights=horizon_risk, minlength=len(result['stores']))
+        store_at_risk = np.bincount(codes, weights=horizon_risk >= 0.5, minlength=len(result['stores']))
+        store_products = np.bincount(codes, minlength=len(result['stores']))
+        
+        riskiest = np.argsort(-horizon_risk, kind='stable')[:limit]
+        top = products_df.iloc[riskiest]
+        days_covered = covered_days(curve[riskiest], levels)
+        return jsonify({
+            'jobId': result['jobId'],
+            'finishedAt': result['finishedAt'],
+            'paths': result['paths'],
+            'days': result['days'],
+            'serviceLevels': list(levels),
+            'expectedStockouts': [round(float(total), 2) for total in curve.sum(axis=0)],
+            'stores': [
+                {'storeId': store_id, 'products': int(n), 'expectedStockouts': round(float(expected), 2),
+                 'productsAtRisk': int(at_risk)}
+                for store_id, n, expected, at_risk in zip(result['stores'], store_products, store_expected, store_at_risk)
+                if n
+            ],
+            'riskiestProducts': [
+                {'id': product_id, 'storeId': store_id, 'stockoutProbability': round(float(risk), 4),
+                 'serviceLevels': row_levels}
+                for product_id, store_id, risk, row_levels in zip(
+                    top['product_id'].astype(str), top['store_id'].astype(str), horizon_risk[riskiest],
+                    service_level_records(result['stock_needed'][riskiest], days_covered))
+            ]
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+_travel_times = None
+_travel_times_lock = threading.Lock()
+
+def get_travel_times():
+    """Store travel time matrix, built (or loaded from disk) on first use"""
+    global _travel_times
+    with _travel_times_lock:
+        if _travel_times is None:
+            _travel_times = build_travel_times(stores_df, distances_df, ROUTING_CONFIG)
+        return _travel_times
+
+@app.route('/api/routes/plan', methods=['POST'])
+def plan_transfer_routes():
+    """Batch accepted rebalance suggestions into multi-stop truck routes"""
+    try:
+        data = request.get_json(silent=True) or {}
+        suggestions = data.get('suggestions')
+        if suggestions is None:
+            suggestions = rebalance_opportunities()
+        capacity = int(data.get('truck_capacity', ROUTING_CONFIG['truck_capacity']))
+        max_stops = int(data.get('max_stops', ROUTING_CONFIG['max_stops']))
+        if capacity <= 0 or max_stops <= 0:
+            raise ValueError('truck_capacity and max_stops must be positive')
+        
+        travel_times = get_travel_times()
+        routes, unrouted = plan_routes(suggestions, travel_times, capacity, max_stops)
+        return jsonify({
+            'method': travel_times.method,
+            'routes': routes,
+            'unrouted': unrouted,
+            'total_travel_minutes': round(sum(route['travel_minutes'] for route in routes), 1)
+        })
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/analytics/overview', methods=['GET'])
 def get_analytics_overview():
     """Get overall analytics across all stores"""
-    total_products = len(products_df)
-    low_stock_count = len(products_df[products_df['current_stock'] <= products_df['min_threshold']])
-    critical_stock_count = len(products_df[products_df['current_stock'] <= products_df['min_threshold'] * 0.5])
-    avg_stock_level = (products_df['current_stock'] / products_df['max_capacity']).mean()
+    totals = aggregates.network()
+    total_products = totals['products']
+    low_stock_count = totals['low_stock']
+    critical_stock_count = totals['critical_stock']
+    avg_stock_level = totals['avg_fill']
     
     return jsonify({
         'totalProducts': total_products,
@@ -456,80 +1418,88 @@ def get_analytics_overview():
 def execute_rebalance():
     """Execute a store-to-store transfer"""
     try:
-        data = request.json
-    finally:
-        print("ok")
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        from_store = data['from_store']
+        to_store = data['to_store']
+        product_name = data['product_name']
+        transfer_qty = data['transfer_qty']
+        
+        transfer = ledger.transfer(from_store, to_store, product_name, transfer_qty)
+        
+        return jsonify({
+            'success': True,
+            'transfer_id': transfer['transfer_id'],
+            'message': f"Transfer of {transfer['quantity']} units of {product_name} from {from_store} to {to_store} initiated"
+        })
+    except (KeyError, LedgerError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/warehouse/orders', methods=['GET'])
 def get_warehouse_orders():
     """Get warehouse order suggestions"""
     try:
-        orders = rebalancer.generate_warehouse_orders(products_df, warehouse_df)
-        return jsonify(orders[:10])  # Return top 10 orders
+        return cached_json('orders', lambda: warehouse_orders()[:10])  # Return top 10 orders
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-        from_store = data['from_store']
+
 @app.route('/api/warehouse/place-order', methods=['POST'])
 def place_warehouse_order():
     """Place an order from warehouse to store"""
     try:
-        data = request.json
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
         store_id = data['store_id']
         product_name = data['product_name']
         order_qty = data['order_qty']
         urgency = data['urgency']
         
-        # Create order record
-        order_id = f"WO{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
-        # In a real system, you would update the database
-        # For demo, we'll just return success
+        order = ledger.place_order(
+            store_id, product_name, order_qty, urgency, data.get('warehouse_location')
+        )
         
         return jsonify({
             'success': True,
-            'order_id': order_id,
-            'message': f'Warehouse order for {order_qty} units of {product_name} to {store_id} placed successfully'
+            'order_id': order['order_id'],
+            'message': f"Warehouse order for {order['quantity']} units of {product_name} to {store_id} placed successfully"
         })
+    except (KeyError, LedgerError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-        to_store = data['to_store']
+
 @app.route('/api/emergency/dashboard', methods=['GET'])
 def get_emergency_dashboard():
     """Get emergency dashboard data"""
     try:
-        rebalance_suggestions = rebalancer.find_rebalance_opportunities(products_df, distances_df)
-        warehouse_orders = rebalancer.generate_warehouse_orders(products_df, warehouse_df)
-        
-        # Calculate emergency metrics
-        critical_shortages = len(products_df[products_df['current_stock'] <= products_df['min_threshold'] * 0.5])
-        pending_transfers = len(rebalance_suggestions)
-        pending_warehouse_orders = len(warehouse_orders)
-        
-        return jsonify({
-            'critical_shortages': critical_shortages,
-            'pending_transfers': pending_transfers,
-            'pending_warehouse_orders': pending_warehouse_orders,
-            'rebalance_suggestions': rebalance_suggestions[:5],
-            'warehouse_orders': warehouse_orders[:5]
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-        product_name = data['product_name']
-        transfer_qty = data['transfer_qty']
-        
-        # Create transfer record
-        transfer_id = f"T{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
-        # In a real system, you would update the database
-        # For demo, we'll just return success
-        
-        return jsonify({
-            'success': True,
-            'transfer_id': transfer_id,
-            'message': f'Transfer of {transfer_qty} units of {product_name} from {from_store} to {to_store} initiated'
-        })
+        return cached_json('dashboard', build_emergency_dashboard)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+def build_emergency_dashboard():
+    """Emergency metrics with the top suggestions and orders"""
+    rebalance_suggestions = rebalance_opportunities()
+    orders = warehouse_orders()
+    
+    # Calculate emergency metrics
+    critical_shortages = aggregates.network()['critical_stock']
+    pending_transfers = len(rebalance_suggestions)
+    pending_warehouse_orders = len(orders)
+    
+    return {
+        'critical_shortages': critical_shortages,
+        'pending_transfers': pending_transfers,
+        'pending_warehouse_orders': pending_warehouse_orders,
+        'rebalance_suggestions': rebalance_suggestions[:5],
+        'warehouse_orders': orders[:5]
+    }
+
 if __name__ == '__main__':
     # Create data directory if it doesn't exist
-    os.makedirs('data', exist_ok=True)
+    os.makedirs(DATA_DIR, exist_ok=True)
+    # Development server; serve.py runs prefork workers over shared memory
     app.run(debug=True, port=5000)
\ No newline at end of file
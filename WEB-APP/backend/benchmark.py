@@ -0,0 +1,434 @@
+"""Endpoint and model benchmarks at several dataset scales.
+
+    python benchmark.py                              # small tier, checked against the baseline
+    python benchmark.py --tiers small,medium --save-baseline
+
+Each tier runs in its own process, because the app loads its dataset at
+import. The tier's data is generated once into data/bench/<tier> with
+generate_data.py and reused while the tier settings are unchanged. The
+process then times every Flask route through the test client, plus the
+InventoryPredictor and EmergencyRebalancer methods called directly. It
+reports latency percentiles, throughput and peak memory for each.
+
+Results are compared with the stored baseline (benchmarks/baseline.json
+by default, which holds a reference run of the small tier). The run
+exits with status 1 when any case's median or p95 latency, or any memory
+figure, is worse than the baseline by more than the allowed tolerance,
+and also when a tier can't be checked because the baseline is missing or
+was measured on a different dataset. Baselines depend on the machine, so
+save them (--save-baseline) on the machine that runs the comparison.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from generate_data import TIERS, generate
+
+BENCH_CONFIG = {
+    'data_dir': 'data/bench',
+    'baseline': 'benchmarks/baseline.json',
+    'seed': 42,
+    'min_iterations': 3,
+    'max_iterations': 500,
+    'time_budget': 2.0,        # seconds of timed calls per case, once min_iterations have run
+    'tolerance': 0.25,         # allowed relative latency increase
+    'memory_tolerance': 0.10,  # allowed relative memory increase
+    'floor_ms': 2.0            # latency changes smaller than this never count as regressions
+}
+
+
+class Case:
+    """One timed operation; ``call()`` returns an HTTP status checked against ``expect``.
+
+    ``once`` cases have side effects too costly to repeat and are timed
+    from a single traced call, without a warm-up.
+    """
+
+    def __init__(self, name, call, expect=(200,), once=False):
+        self.name = name
+        self.call = call
+        self.expect = expect
+        self.once = once
+
+    def succeeded(self, status):
+        return self.expect is None or status in self.expect
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _percentile(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+
+def measure(case, min_iterations, max_iterations, time_budget):
+    """Latency percentiles (ms), throughput and traced peak allocation of one case"""
+    if case.once:
+        tracemalloc.start()
+        begin = time.perf_counter()
+        status = case.call()
+        elapsed = time.perf_counter() - begin
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return _summary([elapsed], elapsed, int(not case.succeeded(status)), peak)
+
+    case.call()     # warm up lazily built state
+    samples, errors = [], 0
+    started = time.perf_counter()
+    while len(samples) < max_iterations:
+        begin = time.perf_counter()
+        status = case.call()
+        samples.append(time.perf_counter() - begin)
+        if not case.succeeded(status):
+            errors += 1
+        if len(samples) >= min_iterations and time.perf_counter() - started >= time_budget:
+            break
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    case.call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return _summary(samples, elapsed, errors, peak)
+
+
+def _summary(samples, elapsed, errors, peak):
+    return {
+        'iterations': len(samples),
+        'errors': errors,
+        'p50_ms': _percentile(samples, 50),
+        'p95_ms': _percentile(samples, 95),
+        'p99_ms': _percentile(samples, 99),
+        'max_ms': round(max(samples) * 1000, 3),
+        'throughput': round(len(samples) / elapsed, 2),
+        'peak_alloc_mb': round(peak / 1024 / 1024, 3)
+    }
+
+
+def route_cases(app_module):
+    """A request for every route, keyed by ``'METHOD rule'``"""
+    client = app_module.app.test_client()
+    products = app_module.products_df
+    store_id = str(products['store_id'].iloc[0])
+
+    # A well stocked product carried by two stores, moved back and forth one unit at a time
+    stock = products['current_stock'].to_numpy()
+    by_name = products.assign(_stock=stock).sort_values('_stock', ascending=False, kind='stable')
+    pair = by_name.groupby('name', observed=True).head(2).groupby('name', observed=True).filter(lambda g: len(g) == 2)
+    name = pair['name'].iloc[0]
+    donor, receiver = (str(store) for store in pair[pair['name'] == name]['store_id'])
+    directions = itertools.cycle([(donor, receiver), (receiver, donor)])
+
+    # Orders and sales rotate over the products with the most stock so none runs out
+    warehouse = app_module.warehouse_df.sort_values('available_stock', ascending=False, kind='stable')
+    orders = itertools.cycle(list(zip(warehouse['product_name'].astype(str).head(50),
+                                      warehouse['warehouse_location'].astype(str).head(50))))
+    sale_ids = itertools.cycle(products['product_id'].astype(str).to_numpy()[np.argsort(-stock, kind='stable')[:50]])
+
+    def get(url):
+        return lambda: client.get(url).status_code
+
+    def post(url, body):
+        return lambda: client.post(url, json=body() if callable(body) else body).status_code
+
+    def read_all(url):
+        def call():
+            response = client.get(url)
+            response.get_data()
+            return response.status_code
+        return call
+
+    def first_event(url):
+        def call():
+            response = client.get(url)
+            next(iter(response.response))
+            response.close()
+            return response.status_code
+        return call
+
+    def transfer():
+        from_store, to_store = next(directions)
+        return {'from_store': from_store, 'to_store': to_store, 'product_name': name, 'transfer_qty': 1}
+
+    def order():
+        product_name, location = next(orders)
+        return {'store_id': store_id, 'product_name': product_name, 'order_qty': 1,
+                'urgency': 'medium', 'warehouse_location': location}
+
+    job = {}
+
+    def submit_job():
+        response = client.post('/api/jobs/recompute', json={})
+        job['id'] = response.get_json()['id']
+        return response.status_code
+
+    return {
+        'GET /api/stores': Case('GET /api/stores', get('/api/stores')),
+        'GET /api/stores/<store_id>/products': Case('GET /api/stores/<id>/products',
+                                                    get(f'/api/stores/{store_id}/products')),
+        'GET /api/products/bulk': Case('GET /api/products/bulk', read_all('/api/products/bulk')),
+        'GET /api/stores/<store_id>/alerts': Case('GET /api/stores/<id>/alerts', get(f'/api/stores/{store_id}/alerts')),
+        'GET /api/stores/<store_id>/alerts/stream': Case('GET /api/stores/<id>/alerts/stream (first event)',
+                                                         first_event(f'/api/stores/{store_id}/alerts/stream')),
+        'GET /api/alerts/stream': Case('GET /api/alerts/stream (first event)', first_event('/api/alerts/stream')),
+        'GET /api/stores/<store_id>/insights': Case('GET /api/stores/<id>/insights',
+                                                    get(f'/api/stores/{store_id}/insights')),
+        'GET /api/stores/<store_id>/nearby': Case('GET /api/stores/<id>/nearby', get(f'/api/stores/{store_id}/nearby'),
+                                                  expect=(200, 404)),
+        'GET /api/datastore/memory': Case('GET /api/datastore/memory', get('/api/datastore/memory')),
+        'GET /api/forecast/cache': Case('GET /api/forecast/cache', get('/api/forecast/cache')),
+        'GET /api/holidays/impact': Case('GET /api/holidays/impact', get('/api/holidays/impact?days=90')),
+        'POST /api/sales/batch': Case('POST /api/sales/batch', post('/api/sales/batch', lambda: {
+            'sales': [{'product_id': next(sale_ids), 'units_sold': 1}]
+        })),
+        'GET /api/simulation/stockouts': Case('GET /api/simulation/stockouts (1 store)',
+                                              get(f'/api/simulation/stockouts?stores={store_id}&seed=1')),
+        'GET /api/simulation/network': Case('GET /api/simulation/network', get('/api/simulation/network'),
+                                            expect=(200, 404)),
+        'GET /api/rebalance/suggestions': Case('GET /api/rebalance/suggestions', get('/api/rebalance/suggestions')),
+        'GET /api/cache/responses': Case('GET /api/cache/responses', get('/api/cache/responses')),
+        'POST /api/routes/plan': Case('POST /api/routes/plan', post('/api/routes/plan', {})),
+        'GET /api/analytics/overview': Case('GET /api/analytics/overview', get('/api/analytics/overview')),
+        'POST /api/rebalance/execute': Case('POST /api/rebalance/execute', post('/api/rebalance/execute', transfer)),
+        'GET /api/warehouse/orders': Case('GET /api/warehouse/orders', get('/api/warehouse/orders')),
+        'POST /api/warehouse/place-order': Case('POST /api/warehouse/place-order',
+                                                post('/api/warehouse/place-order', order)),
+        'GET /api/emergency/dashboard': Case('GET /api/emergency/dashboard', get('/api/emergency/dashboard')),
+        'GET /metrics': Case('GET /metrics', get('/metrics')),
+        'GET /api/profiles': Case('GET /api/profiles', get('/api/profiles')),
+        'GET /api/profiles/<profile_id>': Case('GET /api/profiles/<id>', lambda: client.get(
+            f"/api/profiles/{client.get('/api/stores?profile=1').headers['X-Profile-Id']}"
+        ).status_code),
+        # Jobs last: a submitted recompute keeps the pool busy in the background
+        'GET /api/jobs': Case('GET /api/jobs', get('/api/jobs')),
+        'POST /api/jobs/recompute': Case('POST /api/jobs/recompute', submit_job, expect=(202,), once=True),
+        'POST /api/jobs/simulation': Case('POST /api/jobs/simulation', post('/api/jobs/simulation', {'seed': 1}),
+                                          expect=(202,), once=True),
+        'GET /api/jobs/<job_id>': Case('GET /api/jobs/<id>', lambda: client.get(f"/api/jobs/{job['id']}").status_code),
+        'DELETE /api/jobs/<job_id>': Case('DELETE /api/jobs/<id>',
+                                          lambda: client.delete(f"/api/jobs/{job['id']}").status_code,
+                                          expect=(200, 409))
+    }
+
+
+def model_cases(app_module):
+    """The predictor and rebalancer methods, called directly"""
+    predictor, rebalancer = app_module.predictor, app_module.rebalancer
+    products, inventory = app_module.products_df, app_module.inventory
+    product_ids = products['product_id'].astype(str).to_numpy()
+    stock = products['current_stock'].to_numpy()
+    impacts = app_module.get_category_holiday_impacts(products['category'])
+    sales_matrix, lengths = inventory.sales_matrix(product_ids)
+    busiest = int(np.argmax(lengths))
+
+    def predict_uncached():
+        predictor.cache.invalidate()
+        predictor.predict_shortage_cached(product_ids, stock, impacts)
+
+    calls = [
+        ('InventoryPredictor.predict_shortage (1 product)',
+         lambda: predictor.predict_shortage(list(sales_matrix[busiest, :lengths[busiest]]), stock[busiest])),
+        ('InventoryPredictor.predict_shortage_batch (all products)',
+         lambda: predictor.predict_shortage_batch(sales_matrix, lengths, stock)),
+        ('InventoryPredictor.predict_shortage_cached (cold, all products)', predict_uncached),
+        ('InventoryPredictor.predict_shortage_cached (warm, all products)',
+         lambda: predictor.predict_shortage_cached(product_ids, stock, impacts)),
+        ('EmergencyRebalancer.find_rebalance_opportunities (optimal)',
+         lambda: rebalancer.find_rebalance_opportunities(products, app_module.distances_df, 'optimal')),
+        ('EmergencyRebalancer.find_rebalance_opportunities (greedy)',
+         lambda: rebalancer.find_rebalance_opportunities(products, app_module.distances_df, 'greedy')),
+        ('EmergencyRebalancer.generate_warehouse_orders',
+         lambda: rebalancer.generate_warehouse_orders(products, app_module.warehouse_df))
+    ]
+    return [Case(name, call, expect=None) for name, call in calls]
+
+
+def run_tier(data_dir, options):
+    """Load the app on ``data_dir`` and measure every case (runs in the tier's process)"""
+    shutil.rmtree(os.path.join(data_dir, 'journal'), ignore_errors=True)   # start from the generated state
+    os.environ['INVENTORY_DATA_DIR'] = data_dir
+    began = time.perf_counter()
+    import app as app_module
+    load_seconds = time.perf_counter() - began
+    rss_after_load = _peak_rss_mb()
+
+    routes = route_cases(app_module)
+    rules = sorted(f'{method} {rule.rule}' for rule in app_module.app.url_map.iter_rules()
+                   if rule.endpoint != 'static' for method in rule.methods - {'HEAD', 'OPTIONS'})
+    missing = [rule for rule in rules if rule not in routes]
+    if missing:
+        raise SystemExit(f"No benchmark request for routes: {', '.join(missing)}")
+
+    results = {}
+    for case in model_cases(app_module) + list(routes.values()):
+        results[case.name] = measure(case, options['min_iterations'], options['max_iterations'],
+                                     options['time_budget'])
+        print(f"  {case.name}: p50 {results[case.name]['p50_ms']} ms", file=sys.stderr)
+
+    # Let a submitted recompute finish before the process exits
+    while any(job.status in ('queued', 'running') for job in app_module.jobs.list()):
+        time.sleep(0.1)
+    app_module.ledger.journal.close()
+    return {
+        'load_seconds': round(load_seconds, 3),
+        'rss_after_load_mb': round(rss_after_load, 1),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'cases': results
+    }
+
+
+def prepare_dataset(tier, seed):
+    """Generate the tier's dataset unless an identical one is already on disk"""
+    data_dir = os.path.join(BENCH_CONFIG['data_dir'], tier)
+    settings = dict(TIERS[tier], seed=seed)
+    manifest = os.path.join(data_dir, 'dataset.json')
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            if json.load(f) == settings:
+                return data_dir, settings
+    print(f"Generating {tier} dataset into {data_dir}")
+    shutil.rmtree(data_dir, ignore_errors=True)
+    generate(data_dir, log=lambda message: print(message), **settings)
+    with open(manifest, 'w') as f:
+        json.dump(settings, f)
+    return data_dir, settings
+
+
+def compare(results, baseline, tolerance, memory_tolerance, floor_ms):
+    """Human-readable regressions of ``results`` against ``baseline``, including tiers it can't check"""
+    regressions = []
+    for tier, current in results['tiers'].items():
+        reference = baseline.get('tiers', {}).get(tier)
+        if reference is None:
+            regressions.append(f"{tier}: no baseline; run with --save-baseline to create one")
+            continue
+        if reference.get('dataset') != current['dataset']:
+            regressions.append(f"{tier}: baseline was measured on a different dataset; save a new one")
+            continue
+        if current['peak_rss_mb'] > reference['peak_rss_mb'] * (1 + memory_tolerance):
+            regressions.append(f"{tier}: peak RSS {reference['peak_rss_mb']} -> {current['peak_rss_mb']} MB")
+        for name, now in current['cases'].items():
+            before = reference['cases'].get(name)
+            if before is None:
+                continue
+            for metric in ('p50_ms', 'p95_ms'):
+                if now[metric] > before[metric] * (1 + tolerance) + floor_ms:
+                    regressions.append(f"{tier}: {name} {metric} {before[metric]} -> {now[metric]}")
+            if now['peak_alloc_mb'] > before['peak_alloc_mb'] * (1 + memory_tolerance) + 1.0:
+                regressions.append(f"{tier}: {name} peak_alloc_mb {before['peak_alloc_mb']} -> {now['peak_alloc_mb']}")
+            if now['errors'] > before['errors']:
+                regressions.append(f"{tier}: {name} errors {before['errors']} -> {now['errors']}")
+    return regressions
+
+
+def report(results):
+    for tier, result in results['tiers'].items():
+        print(f"\n{tier} {result['dataset']}: loaded in {result['load_seconds']}s, "
+              f"RSS {result['rss_after_load_mb']} MB after load, {result['peak_rss_mb']} MB peak")
+        print(f"  {'case':<72} {'p50':>9} {'p95':>9} {'p99':>9} {'ops/s':>9} {'alloc MB':>9} {'err':>4}")
+        for name, case in result['cases'].items():
+            print(f"  {name:<72} {case['p50_ms']:>9} {case['p95_ms']:>9} {case['p99_ms']:>9} "
+                  f"{case['throughput']:>9} {case['peak_alloc_mb']:>9} {case['errors']:>4}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the API and models across dataset sizes')
+    parser.add_argument('--tiers', default='small', help=f"comma-separated, from {', '.join(TIERS)}")
+    parser.add_argument('--baseline', default=BENCH_CONFIG['baseline'])
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--output', help='also write the results as JSON here')
+    parser.add_argument('--seed', type=int, default=BENCH_CONFIG['seed'])
+    parser.add_argument('--min-iterations', type=int, default=BENCH_CONFIG['min_iterations'])
+    parser.add_argument('--max-iterations', type=int, default=BENCH_CONFIG['max_iterations'])
+    parser.add_argument('--time-budget', type=float, default=BENCH_CONFIG['time_budget'])
+    parser.add_argument('--tolerance', type=float, default=BENCH_CONFIG['tolerance'])
+    parser.add_argument('--memory-tolerance', type=float, default=BENCH_CONFIG['memory_tolerance'])
+    parser.add_argument('--floor-ms', type=float, default=BENCH_CONFIG['floor_ms'])
+    parser.add_argument('--run-tier', help=argparse.SUPPRESS)     # internal: measure one loaded tier
+    parser.add_argument('--data-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    options = {'min_iterations': args.min_iterations, 'max_iterations': args.max_iterations,
+               'time_budget': args.time_budget}
+
+    if args.run_tier:
+        with open(args.output, 'w') as f:
+            json.dump(run_tier(args.data_dir, options), f)
+        return 0
+
+    tiers = [tier.strip() for tier in args.tiers.split(',') if tier.strip()]
+    unknown = [tier for tier in tiers if tier not in TIERS]
+    if unknown:
+        parser.error(f"Unknown tiers: {', '.join(unknown)}")
+
+    results = {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'tiers': {}
+    }
+    for tier in tiers:
+        data_dir, settings = prepare_dataset(tier, args.seed)
+        print(f"Benchmarking {tier}")
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            output = f.name
+        try:
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--run-tier', tier, '--data-dir', data_dir,
+                            '--output', output, '--min-iterations', str(args.min_iterations),
+                            '--max-iterations', str(args.max_iterations), '--time-budget', str(args.time_budget)],
+                           check=True)
+            with open(output) as f:
+                results['tiers'][tier] = dict(json.load(f), dataset=settings)
+        finally:
+            os.remove(output)
+    report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {'tiers': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline['tiers'].update(results['tiers'])
+        baseline.update({key: results[key] for key in ('created_at', 'python', 'machine', 'cpus')})
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    else:
+        print(f"\nNo baseline at {args.baseline}")
+    regressions = compare(results, baseline, args.tolerance, args.memory_tolerance, args.floor_ms)
+    if regressions:
+        print('\nRegressions:')
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print('\nNo regressions against the baseline')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
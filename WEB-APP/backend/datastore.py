@@ -0,0 +1,258 @@
+import hashlib
+import inspect
+
+import numpy as np
+import pandas as pd
+
+SALES_COLUMNS = ['product_id', 'store_id', 'date', 'units_sold', 'revenue']
+
+# Sort order applied to each table when it is loaded
+SORT_KEYS = {
+    'products': ['store_id'],
+    'sales_history': ['product_id', 'date'],
+}
+
+
+def compact_frame(df):
+    """Dictionary-encode text columns and narrow integer columns.
+
+    ID and product name columns are always encoded since the indexes work on
+    their codes; other text only when values repeat enough to save memory.
+    Integers are kept at 32 bits or wider so stock updates can't overflow,
+    and floats are left alone since they are served to clients as-is.
+    """
+    columns = {}
+    for name, column in df.items():
+        if column.dtype == object:
+            if name.endswith('_id') or name == 'name' or column.nunique() * 2 <= len(column):
+                column = column.astype('category')
+        elif pd.api.types.is_integer_dtype(column.dtype):
+            info = np.iinfo(np.int32)
+            if column.empty or (column.min() >= info.min and column.max() <= info.max):
+                column = column.astype(np.int32)
+        columns[name] = column
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(df)))
+
+
+def prepare_table(name, df):
+    """Compact a freshly parsed table and apply its sort order"""
+    df = compact_frame(df)
+    if name in SORT_KEYS and not df.empty:
+        df = df.sort_values(SORT_KEYS[name], kind='stable', ignore_index=True)
+    return df
+
+
+def preparation_version():
+    """Fingerprint of how tables are prepared, for keying cached copies
+
+    Covers the code of ``compact_frame`` and ``prepare_table``, the sort
+    keys and the pandas and numpy versions, so a change to any of them
+    rebuilds tables cached by the old code.
+    """
+    parts = [inspect.getsource(compact_frame), inspect.getsource(prepare_table),
+             repr(sorted(SORT_KEYS.items())), pd.__version__, np.__version__]
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()[:16]
+
+
+def _group_offsets(codes, n_groups):
+    """Start/end offsets of each code in an array sorted by code.
+
+    One extra empty group is appended so a lookup miss (-1) resolves to an
+    empty slice.
+    """
+    ends = np.searchsorted(codes, np.arange(n_groups), side='right')
+    starts = np.concatenate([[0], ends[:-1]])
+    return np.append(starts, 0), np.append(ends, 0)
+
+
+class InventoryStore:
+    """In-memory, indexed copy of the CSV tables.
+
+    Tables are compacted and pre-sorted once at load time (see
+    ``prepare_table``), and offset indexes by store, product and product
+    name turn the per-request filters into positional slices.
+    """
+
+    def __init__(self, tables, daily_sales=None):
+        self.tables = dict(tables)
+        self.daily_sales = daily_sales
+        self._build_indexes()
+
+    @classmethod
+    def load(cls, csv_config, loader, cache=None, daily_sales=None):
+        """Load every configured table through ``loader(path)``
+
+        With a ``TableCache``, tables whose CSV hasn't changed are mapped
+        from their binary copy and only changed ones are parsed again.
+        When a streamed ``DailySalesSeries`` is given, the raw sales table
+        is not loaded at all and forecasts read the daily series instead.
+        """
+        tables = {}
+        for name, path in csv_config.items():
+            if name == 'sales_history' and daily_sales is not None:
+                tables[name] = prepare_table(name, pd.DataFrame(columns=SALES_COLUMNS))
+                continue
+            df = cache.read(name, path) if cache is not None else None
+            if df is None:
+                df = prepare_table(name, loader(path))
+                if cache is not None:
+                    cache.write(name, path, df)
+            tables[name] = df
+        return cls(tables, daily_sales)
+
+    @property
+    def products(self):
+        return self.tables['products']
+
+    @property
+    def sales(self):
+        return self.tables['sales_history']
+
+    def _build_indexes(self):
+        products = self.products
+        store_codes = products['store_id'].cat.codes.to_numpy()
+        self._store_index = pd.Index(products['store_id'].cat.categories)
+        self._store_starts, self._store_ends = _group_offsets(store_codes, len(self._store_index))
+
+        self._product_index = pd.Index(products['product_id'].astype(str))
+        self._store_codes = store_codes
+        # Hash lookups for the single-key calls made on every write
+        self._product_pos = {product_id: i for i, product_id in enumerate(self._product_index)}
+        self._store_pos = {store_id: i for i, store_id in enumerate(self._store_index)}
+        # Stock updates write through this view of the column
+        self._current_stock = products['current_stock'].to_numpy()
+
+        name_codes = products['name'].cat.codes.to_numpy()
+        self._name_index = pd.Index(products['name'].cat.categories)
+        self._name_pos = {name: i for i, name in enumerate(self._name_index)}
+        self._name_order = np.argsort(name_codes, kind='stable')
+        self._name_starts, self._name_ends = _group_offsets(
+            name_codes[self._name_order], len(self._name_index)
+        )
+
+        sales = self.sales
+        self._sales_index = pd.Index(sales['product_id'].cat.categories)
+        self._sales_starts, self._sales_ends = _group_offsets(
+            sales['product_id'].cat.codes.to_numpy(), len(self._sales_index)
+        )
+        self._units_sold = sales['units_sold'].to_numpy(dtype=float)
+
+    def relocate_columns(self, name, columns, allocate):
+        """Move columns of a table into buffers returned by ``allocate(array)``
+
+        Used to place columns in shared memory; the table is rebuilt around
+        the new buffers without copying the other columns.
+        """
+        df = self.tables[name]
+        data = {
+            column: allocate(df[column].to_numpy()) if column in columns else df[column]
+            for column in df.columns
+        }
+        self.tables[name] = pd.DataFrame(data, index=df.index, copy=False)
+        self._build_indexes()
+
+    def store_slice(self, store_id):
+        """Row range of a store's products"""
+        pos = self._store_index.get_indexer([store_id])[0]
+        return self._store_starts[pos], self._store_ends[pos]
+
+    def store_products(self, store_id):
+        """A store's products without scanning the table"""
+        start, end = self.store_slice(store_id)
+        return self.products.iloc[start:end]
+
+    def store_bounds(self, store_ids):
+        """Row ranges for many stores at once"""
+        pos = self._store_index.get_indexer(store_ids)
+        return self._store_starts[pos], self._store_ends[pos]
+
+    def product_rows(self, product_ids):
+        """Row positions of products, -1 for unknown IDs"""
+        return self._product_index.get_indexer(product_ids)
+
+    def product_row(self, product_id):
+        """Row position of one product, -1 if unknown"""
+        return self._product_pos.get(product_id, -1)
+
+    def name_rows(self, product_name):
+        """Row positions of every store's product with this name"""
+        pos = self._name_pos.get(product_name, -1)
+        return self._name_order[self._name_starts[pos]:self._name_ends[pos]]
+
+    def product_sales(self, product_id):
+        """A product's date-ordered sales rows"""
+        pos = self._sales_index.get_indexer([product_id])[0]
+        return self.sales.iloc[self._sales_starts[pos]:self._sales_ends[pos]]
+
+    def sales_matrix(self, product_ids):
+        """Left-aligned units_sold history per product, like ``build_sales_matrix``"""
+        if self.daily_sales is not None:
+            return self.daily_sales.matrix(product_ids)
+        pos = self._sales_index.get_indexer(product_ids)
+        starts, lengths = self._sales_starts[pos], self._sales_ends[pos] - self._sales_starts[pos]
+
+        rows = np.repeat(np.arange(len(pos)), lengths)
+        cols = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        matrix = np.zeros((len(pos), int(lengths.max(initial=0))))
+        matrix[rows, cols] = self._units_sold[np.repeat(starts, lengths) + cols]
+        return matrix, lengths
+
+    def last_sale_days(self, product_ids):
+        """Day number (days since 1970-01-01) of the last day in each ``sales_matrix`` row, -1 if empty"""
+        if self.daily_sales is not None:
+            return self.daily_sales.last_days(product_ids)
+        pos = self._sales_index.get_indexer(product_ids)
+        starts, ends = self._sales_starts[pos], self._sales_ends[pos]
+        days = np.full(len(pos), -1, dtype=np.int64)
+        dates = self.sales['date'].to_numpy()[ends[ends > starts] - 1]
+        days[ends > starts] = np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+        return days
+
+    def find_product(self, store_id, product_name):
+        """Row of a store's copy of a product, -1 if the store doesn't carry it"""
+        rows = self.name_rows(product_name)
+        matches = rows[self._store_codes[rows] == self._store_pos.get(store_id, -2)]
+        return int(matches[0]) if len(matches) else -1
+
+    def product_ids_at(self, rows):
+        return list(self._product_index[rows])
+
+    def stock_at(self, rows):
+        return [int(stock) for stock in self._current_stock[rows]]
+
+    def set_stock(self, rows, values):
+        """Overwrite current stock of products in place"""
+        self._current_stock[rows] = values
+
+    def find_warehouse_stock(self, product_name, warehouse_location=None):
+        """Rows of warehouse_inventory holding a product, optionally at one location"""
+        warehouse = self.tables['warehouse_inventory']
+        matches = warehouse['product_name'] == product_name
+        if warehouse_location is not None:
+            matches &= warehouse['warehouse_location'] == warehouse_location
+        return np.flatnonzero(matches.to_numpy())
+
+    def warehouse_available(self, rows):
+        warehouse = self.tables['warehouse_inventory']
+        return [int(stock) for stock in warehouse['available_stock'].to_numpy()[rows]]
+
+    def warehouse_location_at(self, row):
+        return str(self.tables['warehouse_inventory']['warehouse_location'].iloc[row])
+
+    def set_warehouse_available(self, rows, value):
+        warehouse = self.tables['warehouse_inventory']
+        warehouse.iloc[rows, warehouse.columns.get_loc('available_stock')] = value
+
+    def memory_usage(self):
+        """Bytes held per table, plus the lookup indexes"""
+        usage = {name: int(df.memory_usage(deep=True).sum()) for name, df in self.tables.items()}
+        arrays = [
+            self._store_codes, self._store_starts, self._store_ends, self._name_order, self._name_starts,
+            self._name_ends, self._sales_starts, self._sales_ends, self._units_sold
+        ]
+        indexes = [self._store_index, self._product_index, self._name_index, self._sales_index]
+        usage['indexes'] = int(sum(a.nbytes for a in arrays) + sum(i.memory_usage(deep=True) for i in indexes))
+        if self.daily_sales is not None:
+            usage['daily_sales'] = self.daily_sales.memory_usage()
+        usage['total'] = sum(usage.values())
+        return usage
@@ -0,0 +1,504 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Forecast settings shared with InventoryPredictor.predict_shortage
+FORECAST_HORIZON = 30   # days predicted ahead
+MIN_HISTORY = 5         # fewer observations than this -> no forecast
+MIN_LEAD_DAYS = 2       # a predicted stockout is never sooner than this
+OUT_OF_STOCK_DAYS = 1   # products already at zero stock
+STREAM_DRAWS = 1 << 18  # normal draws per random stream in simulate_stockouts, shared by a run of rows
+
+
+def build_sales_matrix(sales_df, product_ids):
+    """Lay out each product's date-ordered units_sold as one left-aligned row.
+
+    Returns ``(matrix, lengths)`` where row ``i`` holds the history of
+    ``product_ids[i]`` in its first ``lengths[i]`` columns, zero padded.
+    """
+    product_index = pd.Index(product_ids)
+    rows = sales_df[sales_df['product_id'].isin(product_index)]
+    rows = rows.sort_values(['product_id', 'date'], kind='stable')
+
+    row_idx = product_index.get_indexer(rows['product_id'])
+    col_idx = rows.groupby('product_id', sort=False).cumcount().to_numpy()
+    lengths = np.bincount(row_idx, minlength=len(product_index))
+
+    matrix = np.zeros((len(product_index), int(lengths.max(initial=0))))
+    matrix[row_idx, col_idx] = rows['units_sold'].to_numpy(dtype=float)
+    return matrix, lengths
+
+
+def fit_trends(sales_matrix, lengths):
+    """Least-squares line of units sold against day index for every row.
+
+    Solves the normal equations in closed form, so a whole batch costs a
+    couple of matrix-vector products instead of one model fit per product.
+    Returns ``(intercept, slope, totals)``.
+    """
+    sales_matrix = np.asarray(sales_matrix, dtype=float)
+    n = np.asarray(lengths, dtype=float)
+    days = np.arange(sales_matrix.shape[1], dtype=float)
+
+    totals = sales_matrix.sum(axis=1)
+    x_mean = (n - 1) / 2
+    y_mean = np.divide(totals, n, out=np.zeros_like(totals), where=n > 0)
+    sxy = sales_matrix @ days - x_mean * totals
+    sxx = n * (n * n - 1) / 12
+
+    slope = np.divide(sxy, sxx, out=np.zeros_like(sxy), where=sxx > 0)
+    intercept = y_mean - slope * x_mean
+    return intercept, slope, totals
+
+
+def shortage_days(intercept, slope, lengths, totals, current_stock,
+                  horizon=FORECAST_HORIZON, chunk_size=65536):
+    """Days until cumulative predicted sales reach current stock.
+
+    Mirrors ``InventoryPredictor.predict_shortage``: zero stock is one day
+    out, sparse or all-zero histories and stock lasting the full horizon are
+    ``horizon`` days out, and any crossing is at least ``MIN_LEAD_DAYS``.
+    """
+    intercept = np.asarray(intercept, dtype=float)
+    slope = np.asarray(slope, dtype=float)
+    lengths = np.asarray(lengths)
+    totals = np.asarray(totals, dtype=float)
+    current_stock = np.asarray(current_stock, dtype=float)
+
+    days = np.full(len(current_stock), horizon, dtype=np.int64)
+    steps = np.arange(horizon)
+
+    # Rows are processed in chunks to keep the (rows x horizon) block small
+    for start in range(0, len(days), chunk_size):
+        end = min(start + chunk_size, len(days))
+        future_x = lengths[start:end, None] + steps
+        predicted = intercept[start:end, None] + slope[start:end, None] * future_x
+        cumulative = np.maximum(predicted, 0).cumsum(axis=1)
+
+        crossed = cumulative >= current_stock[start:end, None]
+        has_crossing = crossed.any(axis=1)
+        first = crossed.argmax(axis=1) + 1
+        days[start:end] = np.where(has_crossing, np.maximum(first, MIN_LEAD_DAYS), horizon)
+
+    days[(lengths < MIN_HISTORY) | (totals == 0)] = horizon
+    days[current_stock <= 0] = OUT_OF_STOCK_DAYS
+    return days
+
+
+def predict_shortage_days(sales_matrix, lengths, current_stock, horizon=FORECAST_HORIZON):
+    """Batch counterpart of ``predict_shortage`` returning days ahead per row"""
+    intercept, slope, totals = fit_trends(sales_matrix, lengths)
+    return shortage_days(intercept, slope, lengths, totals, current_stock, horizon)
+
+
+def simulate_stockouts(intercept, slope, lengths, totals, std, current_stock, holiday_impact=1.0,
+                       holiday_days=None, horizon=FORECAST_HORIZON, paths=1000,
+                       service_levels=(0.5, 0.9, 0.95, 0.99), seed=None, block_bytes=16 << 20, streams=None):
+    """Monte Carlo stockout probabilities over the next ``horizon`` days.
+
+    Each path's daily demand is the fitted trend plus normal noise with
+    the row's residual ``std``, floored at zero; on days marked in
+    ``holiday_days`` (rows x horizon booleans) both are scaled by the
+    row's ``holiday_impact``. Rows are simulated in blocks of
+    ``(rows, horizon, paths)`` float32 arrays of at most ``block_bytes``,
+    so memory stays flat however many rows are passed. A row's shocks are
+    its slice of a random stream spawned from ``seed`` for the run of
+    ``STREAM_DRAWS`` worth of consecutive ``streams`` keys (default: row
+    positions) it belongs to, so they are drawn in bulk yet a row's result
+    doesn't depend on which other rows are simulated with it or how they
+    are split into blocks or shards.
+    Half of each row's paths mirror the other half's shocks (antithetic
+    variates), which halves the random draws and, demand being monotone
+    in the shocks, lowers the variance of the estimates.
+
+    Returns ``(curve, stock_needed)``: ``curve[i, d]`` is the share of paths
+    whose demand used up ``current_stock[i]`` by the end of day ``d + 1``,
+    and ``stock_needed[i, j]`` the stock that lasts the whole horizon in a
+    ``service_levels[j]`` share of paths. Like ``shortage_days``, sparse or
+    all-zero histories have no demand.
+    """
+    lengths = np.asarray(lengths)
+    active = (lengths >= MIN_HISTORY) & (np.asarray(totals) > 0)
+    intercept = np.where(active, intercept, 0.0)
+    slope = np.where(active, slope, 0.0)
+    std = np.where(active, std, 0.0).astype(np.float32)
+    current_stock = np.asarray(current_stock, dtype=np.float32)
+    impact = np.broadcast_to(np.asarray(holiday_impact, dtype=np.float32), current_stock.shape)
+
+    n = len(current_stock)
+    levels = np.asarray(service_levels, dtype=float)
+    # Order statistic of horizon demand that a ``level`` share of paths stays within
+    ranks = np.clip(np.ceil(levels * paths).astype(np.int64) - 1, 0, paths - 1)
+    curve = np.zeros((n, horizon), dtype=np.float32)
+    stock_needed = np.zeros((n, len(levels)), dtype=np.float32)
+
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    streams = np.arange(n) if streams is None else np.asarray(streams)
+    steps = np.arange(horizon)
+    drawn = (paths + 1) // 2
+    stream_rows = max(1, STREAM_DRAWS // (horizon * drawn))
+    block = int(max(1, min(n, block_bytes // (horizon * paths * 5))))   # float32 demand + bool crossings
+    if block > stream_rows:
+        block -= block % stream_rows    # blocks of positional keys then cover whole streams
+    demand_buffer = np.empty((block, horizon, paths), dtype=np.float32)
+    crossed_buffer = np.empty((block, horizon, paths), dtype=bool)
+    shock_buffer = np.empty((stream_rows, horizon, drawn), dtype=np.float32)
+    shock_stream = None     # the stream in shock_buffer
+
+    for start in range(0, n, block):
+        end = min(start + block, n)
+        rows = slice(start, end)
+        mean = np.maximum(intercept[rows, None] + slope[rows, None] * (lengths[rows, None] + steps), 0)
+        mean = mean.astype(np.float32)
+        scale = np.repeat(std[rows, None], horizon, axis=1)
+        if holiday_days is not None:
+            lift = np.where(holiday_days[rows], impact[rows, None], np.float32(1))
+            mean *= lift
+            scale *= lift
+
+        demand = demand_buffer[:end - start]
+        crossed = crossed_buffer[:end - start]
+        keys = streams[rows]
+        stream_ids = keys // stream_rows
+        for stream_id in np.unique(stream_ids):
+            members = stream_ids == stream_id
+            if not std[rows][members].any():
+                demand[members, :, :drawn] = 0    # no noise to draw
+                continue
+            if stream_id != shock_stream:
+                stream = np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (int(stream_id),))
+                np.random.Generator(np.random.PCG64(stream)).standard_normal(dtype=np.float32, out=shock_buffer)
+                shock_stream = stream_id
+            demand[members, :, :drawn] = shock_buffer[keys[members] % stream_rows]
+        np.negative(demand[:, :, :paths - drawn], out=demand[:, :, drawn:])
+        demand *= scale[:, :, None]
+        demand += mean[:, :, None]
+        np.maximum(demand, 0, out=demand)
+        # Running totals day by day, which numpy does much faster than cumsum over a short axis
+        for day in range(1, horizon):
+            np.add(demand[:, day], demand[:, day - 1], out=demand[:, day])
+
+        np.greater_equal(demand, current_stock[rows, None, None], out=crossed)
+        curve[rows] = crossed.sum(axis=2, dtype=np.int32) / np.float32(paths)
+        stock_needed[rows] = np.partition(demand[:, -1], ranks, axis=1)[:, ranks]
+
+    return curve, stock_needed
+
+
+def covered_days(curve, service_levels):
+    """Days each row stays in stock with at least each service level's probability"""
+    risks = 1 - np.asarray(service_levels, dtype=float) + 1e-6   # curves are float32 shares of paths
+    # Curves only rise, so the days at or under a risk are the days before it is first exceeded
+    return (curve[:, None, :] <= risks[None, :, None]).sum(axis=2)
+
+
+class ForecastCache:
+    """Bounded LRU cache of forecast results (days until stockout).
+
+    An entry is only valid for the sales-history version, current stock and
+    holiday impact it was computed with. Days are cached rather than dates so
+    entries stay correct as the clock moves on. Entries are slots of arrays
+    indexed by product position, so a whole batch is checked with a few
+    vectorized comparisons.
+    """
+
+    def __init__(self, product_ids, maxsize=100000):
+        self.product_index = pd.Index(product_ids)
+        self.maxsize = maxsize
+        # One extra slot, never filled, that unknown products (-1) resolve to
+        size = len(self.product_index) + 1
+        self._days = np.full(size, -1, dtype=np.int64)     # -1 for an empty slot
+        self._stock = np.zeros(size)
+        self._impact = np.zeros(size)
+        self._versions = np.zeros(size, dtype=np.int64)
+        self._used = np.zeros(size, dtype=np.int64)        # clock of the last hit or store
+        self._clock = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def positions(self, product_ids):
+        return self.product_index.get_indexer(np.asarray(product_ids))
+
+    def lookup(self, product_ids, current_stock, holiday_impact):
+        """Cached days for each product, or -1 where a recompute is needed"""
+        pos = self.positions(product_ids)
+        with self._lock:
+            valid = ((self._days[pos] >= 0) & (self._stock[pos] == current_stock)
+                     & (self._impact[pos] == holiday_impact))
+            days = np.where(valid, self._days[pos], -1)
+            self._clock += 1
+            self._used[pos[valid]] = self._clock
+            hit_count = int(valid.sum())
+            self.hits += hit_count
+            self.misses += len(days) - hit_count
+        return days
+
+    def store(self, product_ids, current_stock, holiday_impact, days, versions=None):
+        """Remember freshly computed forecasts
+
+        ``versions`` are the sales-history versions the forecasts were
+        computed from, when that was before now (see ``versions``);
+        forecasts of products that have had new sales since are skipped.
+        """
+        pos = self.positions(product_ids)
+        keep = pos >= 0
+        with self._lock:
+            if versions is not None:
+                keep &= self._versions[pos] == np.asarray(versions)
+            rows = np.flatnonzero(keep)
+            pos = pos[rows]
+            self._size += int((self._days[np.unique(pos)] < 0).sum())
+            self._days[pos] = np.asarray(days)[rows]
+            self._stock[pos] = np.broadcast_to(current_stock, keep.shape)[rows]
+            self._impact[pos] = np.broadcast_to(np.asarray(holiday_impact, dtype=float), keep.shape)[rows]
+            self._clock += 1
+            self._used[pos] = self._clock
+            if self._size > self.maxsize:
+                self._evict(self._size - self.maxsize)
+
+    def _evict(self, count):
+        filled = np.flatnonzero(self._days >= 0)
+        oldest = filled[np.argpartition(self._used[filled], count - 1)[:count]]
+        self._days[oldest] = -1
+        self._size -= count
+        self.evictions += count
+
+    def _drop(self, pos):
+        pos = np.unique(pos[pos >= 0])
+        self._size -= int((self._days[pos] >= 0).sum())
+        self._days[pos] = -1
+        return pos
+
+    def versions(self, product_ids):
+        """Current sales-history versions, to snapshot before a slow recompute"""
+        pos = self.positions(product_ids)
+        with self._lock:
+            return self._versions[pos]
+
+    def sales_changed(self, product_ids):
+        """Bump the sales-history version of products that got new sales"""
+        pos = self.positions(list(product_ids))
+        with self._lock:
+            self._versions[self._drop(pos)] += 1
+
+    def invalidate(self, product_ids=None):
+        """Drop cached forecasts for some products, or all of them"""
+        with self._lock:
+            if product_ids is None:
+                self._days[:] = -1
+                self._size = 0
+                self._versions += 1    # forecasts being computed from older data are not stored
+                return
+            self._drop(self.positions(list(product_ids)))
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': self._size,
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+class IncrementalForecaster:
+    """Running least-squares sales trend per product.
+
+    Keeps the sufficient statistics of each product's regression (weight,
+    sums of x, y, x^2, xy and y^2 over day index x and units sold y), so a new
+    day of sales updates the trend in constant time instead of refitting the
+    whole history. With ``decay < 1`` older days are exponentially
+    down-weighted; ``decay == 1`` gives exactly the batch regression. The
+    date and units of each product's last day are kept too, so sales land
+    on the right day however often they are posted.
+    """
+
+    STATE = ('count', 'total', 'weight', 'sum_x', 'sum_y', 'sum_xx', 'sum_xy', 'sum_yy', 'last_day', 'last_sales')
+
+    def __init__(self, product_ids, decay=1.0):
+        self.product_index = pd.Index(product_ids)
+        self.decay = decay
+        # One extra all-zero row that unknown products (-1) resolve to
+        size = len(self.product_index) + 1
+        self.count = np.zeros(size, dtype=np.int64)
+        self.total = np.zeros(size)
+        self.weight = np.zeros(size)
+        self.sum_x = np.zeros(size)
+        self.sum_y = np.zeros(size)
+        self.sum_xx = np.zeros(size)
+        self.sum_xy = np.zeros(size)
+        self.sum_yy = np.zeros(size)
+        self.last_day = np.full(size, -1, dtype=np.int64)   # days since 1970-01-01, -1 if unknown
+        self.last_sales = np.zeros(size)
+        self._observed = np.zeros(size, dtype=bool)   # changed by observe since load
+        self._lock = threading.Lock()
+
+    def relocate_state(self, allocate):
+        """Move the running sums into buffers returned by ``allocate(array)``"""
+        with self._lock:
+            for name in self.STATE:
+                setattr(self, name, allocate(getattr(self, name)))
+
+    def load_history(self, load_sales, last_days=None, chunk_size=50000):
+        """Initialise every product from ``load_sales(product_ids) -> (matrix, lengths)``
+
+        ``last_days(product_ids)`` gives the day number each history ends
+        on. Without it, the next sales observed for a product start a new
+        day whatever their date.
+        """
+        for start in range(0, len(self.product_index), chunk_size):
+            end = min(start + chunk_size, len(self.product_index))
+            matrix, lengths = load_sales(self.product_index[start:end])
+            self._fit(slice(start, end), np.asarray(matrix, dtype=float), np.asarray(lengths))
+            if last_days is not None:
+                self.last_day[start:end] = last_days(self.product_index[start:end])
+
+    def _fit(self, rows, matrix, lengths):
+        days = np.arange(matrix.shape[1], dtype=float)
+        age = lengths[:, None] - 1 - days
+        weights = np.where(age >= 0, self.decay ** np.maximum(age, 0), 0.0)
+        weighted_sales = weights * matrix
+
+        self.count[rows] = lengths
+        self.total[rows] = matrix.sum(axis=1)
+        self.weight[rows] = weights.sum(axis=1)
+        self.sum_x[rows] = weights @ days
+        self.sum_y[rows] = weighted_sales.sum(axis=1)
+        self.sum_xx[rows] = weights @ (days * days)
+        self.sum_xy[rows] = weighted_sales @ days
+        self.sum_yy[rows] = (weighted_sales * matrix).sum(axis=1)
+        self.last_day[rows] = -1
+        self.last_sales[rows] = matrix[np.arange(len(matrix)), np.maximum(lengths - 1, 0)] if matrix.size else 0
+
+    def positions(self, product_ids):
+        return self.product_index.get_indexer(np.asarray(product_ids))
+
+    def back_dated(self, product_ids, date):
+        """Which products already have sales for a day after ``date``"""
+        pos = self.positions(product_ids)
+        return self.last_day[pos] > np.datetime64(date, 'D').astype(np.int64)
+
+    def observe(self, product_ids, units_sold, date):
+        """Add a day of sales for each (distinct) product
+
+        Sales dated on a product's last day add into that day, and days
+        skipped since then count as zero sales. Back-dated sales can't be
+        placed in the running sums and are left out; the returned mask
+        marks the products taken.
+        """
+        day = np.datetime64(date, 'D').astype(np.int64)
+        pos = self.positions(product_ids)
+        y = np.asarray(units_sold, dtype=float)
+        with self._lock:
+            taken = (pos >= 0) & (self.last_day[pos] <= day)
+            pos, y = pos[taken], y[taken]
+            last = self.last_day[pos]
+            same = last == day
+
+            # A new last day, after any days without sales
+            new, y_new = pos[~same], y[~same]
+            self._skip_days(new, np.where(last[~same] >= 0, day - last[~same] - 1, 0))
+            x = self.count[new].astype(float)
+            d = self.decay
+            self.weight[new] = d * self.weight[new] + 1
+            self.sum_x[new] = d * self.sum_x[new] + x
+            self.sum_y[new] = d * self.sum_y[new] + y_new
+            self.sum_xx[new] = d * self.sum_xx[new] + x * x
+            self.sum_xy[new] = d * self.sum_xy[new] + x * y_new
+            self.sum_yy[new] = d * self.sum_yy[new] + y_new * y_new
+            self.count[new] += 1
+            self.last_sales[new] = y_new
+
+            # More sales on the last day, which has weight 1
+            same, y_same = pos[same], y[same]
+            x = (self.count[same] - 1).astype(float)
+            self.sum_y[same] += y_same
+            self.sum_xy[same] += x * y_same
+            self.sum_yy[same] += y_same * (2 * self.last_sales[same] + y_same)
+            self.last_sales[same] += y_same
+
+            self.total[pos] += y
+            self.last_day[pos] = day
+            self._observed[pos] = True
+        return taken
+
+    def _skip_days(self, pos, days):
+        """Append ``days`` days of zero sales at each position"""
+        d = self.decay
+        # Sums of age^0, age^1 and age^2 weighted by d^age over ages 0 .. days - 1
+        if d == 1:
+            s0, s1, s2 = days, days * (days - 1) / 2, (days - 1) * days * (2 * days - 1) / 6
+        else:
+            n = days - 1
+            s0 = (1 - d ** days) / (1 - d)
+            s1 = d * (1 - days * d ** n + n * d ** days) / (1 - d) ** 2
+            s2 = d * (1 + d - days ** 2 * d ** n + (2 * n * n + 2 * n - 1) * d ** days
+                      - n * n * d ** (days + 1)) / (1 - d) ** 3
+        kept = d ** days
+        x = (self.count[pos] + days - 1).astype(float)   # the last skipped day
+        self.weight[pos] = kept * self.weight[pos] + s0
+        self.sum_x[pos] = kept * self.sum_x[pos] + x * s0 - s1
+        self.sum_xx[pos] = kept * self.sum_xx[pos] + x * x * s0 - 2 * x * s1 + s2
+        self.sum_y[pos] *= kept
+        self.sum_xy[pos] *= kept
+        self.sum_yy[pos] *= kept
+        self.count[pos] += days
+        self.last_sales[pos] = np.where(days > 0, 0, self.last_sales[pos])
+
+    def observed_state(self):
+        """Running sums of the products observed since load, by product ID"""
+        with self._lock:
+            pos = np.flatnonzero(self._observed[:-1])
+            state = {name: getattr(self, name)[pos].tolist() for name in self.STATE}
+        state['product_ids'] = self.product_index[pos].tolist()
+        return state
+
+    def restore_observed(self, state):
+        """Put back sums saved by ``observed_state``, skipping products no longer known"""
+        pos = self.positions(state['product_ids'])
+        known = pos >= 0
+        with self._lock:
+            for name in self.STATE:
+                if name in state:   # saved before the field existed
+                    getattr(self, name)[pos[known]] = np.asarray(state[name])[known]
+            self._observed[pos[known]] = True
+
+    def trends(self, pos):
+        """``(intercept, slope)`` of the fitted lines at these positions"""
+        weight, sum_x, sum_y = self.weight[pos], self.sum_x[pos], self.sum_y[pos]
+        det = weight * self.sum_xx[pos] - sum_x * sum_x
+        slope = np.divide(weight * self.sum_xy[pos] - sum_x * sum_y, det,
+                          out=np.zeros_like(det), where=det > 1e-9)
+        intercept = np.divide(sum_y - slope * sum_x, weight, out=np.zeros_like(weight), where=weight > 0)
+        return intercept, slope
+
+    def residual_std(self, pos, intercept, slope):
+        """Standard deviation of daily sales around the fitted lines at these positions"""
+        weight = self.weight[pos]
+        # The weighted residual sum of squares of a least-squares line
+        sse = self.sum_yy[pos] - intercept * self.sum_y[pos] - slope * self.sum_xy[pos]
+        variance = np.divide(np.maximum(sse, 0), weight - 2, out=np.zeros_like(weight), where=weight > 2)
+        return np.sqrt(variance)
+
+    def snapshot(self, pos, spread=False):
+        """``(intercept, slope, count, total)`` at these positions, read consistently
+
+        With ``spread`` the residual standard deviation is appended.
+        """
+        with self._lock:
+            intercept, slope = self.trends(pos)
+            if spread:
+                return intercept, slope, self.count[pos], self.total[pos], self.residual_std(pos, intercept, slope)
+            return intercept, slope, self.count[pos], self.total[pos]
+
+    def predict_days(self, product_ids, current_stock, horizon=FORECAST_HORIZON):
+        """Days until stockout from the running trends, like ``predict_shortage_days``"""
+        intercept, slope, count, total = self.snapshot(self.positions(product_ids))
+        return shortage_days(intercept, slope, count, total, current_stock, horizon)
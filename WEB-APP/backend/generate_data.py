@@ -0,0 +1,353 @@
+"""Seeded synthetic dataset generator.
+
+Writes all eight tables the backend reads (see ``CSV_CONFIG`` in app.py)
+at a chosen scale, e.g.
+
+    python generate_data.py --tier medium --out data/bench/medium
+    python generate_data.py --stores 5000 --skus 10000 --days 730 --out /srv/large
+
+The same seed, sizes and end date always produce the same files. The
+tables are consistent with one another: stores sit in metro clusters,
+store_distances.csv lists every pair within ``--distance-radius`` km at a
+road distance derived from their coordinates, sales follow each product's
+trend and the holiday calendar, and every SKU a store carries is stocked in
+at least one warehouse. Sales history is written a block of stores at a
+time, so memory stays bounded at any size.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from geoindex import StoreGeoIndex
+
+TIERS = {
+    'small': {'stores': 25, 'skus': 500, 'assortment': 100, 'days': 90},
+    'medium': {'stores': 200, 'skus': 2000, 'assortment': 150, 'days': 180},
+    'large': {'stores': 5000, 'skus': 10000, 'assortment': 400, 'days': 730}
+}
+
+CATEGORIES = ['Bakery', 'Beverages', 'Canned', 'Condiments', 'Dairy',
+              'Frozen', 'Household', 'Meat', 'Produce', 'Snacks']
+
+# (name, month, day or a function of the year, impact multiplier, affected categories)
+HOLIDAYS = [
+    ('New Year', 1, 1, 1.8, 'Beverages,Snacks'),
+    ('Easter', None, lambda year: _easter(year), 2.0, 'Bakery,Dairy,Meat,Produce'),
+    ('Memorial Day', 5, lambda year: _last_weekday(year, 5, 0), 1.6, 'Meat,Beverages,Snacks'),
+    ('Independence Day', 7, 4, 2.2, 'Meat,Beverages,Snacks,Condiments'),
+    ('Labor Day', 9, lambda year: _nth_weekday(year, 9, 0, 1), 1.5, 'Meat,Beverages'),
+    ('Halloween', 10, 31, 1.7, 'Snacks'),
+    ('Thanksgiving', 11, lambda year: _nth_weekday(year, 11, 3, 4), 3.0, 'Bakery,Canned,Dairy,Meat,Produce'),
+    ('Christmas', 12, 25, 2.5, 'Bakery,Beverages,Meat,Snacks,Frozen'),
+    ('New Year\'s Eve', 12, 31, 1.8, 'Beverages,Snacks,Frozen')
+]
+
+WAREHOUSES = ['Central Warehouse', 'East Warehouse', 'West Warehouse', 'North Warehouse', 'South Warehouse']
+
+# Sales rows buffered before each write to sales_history.csv
+SALES_BLOCK_ROWS = 2000000
+
+
+def _easter(year):
+    """Gregorian Easter Sunday (anonymous algorithm)"""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_weekday(year, month, weekday, n):
+    first = date(year, month, 1)
+    return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def _last_weekday(year, month, weekday):
+    following = date(year + month // 12, month % 12 + 1, 1)
+    last = following - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _ids(prefix, numbers, width):
+    return np.char.add(prefix, np.char.zfill(np.asarray(numbers).astype(str), width))
+
+
+def _hex_ids(rng, n):
+    return np.array([f'{x:08x}' for x in rng.choice(2 ** 32, n, replace=False)])
+
+
+def make_holidays(start, end):
+    rows = []
+    for year in range(start.year, end.year + 2):
+        for name, month, day, multiplier, categories in HOLIDAYS:
+            when = day(year) if callable(day) else date(year, month, day)
+            rows.append({'holiday_name': name, 'date': when.isoformat(),
+                         'impact_multiplier': multiplier, 'affected_categories': categories})
+    return pd.DataFrame(rows).sort_values('date', kind='stable').reset_index(drop=True)
+
+
+def make_stores(rng, n_stores):
+    width = max(3, len(str(n_stores)))
+    store_ids = _ids('S', np.arange(1, n_stores + 1), width)
+    # Metro areas across the continental US, ~40 stores each
+    n_metros = max(1, n_stores // 40)
+    metro_lat = rng.uniform(26.0, 48.0, n_metros)
+    metro_lon = rng.uniform(-122.0, -70.0, n_metros)
+    metro = rng.integers(0, n_metros, n_stores)
+    latitude = np.round(metro_lat[metro] + rng.normal(0, 0.25, n_stores), 6)
+    longitude = np.round(metro_lon[metro] + rng.normal(0, 0.3, n_stores), 6)
+    formats = rng.choice(['Walmart Supercenter', 'Walmart Neighborhood Market'], n_stores, p=[0.7, 0.3])
+    numbers = np.arange(1, n_stores + 1).astype(str)
+    return pd.DataFrame({
+        'store_id': store_ids,
+        'store_name': np.char.add(np.char.add(formats.astype(str), ' - Location '), numbers),
+        'location': np.char.add(np.char.add('Area ', (metro + 1).astype(str)), ', US'),
+        'manager': np.char.add('Manager ', numbers),
+        'total_value': rng.integers(50000, 200000, n_stores),
+        'latitude': latitude,
+        'longitude': longitude
+    })
+
+
+def make_distances(rng, stores, radius_km):
+    """Every store pair within ``radius_km``, at straight-line distance times a road detour"""
+    geo = StoreGeoIndex(stores['store_id'], stores['latitude'], stores['longitude'])
+    store_ids = stores['store_id'].to_numpy()
+    first, second, km = geo.pairs_within(store_ids, store_ids, radius_km)
+    keep = first < second
+    first, second, km = first[keep], second[keep], km[keep]
+    order = np.lexsort((second, first))
+    road_km = km[order] * rng.uniform(1.15, 1.45, len(order))
+    return pd.DataFrame({
+        'store1_id': store_ids[first[order]],
+        'store2_id': store_ids[second[order]],
+        'distance_km': np.round(np.maximum(road_km, 0.1), 1)
+    })
+
+
+def make_catalog(rng, n_skus):
+    width = max(3, len(str(n_skus)))
+    numbers = np.arange(1, n_skus + 1)
+    return pd.DataFrame({
+        'code': _ids('P', numbers, width),
+        'name': _ids('Product ', numbers, width),
+        'category': rng.choice(CATEGORIES, n_skus),
+        'price': np.round(rng.lognormal(np.log(4.0), 0.6, n_skus), 2),
+        'demand': rng.lognormal(np.log(3.0), 0.7, n_skus)     # mean units per store per day
+    })
+
+
+def make_products(rng, stores, catalog, assortment, end):
+    """One row per (store, carried SKU), stores in order"""
+    n_stores, n_skus = len(stores), len(catalog)
+    assortment = min(assortment, n_skus)
+    # Each store carries a random subset of the catalog, sorted by SKU
+    skus = np.concatenate([np.sort(rng.choice(n_skus, assortment, replace=False)) for _ in range(n_stores)])
+    store_ids = np.repeat(stores['store_id'].to_numpy(), assortment)
+    n = len(skus)
+
+    max_capacity = rng.integers(100, 300, n)
+    trend = rng.choice(['increasing', 'decreasing', 'stable'], n)
+    return pd.DataFrame({
+        'product_id': np.char.add(np.char.add(catalog['code'].to_numpy()[skus].astype(str), '_'), store_ids.astype(str)),
+        'store_id': store_ids,
+        'name': catalog['name'].to_numpy()[skus],
+        'category': catalog['category'].to_numpy()[skus],
+        'current_stock': rng.integers(0, max_capacity + 1),
+        'min_threshold': rng.integers(20, 50, n),
+        'max_capacity': max_capacity,
+        'price': catalog['price'].to_numpy()[skus],
+        'last_restocked': (np.datetime64(end) - rng.integers(1, 7, n)).astype(str),
+        'trend': trend,
+        'holiday_impact': np.round(rng.uniform(1.0, 3.0, n), 1)
+    }), skus
+
+
+def write_sales(path, seed, products, skus, catalog, holidays, start, days):
+    """Daily sales per product row, written a block of stores at a time.
+
+    Each store draws from its own generator seeded by ``(seed, store)``, so
+    the output doesn't depend on the block size.
+    """
+    dates = np.datetime64(start) + np.arange(days)
+    date_strings = dates.astype(str)
+    weekday = (dates.astype('datetime64[D]').view('int64') - 4) % 7   # 0 = Monday
+    weekly = np.array([0.9, 0.85, 0.9, 0.95, 1.1, 1.3, 1.2])[weekday]
+
+    # Holiday lift per (category, day): the multiplier on the day, tapering over the week before
+    lift = np.ones((len(CATEGORIES), days))
+    category_pos = {category: i for i, category in enumerate(CATEGORIES)}
+    holiday_days = (pd.to_datetime(holidays['date']).to_numpy().astype('datetime64[D]') - dates[0]).astype(int)
+    for day, multiplier, affected in zip(holiday_days, holidays['impact_multiplier'], holidays['affected_categories']):
+        for offset in range(7):
+            if 0 <= day - offset < days:
+                boost = 1 + (multiplier - 1) * (1 - offset / 7)
+                for category in affected.split(','):
+                    lift[category_pos[category], day - offset] = np.maximum(lift[category_pos[category], day - offset], boost)
+
+    slopes = {'increasing': 0.5, 'decreasing': -0.4, 'stable': 0.0}   # change in demand over the whole history
+    category_codes = catalog['category'].map(category_pos).to_numpy()
+    progress = np.arange(days) / max(days - 1, 1)
+    store_ids = products['store_id'].to_numpy()
+    store_bounds = np.flatnonzero(np.concatenate([[True], store_ids[1:] != store_ids[:-1], [True]]))
+    trend_slope = products['trend'].map(slopes).to_numpy()
+
+    header, buffered, written = True, [], 0
+    for number, (begin, end) in enumerate(zip(store_bounds[:-1], store_bounds[1:])):
+        rng = np.random.default_rng([seed, number])
+        rows = slice(begin, end)
+        row_skus = skus[rows]
+        slope = trend_slope[rows]
+        rate = (catalog['demand'].to_numpy()[row_skus, None] * rng.uniform(0.5, 1.5, (len(row_skus), 1))
+                * (1 + slope[:, None] * progress) * weekly * lift[category_codes[row_skus]])
+        units = rng.poisson(np.maximum(rate, 0))
+        product_pos, day_pos = np.nonzero(units)
+        sold = units[product_pos, day_pos]
+        price = catalog['price'].to_numpy()[row_skus][product_pos]
+        buffered.append(pd.DataFrame({
+            'product_id': products['product_id'].to_numpy()[rows][product_pos],
+            'store_id': store_ids[rows][product_pos],
+            'date': date_strings[day_pos],
+            'units_sold': sold,
+            'revenue': np.round(sold * price * rng.uniform(0.95, 1.05, len(sold)), 2)
+        }))
+        written += len(sold)
+        if sum(len(block) for block in buffered) >= SALES_BLOCK_ROWS or end == len(products):
+            pd.concat(buffered).to_csv(path, mode='w' if header else 'a', header=header, index=False)
+            header, buffered = False, []
+    if header:
+        pd.DataFrame(columns=['product_id', 'store_id', 'date', 'units_sold', 'revenue']).to_csv(path, index=False)
+    return written
+
+
+def make_warehouse(rng, catalog, carried, n_warehouses):
+    """Stock for every carried SKU in at least one warehouse"""
+    names = WAREHOUSES[:n_warehouses] + [f'Regional Warehouse {i}' for i in range(n_warehouses - len(WAREHOUSES))]
+    carried = np.asarray(carried)
+    stocked = rng.random((len(carried), n_warehouses)) < 0.6
+    stocked[np.arange(len(carried)), rng.integers(0, n_warehouses, len(carried))] = True
+    sku_pos, warehouse_pos = np.nonzero(stocked)
+    return pd.DataFrame({
+        'product_name': catalog['name'].to_numpy()[carried[sku_pos]],
+        'available_stock': rng.integers(0, 1000, len(sku_pos)),
+        'warehouse_location': np.asarray(names)[warehouse_pos]
+    })
+
+
+def make_pending_orders(rng, products, end, n):
+    rows = rng.integers(0, len(products), n)
+    created = np.datetime64(end) - rng.integers(0, 10, n)
+    return pd.DataFrame({
+        'order_id': _hex_ids(rng, n),
+        'store_id': products['store_id'].to_numpy()[rows],
+        'product_name': products['name'].to_numpy()[rows],
+        'quantity': rng.integers(10, 100, n),
+        'status': rng.choice(['pending', 'processing', 'shipped'], n),
+        'created_at': created.astype(str),
+        'estimated_delivery': (created + rng.integers(2, 7, n)).astype(str)
+    })
+
+
+def make_transfer_history(rng, products, distances, end, n):
+    """Past transfers between stores listed in store_distances, of products the donor carries"""
+    if distances.empty:
+        return pd.DataFrame(columns=['transfer_id', 'from_store', 'to_store', 'product_name', 'quantity',
+                                     'status', 'created_at', 'completed_at'])
+    pairs = rng.integers(0, len(distances), n)
+    swap = rng.random(n) < 0.5
+    first, second = distances['store1_id'].to_numpy()[pairs], distances['store2_id'].to_numpy()[pairs]
+    from_store, to_store = np.where(swap, second, first), np.where(swap, first, second)
+
+    store_ids = products['store_id'].to_numpy()
+    starts = np.searchsorted(store_ids, from_store, side='left')
+    counts = np.searchsorted(store_ids, from_store, side='right') - starts
+    rows = starts + (rng.random(n) * counts).astype(int)
+    created = np.datetime64(end) - rng.integers(1, 30, n)
+    return pd.DataFrame({
+        'transfer_id': _hex_ids(rng, n),
+        'from_store': from_store,
+        'to_store': to_store,
+        'product_name': products['name'].to_numpy()[rows],
+        'quantity': rng.integers(10, 60, n),
+        'status': rng.choice(['completed', 'in-transit'], n, p=[0.7, 0.3]),
+        'created_at': created.astype(str),
+        'completed_at': (created + rng.integers(1, 6, n)).astype(str)
+    })
+
+
+def generate(out, stores=25, skus=500, assortment=100, days=90, seed=42, end_date=None,
+             warehouses=3, distance_radius=80.0, log=print):
+    """Write the eight CSV tables to ``out``; returns row counts per table"""
+    os.makedirs(out, exist_ok=True)
+    end = end_date or date.today()
+    start = end - timedelta(days=days - 1)
+    # Independent streams per table, so resizing one table leaves the others as they were
+    streams = np.random.SeedSequence(seed).spawn(6)
+    store_rng, catalog_rng, product_rng, warehouse_rng, order_rng, distance_rng = (
+        np.random.default_rng(stream) for stream in streams
+    )
+    counts = {}
+    began = time.time()
+
+    def save(name, frame):
+        frame.to_csv(os.path.join(out, f'{name}.csv'), index=False)
+        counts[name] = len(frame)
+        log(f"  {name}: {len(frame)} rows ({time.time() - began:.1f}s)")
+
+    holidays = make_holidays(start, end)
+    save('holidays', holidays)
+    stores_df = make_stores(store_rng, stores)
+    save('stores', stores_df)
+    distances = make_distances(distance_rng, stores_df, distance_radius)
+    save('store_distances', distances)
+    catalog = make_catalog(catalog_rng, skus)
+    products, product_skus = make_products(product_rng, stores_df, catalog, assortment, end)
+    save('products', products)
+    save('warehouse_inventory', make_warehouse(warehouse_rng, catalog, np.unique(product_skus), warehouses))
+    n_orders = max(10, len(products) // 100)
+    save('pending_orders', make_pending_orders(order_rng, products, end, n_orders))
+    save('transfer_history', make_transfer_history(order_rng, products, distances, end, n_orders // 2))
+
+    counts['sales_history'] = write_sales(os.path.join(out, 'sales_history.csv'), seed, products, product_skus,
+                                          catalog, holidays, start, days)
+    log(f"  sales_history: {counts['sales_history']} rows ({time.time() - began:.1f}s)")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic inventory dataset')
+    parser.add_argument('--tier', choices=sorted(TIERS), default='small',
+                        help='preset sizes; explicit size options override it')
+    parser.add_argument('--stores', type=int)
+    parser.add_argument('--skus', type=int, help='SKUs in the catalog')
+    parser.add_argument('--assortment', type=int, help='SKUs carried by each store')
+    parser.add_argument('--days', type=int, help='days of sales history')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--end-date', type=lambda s: datetime.strptime(s, '%Y-%m-%d').date(),
+                        help='last day of sales history (YYYY-MM-DD), defaults to today')
+    parser.add_argument('--warehouses', type=int, default=3)
+    parser.add_argument('--distance-radius', type=float, default=80.0,
+                        help='km within which store pairs are listed in store_distances.csv')
+    parser.add_argument('--out', default='data')
+    args = parser.parse_args(argv)
+
+    sizes = dict(TIERS[args.tier])
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+    print(f"Generating {sizes} with seed {args.seed} into {args.out}")
+    generate(args.out, seed=args.seed, end_date=args.end_date, warehouses=args.warehouses,
+             distance_radius=args.distance_radius, **sizes)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
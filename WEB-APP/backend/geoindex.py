@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance, broadcasting over its arguments"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=float)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def unit_vectors(lat, lon):
+    """Points on the unit sphere, where straight-line order matches great-circle order"""
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _chord(radius_km):
+    """Straight-line length through the sphere of a great-circle distance"""
+    return 2 * np.sin(np.minimum(radius_km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+class StoreGeoIndex:
+    """KD-tree over store coordinates for radius and nearest-store queries.
+
+    Stores are indexed as unit vectors, so a great-circle radius is an
+    exact straight-line radius and queries cost ``O(log n)`` plus the
+    number of stores returned. Stores without coordinates are left out and
+    never match.
+    """
+
+    def __init__(self, store_ids, latitude, longitude):
+        latitude = np.asarray(latitude, dtype=float)
+        longitude = np.asarray(longitude, dtype=float)
+        located = np.isfinite(latitude) & np.isfinite(longitude)
+        self.store_index = pd.Index(np.asarray(store_ids, dtype=str)[located])
+        self.latitude = latitude[located]
+        self.longitude = longitude[located]
+        self._tree = cKDTree(unit_vectors(self.latitude, self.longitude))
+
+    @classmethod
+    def from_stores(cls, stores_df):
+        """Index for a stores table, or None when it has no coordinates"""
+        if not {'latitude', 'longitude'} <= set(stores_df.columns):
+            return None
+        index = cls(stores_df['store_id'], stores_df['latitude'], stores_df['longitude'])
+        return index if len(index.store_index) else None
+
+    def indexer(self, store_ids):
+        """Index positions for store IDs, -1 for stores without coordinates"""
+        return self.store_index.get_indexer(np.asarray(store_ids, dtype=str))
+
+    def distance(self, store1_id, store2_id):
+        """Great-circle distance in km, or None if either store has no coordinates"""
+        first, second = self.indexer([store1_id, store2_id])
+        if first < 0 or second < 0:
+            return None
+        return float(haversine_km(self.latitude[first], self.longitude[first],
+                                  self.latitude[second], self.longitude[second]))
+
+    def within(self, store_id, radius_km):
+        """``(store_id, km)`` of every other store within ``radius_km``, nearest first"""
+        pos = self.indexer([store_id])[0]
+        if pos < 0:
+            return []
+        nearby = np.asarray(self._tree.query_ball_point(self._tree.data[pos], _chord(radius_km)), dtype=np.int64)
+        return self._ranked(pos, nearby[nearby != pos])
+
+    def nearest(self, store_id, k):
+        """``(store_id, km)`` of the ``k`` closest other stores, nearest first"""
+        pos = self.indexer([store_id])[0]
+        if pos < 0 or k <= 0:
+            return []
+        k = min(k + 1, len(self.store_index))
+        _, nearby = self._tree.query(self._tree.data[pos], k)
+        nearby = np.atleast_1d(nearby)
+        return self._ranked(pos, nearby[nearby != pos])
+
+    def _ranked(self, pos, nearby):
+        km = haversine_km(self.latitude[pos], self.longitude[pos], self.latitude[nearby], self.longitude[nearby])
+        order = np.argsort(km, kind='stable')
+        return [(str(store_id), float(d)) for store_id, d in zip(self.store_index[nearby[order]], km[order])]
+
+    def pairs_within(self, from_ids, to_ids, radius_km):
+        """Every ``(from_row, to_row, km)`` pair of the two store lists within ``radius_km``
+
+        Each ``to`` store is one radius query against the tree; matches are
+        mapped back to ``from_ids`` rows (which may repeat stores) by a
+        binary search, so the cost follows the number of nearby pairs rather
+        than the size of either list or of the network.
+        """
+        from_pos = self.indexer(from_ids)
+        to_pos = self.indexer(to_ids)
+        to_rows = np.flatnonzero(to_pos >= 0)
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0))
+        if not len(to_rows) or not (from_pos >= 0).any():
+            return empty
+
+        neighbors = self._tree.query_ball_point(self._tree.data[to_pos[to_rows]], _chord(radius_km))
+        counts = np.fromiter((len(n) for n in neighbors), dtype=np.int64, count=len(neighbors))
+        if not counts.sum():
+            return empty
+        pair_to = np.repeat(to_rows, counts)
+        pair_store = np.concatenate([np.asarray(n, dtype=np.int64) for n in neighbors])
+
+        # Expand each neighbouring store to every from row it appears in
+        order = np.argsort(from_pos, kind='stable')
+        sorted_pos = from_pos[order]
+        start = np.searchsorted(sorted_pos, pair_store, side='left')
+        matches = np.searchsorted(sorted_pos, pair_store, side='right') - start
+        pair_to = np.repeat(pair_to, matches)
+        offsets = np.arange(matches.sum()) - np.repeat(np.cumsum(matches) - matches, matches)
+        pair_from = order[np.repeat(start, matches) + offsets]
+
+        km = haversine_km(self.latitude[from_pos[pair_from]], self.longitude[from_pos[pair_from]],
+                          self.latitude[to_pos[pair_to]], self.longitude[to_pos[pair_to]])
+        inside = km <= radius_km    # the chord test is exact up to rounding
+        return pair_from[inside], pair_to[inside], km[inside]
@@ -0,0 +1,83 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+class HolidayCalendar:
+    """Date-sorted holiday index with a category membership matrix.
+
+    Built once from the holidays table: dates are parsed a single time, and
+    ``affected_categories`` is split into a (category x holiday) boolean
+    matrix, so any window of upcoming holidays is a contiguous column range
+    and a whole store's categories resolve in one array operation.
+    """
+
+    def __init__(self, holidays_df):
+        dates = pd.to_datetime(holidays_df['date']).to_numpy().astype('datetime64[D]')
+        order = np.argsort(dates, kind='stable')
+        self.dates = dates[order]
+        self.names = holidays_df['holiday_name'].to_numpy()[order]
+        self.multipliers = holidays_df['impact_multiplier'].to_numpy(dtype=float)[order]
+
+        affected = [
+            {category.strip() for category in str(categories).split(',')}
+            for categories in holidays_df['affected_categories'].to_numpy()[order]
+        ]
+        self.categories = pd.Index(sorted(set().union(*affected)))
+        self.membership = np.zeros((len(self.categories), len(self.dates)), dtype=bool)
+        for column, holiday_categories in enumerate(affected):
+            self.membership[self.categories.get_indexer(list(holiday_categories)), column] = True
+
+    def _window(self, days=None, now=None):
+        """Column range of holidays after ``now`` and within ``days`` of it"""
+        today = np.datetime64((now or datetime.now()).date(), 'D')
+        start = np.searchsorted(self.dates, today, side='right')
+        if days is None:
+            return start, len(self.dates)
+        return start, np.searchsorted(self.dates, today + np.timedelta64(days, 'D'), side='right')
+
+    def _lookup(self, categories, per_category):
+        """Map categories to per-category values, 1.0 for categories no holiday touches"""
+        # Trailing 1.0 is what get_indexer's -1 lands on for unknown categories
+        table = np.append(per_category, 1.0)
+        return table[self.categories.get_indexer(categories)]
+
+    def impacts(self, categories, now=None):
+        """Multiplier of the next upcoming holiday affecting each category, 1.0 if none"""
+        start, end = self._window(now=now)
+        # An always-set trailing column gives categories with no upcoming holiday 1.0
+        affected = np.column_stack([self.membership[:, start:end], np.ones(len(self.categories), dtype=bool)])
+        nearest = np.append(self.multipliers[start:end], 1.0)
+        return self._lookup(categories, nearest[affected.argmax(axis=1)])
+
+    def peak_impacts(self, categories, days, now=None):
+        """Largest multiplier among holidays in the next ``days`` days per category"""
+        start, end = self._window(days, now)
+        multipliers = np.where(self.membership[:, start:end], self.multipliers[start:end], 1.0)
+        return self._lookup(categories, multipliers.max(axis=1, initial=1.0))
+
+    def combined_impacts(self, categories, days, now=None):
+        """Product of all overlapping holiday multipliers in the next ``days`` days"""
+        start, end = self._window(days, now)
+        multipliers = np.where(self.membership[:, start:end], self.multipliers[start:end], 1.0)
+        return self._lookup(categories, multipliers.prod(axis=1))
+
+    def holiday_days(self, categories, days, now=None):
+        """Which of the next ``days`` days (tomorrow first) have a holiday affecting each category"""
+        start, end = self._window(days, now)
+        today = np.datetime64((now or datetime.now()).date(), 'D')
+        offsets = (self.dates[start:end] - today).astype(np.int64) - 1
+        # Trailing all-False row is what get_indexer's -1 lands on for unknown categories
+        grid = np.zeros((len(self.categories) + 1, days), dtype=bool)
+        for column, offset in zip(range(start, end), offsets):
+            grid[:-1, offset] |= self.membership[:, column]
+        return grid[self.categories.get_indexer(categories)]
+
+    def upcoming(self, days=None, now=None):
+        """Holidays in the window as ``(name, date, multiplier)`` tuples"""
+        start, end = self._window(days, now)
+        return [
+            (str(name), str(date), float(multiplier))
+            for name, date, multiplier in zip(self.names[start:end], self.dates[start:end], self.multipliers[start:end])
+        ]
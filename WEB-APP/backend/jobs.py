@@ -0,0 +1,254 @@
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from forecasting import shortage_days, simulate_stockouts
+
+
+def forecast_shard(intercept, slope, count, total, current_stock):
+    """Days until stockout for one shard of products (runs in a pool process)"""
+    return shortage_days(intercept, slope, count, total, current_stock)
+
+
+def simulation_shard(model, current_stock, holiday_impact, holiday_days, options):
+    """Stockout curves and service-level stock for one shard of products (runs in a pool process)"""
+    return simulate_stockouts(*model, current_stock, holiday_impact, holiday_days, **options)
+
+
+# Job-wide inputs set up once per pool process by the job's ``setup``
+_pool_state = {}
+
+
+def _init_pool(setup):
+    fn, args = setup
+    _pool_state.clear()
+    _pool_state.update(fn(*args))
+
+
+def rebalance_setup(rebalancer, products, distances_df):
+    """Pool state for ``rebalance_shard``, with the distance matrix and store lanes built once"""
+    rebalancer.store_lanes(rebalancer.get_distance_matrix(distances_df))
+    return {'rebalancer': rebalancer, 'products': products, 'distances_df': distances_df}
+
+
+def rebalance_shard(rows, solver):
+    """Rebalance suggestions for the products at these rows, one shard of product names (runs in a pool process)"""
+    state = _pool_state
+    return state['rebalancer'].find_rebalance_opportunities(state['products'].iloc[rows], state['distances_df'], solver)
+
+
+def balanced_shards(sizes, n_shards):
+    """Split consecutive groups of the given sizes into ``n_shards`` runs of similar total size
+
+    Returns ``(start, end)`` group ranges; groups are never split.
+    """
+    bounds = np.searchsorted(np.cumsum(sizes), np.linspace(0, np.sum(sizes), n_shards + 1)[1:-1], side='right')
+    edges = np.unique(np.concatenate([[0], bounds, [len(sizes)]]))
+    return [(int(start), int(end)) for start, end in zip(edges[:-1], edges[1:]) if end > start]
+
+
+class Job:
+    """A background job made of independent shards"""
+
+    def __init__(self, job_id, kind, params):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.status = 'queued'    # queued, running, completed, failed, cancelled
+        self.shards_total = 0
+        self.shards_done = 0
+        self.error = None
+        self.summary = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = threading.Event()
+
+    def __getstate__(self):
+        # Copies sent to other processes only report the cancel request
+        state = dict(self.__dict__)
+        state['cancel_requested'] = self.cancel_requested.is_set()
+        return state
+
+    def __setstate__(self, state):
+        cancel_requested = threading.Event()
+        if state.pop('cancel_requested'):
+            cancel_requested.set()
+        self.__dict__.update(state, cancel_requested=cancel_requested)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'progress': round(self.shards_done / self.shards_total, 4) if self.shards_total else 0.0,
+            'shardsDone': self.shards_done,
+            'shardsTotal': self.shards_total,
+            'error': self.error,
+            'summary': self.summary,
+            'createdAt': self.created_at.isoformat(),
+            'startedAt': self.started_at.isoformat() if self.started_at else None,
+            'finishedAt': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class JobManager:
+    """Runs sharded jobs on a process pool, one job at a time.
+
+    Each kind of job is registered with a ``plan(job)`` callable, called
+    on the job thread, that returns ``(tasks, finish)``: ``tasks`` is a
+    list of ``(fn, args)`` shards sent to the pool, and
+    ``finish(results)`` merges the shard results and hands them to
+    ``publish``. A plan may return ``(tasks, finish, setup)`` instead,
+    where ``setup`` is an ``(fn, args)`` pair run once in each pool
+    process; shards then read the dict it returns from ``_pool_state``
+    rather than each being sent the same inputs. Publishing only happens once every shard has succeeded,
+    so a failed or cancelled job leaves the previous results in place.
+
+    ``data_version()`` reports the version of the data jobs read, so a
+    published result can be checked for being current.
+    """
+
+    def __init__(self, workers=None, history=50, data_version=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.history = history
+        self.data_version = data_version
+        self._plans = {}
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._queue = []
+        self._published = {}    # key -> (serial, data version, result)
+        self._serials = itertools.count(1)
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._has_jobs = threading.Condition(self._lock)
+        self._runner = None
+
+    def register(self, kind, plan):
+        """Plan jobs of this kind with ``plan(job) -> (tasks, finish)``"""
+        self._plans[kind] = plan
+
+    def subscribe(self, listener):
+        """Call ``listener(key)`` after every published result"""
+        self._listeners.append(listener)
+
+    def submit(self, kind, params=None):
+        if kind not in self._plans:
+            raise ValueError(f'Unknown job kind: {kind}')
+        with self._lock:
+            job = Job(f"job_{next(self._ids)}", kind, params or {})
+            self._jobs[job.id] = job
+            self._queue.append((job, self._plans[kind]))
+            self._forget_old()
+            if self._runner is None:
+                self._runner = threading.Thread(target=self._run, name='job-runner', daemon=True)
+                self._runner.start()
+            self._has_jobs.notify()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """Request cancellation; returns False if the job is unknown or already finished"""
+        job = self.get(job_id)
+        if job is None or job.status not in ('queued', 'running'):
+            return False
+        job.cancel_requested.set()
+        return True
+
+    def publish(self, key, result, version=None):
+        """Replace the result published under ``key``, computed from data at ``version``"""
+        with self._lock:
+            self._published[key] = (next(self._serials), version, result)
+        for listener in self._listeners:
+            listener(key)
+
+    def published(self, key, current=False, known=None):
+        """``(serial, result)`` last published under ``key``, or None
+
+        With ``current``, None unless the data hasn't changed since the
+        result was computed. When ``known`` is the serial the caller
+        already holds, the result itself is left out.
+        """
+        with self._lock:
+            entry = self._published.get(key)
+        if entry is None:
+            return None
+        serial, version, result = entry
+        if current and version != self.data_version():
+            return None
+        return serial, (None if serial == known else result)
+
+    def schedule_daily(self, at, kind, params=None):
+        """Submit a job every day at ``at`` ('HH:MM', local time)"""
+        hour, minute = (int(part) for part in at.split(':'))
+
+        def run():
+            while True:
+                now = datetime.now()
+                due = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+                if due <= now:
+                    due += timedelta(days=1)
+                time.sleep((due - now).total_seconds())
+                self.submit(kind, dict(params or {}, scheduled=True))
+
+        threading.Thread(target=run, name=f'{kind}-schedule', daemon=True).start()
+
+    def _forget_old(self):
+        finished = [job for job in self._jobs.values() if job.status in ('completed', 'failed', 'cancelled')]
+        for job in finished[:max(len(self._jobs) - self.history, 0)]:
+            del self._jobs[job.id]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._has_jobs.wait()
+                job, plan = self._queue.pop(0)
+            if job.cancel_requested.is_set():
+                job.status = 'cancelled'
+                job.finished_at = datetime.now()
+                continue
+            self._run_job(job, plan)
+
+    def _run_job(self, job, plan):
+        job.status = 'running'
+        job.started_at = datetime.now()
+        executor = None
+        try:
+            tasks, finish, *setup = plan(job)
+            job.shards_total = len(tasks)
+            executor = ProcessPoolExecutor(max_workers=min(self.workers, max(len(tasks), 1)),
+                                           initializer=_init_pool if setup else None, initargs=tuple(setup))
+            futures = {executor.submit(fn, *args): i for i, (fn, args) in enumerate(tasks)}
+            results = [None] * len(tasks)
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[futures[future]] = future.result()
+                    job.shards_done += 1
+                if job.cancel_requested.is_set():
+                    job.status = 'cancelled'
+                    return
+            job.summary = finish(results)
+            job.status = 'completed'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            job.finished_at = datetime.now()
@@ -0,0 +1,305 @@
+import csv
+import os
+import threading
+from datetime import datetime, timedelta
+
+
+class LedgerError(ValueError):
+    """Raised when a transfer or order can't be applied"""
+
+
+class InventoryLedger:
+    """Journaled write path for store transfers, warehouse orders and sales.
+
+    Every write is validated and applied to the in-memory inventory under
+    one lock, appended to the journal, and acknowledged once the journal
+    has made it durable. Events carry the resulting stock levels rather
+    than deltas, so replaying an event twice is harmless. Record IDs are
+    derived from the journal sequence number and never repeat.
+
+    Snapshots stay bounded: records are appended to their CSV tables
+    (``archive_paths``) at each compaction instead of being kept, and
+    state derived from sales is saved by its owner (``register_state``)
+    rather than as the sales themselves.
+    """
+
+    def __init__(self, inventory, journal, compact_every=10000, archive_paths=None):
+        self.inventory = inventory
+        self.journal = journal
+        self.compact_every = compact_every
+        self.archive_paths = archive_paths or {}   # records table -> CSV path
+        self.records = {'transfer_history': {}, 'pending_orders': {}}   # written since the last snapshot
+        self._stock = {}        # product_id -> stock, for products changed since load
+        self._warehouse = {}    # (product_name, warehouse_location) -> available stock
+        self._archive_sizes = {}    # CSV sizes as of the last snapshot
+        self._derived = {}      # name -> (save, restore)
+        self._listeners = []
+        self._since_snapshot = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, listener):
+        """Call ``listener(event)`` after every applied event, replays included"""
+        self._listeners.append(listener)
+
+    def register_state(self, name, save, restore):
+        """Keep state derived from events in snapshots
+
+        ``save()`` is stored under ``name`` at each compaction and
+        ``restore(saved)`` is called with it at startup, before the events
+        written since are replayed.
+        """
+        self._derived[name] = (save, restore)
+
+    def start(self):
+        """Restore the last snapshot, replay the journal and open it for writes"""
+        state, events = self.journal.replay()
+        if state is not None:
+            self._restore(state)
+        for event in events:
+            self.apply(event)
+        self._since_snapshot = len(events)
+        self.journal.open()
+        if state is None or 'archive_sizes' not in state:
+            # Record where archived records will start before any are written
+            self._archive_sizes = {table: self._file_size(path) for table, path in self.archive_paths.items()}
+            self.compact()
+
+    def transfer(self, from_store, to_store, product_name, quantity):
+        """Move stock between two stores' copies of a product"""
+        quantity = self._whole_number(quantity, 'quantity')
+        if quantity <= 0:
+            raise LedgerError('Quantity must be positive')
+        if from_store == to_store:
+            raise LedgerError('Cannot transfer stock to the same store')
+
+        with self._lock:
+            donor = self.inventory.find_product(from_store, product_name)
+            receiver = self.inventory.find_product(to_store, product_name)
+            if donor < 0 or receiver < 0:
+                raise LedgerError(f'{product_name} is not stocked at both {from_store} and {to_store}')
+            donor_stock, receiver_stock = self.inventory.stock_at([donor, receiver])
+            if donor_stock < quantity:
+                raise LedgerError(f'{from_store} only has {donor_stock} units of {product_name}')
+
+            product_ids = self.inventory.product_ids_at([donor, receiver])
+            now = datetime.now()
+            event = {
+                'type': 'transfer',
+                'record': {
+                    'from_store': from_store,
+                    'to_store': to_store,
+                    'product_name': product_name,
+                    'quantity': quantity,
+                    'status': 'in-transit',
+                    'created_at': now.isoformat(),
+                    'completed_at': None
+                },
+                'stock': {
+                    product_ids[0]: donor_stock - quantity,
+                    product_ids[1]: receiver_stock + quantity
+                }
+            }
+            lsn = self.journal.append(event)
+            record = self.apply(event)
+
+        self._commit(lsn)
+        return record
+
+    def place_order(self, store_id, product_name, quantity, urgency='medium', warehouse_location=None):
+        """Reserve warehouse stock for a store order"""
+        quantity = self._whole_number(quantity, 'quantity')
+        if quantity <= 0:
+            raise LedgerError('Quantity must be positive')
+
+        with self._lock:
+            if self.inventory.find_product(store_id, product_name) < 0:
+                raise LedgerError(f'{product_name} is not stocked at {store_id}')
+            rows = self.inventory.find_warehouse_stock(product_name, warehouse_location)
+            available = self.inventory.warehouse_available(rows)
+            covering = [i for i, stock in enumerate(available) if stock >= quantity]
+            if not covering:
+                where = warehouse_location or 'any warehouse'
+                raise LedgerError(f'Not enough {product_name} at {where} for {quantity} units')
+            row, stock = rows[covering[0]], available[covering[0]]
+            location = self.inventory.warehouse_location_at(row)
+
+            now = datetime.now()
+            delivery_hours = 24 if urgency == 'high' else 48
+            event = {
+                'type': 'warehouse_order',
+                'record': {
+                    'store_id': store_id,
+                    'product_name': product_name,
+                    'quantity': quantity,
+                    'status': 'pending',
+                    'created_at': now.isoformat(),
+                    'estimated_delivery': (now + timedelta(hours=delivery_hours)).isoformat(),
+                    'warehouse_location': location
+                },
+                'warehouse': [[product_name, location, stock - quantity]]
+            }
+            lsn = self.journal.append(event)
+            record = self.apply(event)
+
+        self._commit(lsn)
+        return record
+
+    def record_sales(self, sales, date=None):
+        """Book a day of sales, drawing down each product's stock
+
+        ``sales`` maps product IDs to units sold on ``date`` ('YYYY-MM-DD',
+        default today), the day the forecasts place them on. Returns the
+        IDs that are not in the inventory, which are left out of the event.
+        """
+        date = self._day(date)
+        with self._lock:
+            rows = {product_id: self.inventory.product_row(product_id) for product_id in sales}
+            unknown = [product_id for product_id, row in rows.items() if row < 0]
+            known = [product_id for product_id, row in rows.items() if row >= 0]
+            if not known:
+                return unknown
+
+            stock = self.inventory.stock_at([rows[product_id] for product_id in known])
+            units = [self._whole_number(sales[product_id], 'units sold') for product_id in known]
+            if any(sold < 0 for sold in units):
+                raise LedgerError('Units sold cannot be negative')
+            event = {
+                'type': 'sales',
+                'date': date,
+                'sales': dict(zip(known, units)),
+                'stock': {
+                    product_id: max(0, current - sold)
+                    for product_id, current, sold in zip(known, stock, units)
+                }
+            }
+            lsn = self.journal.append(event)
+            self.apply(event)
+
+        self._commit(lsn)
+        return unknown
+
+    def apply(self, event):
+        """Apply a journaled event to the in-memory inventory"""
+        if event.get('stock'):
+            rows, stock = [], []
+            for product_id, value in event['stock'].items():
+                row = self.inventory.product_row(product_id)
+                # Products dropped from the CSVs since the event was written are skipped
+                if row >= 0:
+                    rows.append(row)
+                    stock.append(value)
+            self.inventory.set_stock(rows, stock)
+            self._stock.update(event['stock'])
+
+        for product_name, location, available in event.get('warehouse', []):
+            rows = self.inventory.find_warehouse_stock(product_name, location)
+            self.inventory.set_warehouse_available(rows, available)
+            self._warehouse[(product_name, location)] = available
+
+        record = None
+        if event['type'] == 'transfer':
+            record = dict(event['record'], transfer_id=f"T{event['lsn']:010d}")
+            self.records['transfer_history'][record['transfer_id']] = record
+        elif event['type'] == 'warehouse_order':
+            record = dict(event['record'], order_id=f"WO{event['lsn']:010d}")
+            self.records['pending_orders'][record['order_id']] = record
+
+        for listener in self._listeners:
+            listener(event)
+        return record
+
+    def compact(self):
+        """Archive records and fold the journal into a snapshot of everything changed since load"""
+        with self._lock:
+            archive_sizes = self._archive()
+            for table in archive_sizes:
+                self.records[table].clear()
+            self.journal.snapshot({
+                'stock': self._stock,
+                'warehouse': [[name, location, available] for (name, location), available in self._warehouse.items()],
+                'records': {table: list(records.values()) for table, records in self.records.items()},
+                'archive_sizes': archive_sizes,
+                'derived': {name: save() for name, (save, _) in self._derived.items()}
+            })
+            self._archive_sizes = archive_sizes
+            self._since_snapshot = 0
+
+    def _archive(self):
+        """Append records written since the last snapshot to their CSV tables, returning the new sizes
+
+        Each table is first cut back to its size as of that snapshot, so
+        records appended by a compaction that crashed before its snapshot
+        was written are not archived twice. A table that is now shorter
+        than that was replaced since, and the snapshot's records are
+        appended to it as it is.
+        """
+        sizes = {}
+        for table, path in self.archive_paths.items():
+            records = list(self.records[table].values())
+            archived = self._archive_sizes.get(table, 0)
+            size = self._file_size(path)
+            if not records and size == archived:
+                sizes[table] = archived
+                continue
+            with open(path, 'a+', newline='', encoding='utf-8') as f:
+                if size >= archived:
+                    f.truncate(archived)
+                elif size:
+                    f.seek(size - 1)
+                    if f.read(1) not in ('\n', '\r'):
+                        f.write('\n')    # the replacement's last row had no line end
+                f.seek(0)
+                columns = next(csv.reader([f.readline()]), None)
+                if not columns:
+                    columns = list(records[0]) if records else []
+                    csv.writer(f).writerow(columns)
+                csv.DictWriter(f, columns, extrasaction='ignore').writerows(records)
+                f.flush()
+                os.fsync(f.fileno())
+                sizes[table] = os.fstat(f.fileno()).st_size
+        return sizes
+
+    def _restore(self, state):
+        self.apply({'type': 'snapshot', 'stock': state['stock'], 'warehouse': state['warehouse']})
+        for table, records in state['records'].items():
+            key = 'transfer_id' if table == 'transfer_history' else 'order_id'
+            self.records[table] = {record[key]: record for record in records}
+        self._archive_sizes = state.get('archive_sizes', {})
+        for name, saved in state.get('derived', {}).items():
+            if name in self._derived:
+                self._derived[name][1](saved)
+        # Snapshots from before derived state was saved carry the sales themselves
+        for day in state.get('sales', []):
+            self.apply({'type': 'sales', 'date': day['date'], 'sales': day['sales']})
+
+    def _commit(self, lsn):
+        self.journal.wait_durable(lsn)
+        with self._lock:
+            self._since_snapshot += 1
+            due = bool(self.compact_every) and self._since_snapshot >= self.compact_every
+            if due:
+                self._since_snapshot = 0    # only one writer compacts
+        if due:
+            self.compact()
+
+    @staticmethod
+    def _file_size(path):
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    @staticmethod
+    def _day(value):
+        if value is None:
+            return datetime.now().strftime('%Y-%m-%d')
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+        except (TypeError, ValueError):
+            raise LedgerError(f'Invalid date: {value!r}, expected YYYY-MM-DD')
+
+    @staticmethod
+    def _whole_number(value, what):
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise LedgerError(f'Invalid {what}: {value!r}, expected a whole number')
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise LedgerError(f'Invalid {what}: {value!r}, expected a whole number')
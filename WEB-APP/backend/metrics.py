@@ -0,0 +1,262 @@
+import functools
+import itertools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """Cumulative latency histogram per label combination, in Prometheus terms"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # label values -> [per-bucket counts (last is +Inf), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket] += 1
+            series[1] += value
+
+    def take(self):
+        """Counts observed since the last ``take``, which are cleared"""
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series):
+        """Add counts taken from the same histogram in another process"""
+        with self._lock:
+            for values, (counts, total) in series.items():
+                mine = self._series.get(values)
+                if mine is None:
+                    self._series[values] = [list(counts), total]
+                else:
+                    mine[0] = [a + b for a, b in zip(mine[0], counts)]
+                    mine[1] += total
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(values, list(counts), total) for values, (counts, total) in sorted(self._series.items())]
+        for values, counts, total in series:
+            cumulative = list(itertools.accumulate(counts))
+            for bound, count in zip(self.buckets + ('+Inf',), cumulative):
+                le = 'le="+Inf"' if bound == '+Inf' else f'le="{bound:g}"'
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, values, le)} {count}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, values)} {total:.9g}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, values)} {cumulative[-1]}')
+        return '\n'.join(lines)
+
+
+class Metrics:
+    """Request and stage latency histograms, rendered in Prometheus text format.
+
+    Recording is a clock read and a locked counter increment, and nothing
+    runs between requests; the text is only built when ``/metrics`` is
+    scraped. Under the prefork server, workers ``take`` their counts and
+    the loader ``merge``s them, so every scrape reports the same totals.
+    """
+
+    def __init__(self, buckets, prefix='inventory'):
+        self.requests = Histogram(f'{prefix}_http_request_duration_seconds',
+                                  'Time to build each response, by route, method and status',
+                                  ('route', 'method', 'status'), buckets)
+        self.stages = Histogram(f'{prefix}_stage_duration_seconds',
+                                'Time spent in each internal processing stage',
+                                ('stage',), buckets)
+
+    def observe_request(self, route, method, status, seconds):
+        self.requests.observe(seconds, route, method, str(status))
+
+    def stage(self, name):
+        """Context manager timing one run of a stage"""
+        return _StageTimer(self.stages, name)
+
+    def timed(self, name):
+        """Decorator timing every call of a function as a stage"""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.stages.observe(time.perf_counter() - started, name)
+            return wrapper
+        return decorate
+
+    def take(self):
+        return {'requests': self.requests.take(), 'stages': self.stages.take()}
+
+    def merge(self, counts):
+        self.requests.merge(counts['requests'])
+        self.stages.merge(counts['stages'])
+
+    def render(self):
+        return '\n'.join([self.requests.render(), self.stages.render()]) + '\n'
+
+
+class _StageTimer:
+    __slots__ = ('histogram', 'name', 'started')
+
+    def __init__(self, histogram, name):
+        self.histogram = histogram
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, self.name)
+        return False
+
+
+class RequestProfile:
+    """Stack samples of one thread, taken every ``interval`` seconds until stopped.
+
+    Samples are taken from a helper thread, which only runs when the
+    profiled thread gives up the GIL. Pure Python code is therefore seen
+    at the interpreter's switch interval (5 ms by default), while code
+    that releases the GIL, like numpy and I/O, is sampled at ``interval``.
+    """
+
+    def __init__(self, profile_id, thread_id, interval, max_depth=64, on_stop=None):
+        self.id = profile_id
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.on_stop = on_stop
+        self.stacks = Counter()     # root-first tuple of 'file:function' -> samples
+        self.route = self.method = self.status = None
+        self.duration = None
+        self.created_at = time.time()
+        self._started = time.perf_counter()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._sampler.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def stop(self, route=None, method=None, status=None):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._sampler.join()
+        self.duration = time.perf_counter() - self._started
+        self.route, self.method, self.status = route, method, status
+        if self.on_stop is not None:
+            self.on_stop(self)
+
+    def __getstate__(self):
+        # Copies sent to other processes are finished profiles, without the sampler
+        state = dict(self.__dict__)
+        for name in ('_stop', '_sampler', 'on_stop'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._stop = threading.Event()
+        self._stop.set()
+        self._sampler = self.on_stop = None
+
+    @property
+    def samples(self):
+        return sum(self.stacks.values())
+
+    def folded(self):
+        """Collapsed stacks, one ``frame;frame;frame count`` line each, for flame graph tools"""
+        return '\n'.join(f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()) + '\n'
+
+    def top(self, limit=25):
+        """Functions by samples spent in them (self) and under them (total)"""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for frame in set(stack):
+                total[frame] += count
+        samples = max(self.samples, 1)
+        return [
+            {'function': frame, 'self': own[frame], 'total': count,
+             'self_pct': round(own[frame] * 100 / samples, 1), 'total_pct': round(count * 100 / samples, 1)}
+            for frame, count in sorted(total.items(), key=lambda item: (-own[item[0]], -item[1]))[:limit]
+        ]
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'route': self.route,
+            'method': self.method,
+            'status': self.status,
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'samples': self.samples,
+            'interval_ms': self.interval * 1000,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.created_at))
+        }
+
+
+class Profiler:
+    """Starts request profiles on demand and keeps the most recent ones
+
+    Profile IDs carry the process ID, so they stay unique across the
+    workers of serve.py, which ``add`` their finished profiles to the
+    loader's profiler through ``on_stop``.
+    """
+
+    def __init__(self, interval=0.005, keep=50):
+        self.interval = interval
+        self.on_stop = None     # called with each profile once it is stopped
+        self._ids = itertools.count(1)
+        self._profiles = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Profile the calling thread until the returned profile is stopped"""
+        profile = RequestProfile(f'prof_{os.getpid()}_{next(self._ids)}', threading.get_ident(), self.interval,
+                                 on_stop=self.on_stop)
+        self.add(profile)
+        return profile
+
+    def add(self, profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def get(self, profile_id):
+        with self._lock:
+            return next((profile for profile in self._profiles if profile.id == profile_id), None)
+
+    def list(self):
+        with self._lock:
+            return list(reversed(self._profiles))
@@ -0,0 +1,358 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+
+class StoreDistanceMatrix:
+    """Dense store-to-store distance lookup built once from store_distances.
+
+    Pairs missing from the table have an infinite distance. The matrix has
+    one extra trailing row and column of infinities so that unknown stores,
+    which ``get_indexer`` maps to -1, land on it without special casing.
+    """
+
+    def __init__(self, distances_df, store_ids=()):
+        known = np.concatenate([
+            distances_df['store1_id'].astype(str).to_numpy(),
+            distances_df['store2_id'].astype(str).to_numpy(),
+            np.asarray(list(store_ids), dtype=str)
+        ])
+        self.store_index = pd.Index(pd.unique(known))
+
+        size = len(self.store_index)
+        self.matrix = np.full((size + 1, size + 1), np.inf, dtype=np.float32)
+        first = self.indexer(distances_df['store1_id'].astype(str))
+        second = self.indexer(distances_df['store2_id'].astype(str))
+        km = distances_df['distance_km'].to_numpy(dtype=np.float32)
+        # Duplicate or asymmetric rows keep the shortest distance
+        np.minimum.at(self.matrix, (first, second), km)
+        np.minimum.at(self.matrix, (second, first), km)
+        self.matrix[np.arange(size), np.arange(size)] = 0
+
+    def indexer(self, store_ids):
+        """Matrix positions for store IDs, -1 for stores without distances"""
+        return self.store_index.get_indexer(store_ids)
+
+
+def _shortest_paths(supply_left, flow, cost):
+    """Bellman-Ford over the residual transportation graphs of a batch of problems.
+
+    Arrays have a leading problem axis: ``cost`` is ``(problems, supplies,
+    demands)``. Paths start at any supply with stock left, follow a lane
+    forward to a demand at ``cost`` and may hop back to another supply
+    along a lane that already carries flow at ``-cost``. Each relaxation
+    round is one pair of vectorized min-reductions over the whole batch.
+    """
+    n_problems, n_supply, n_demand = cost.shape
+    has_flow = flow > 0
+
+    dist_supply = np.where(supply_left > 0, 0.0, np.inf)
+    pred_supply = np.full((n_problems, n_supply), -1)
+    dist_demand = np.full((n_problems, n_demand), np.inf)
+    pred_demand = np.full((n_problems, n_demand), -1)
+    # Labels only change on a strict improvement so that zero-cost
+    # detours never turn the predecessor links into a loop
+    with np.errstate(invalid='ignore'):
+        for _ in range(n_supply + n_demand + 1):
+            reach = dist_supply[:, :, None] + cost
+            reach_from = reach.argmin(axis=1)
+            via_lane = np.take_along_axis(reach, reach_from[:, None, :], axis=1)[:, 0, :]
+            demand_improved = via_lane < dist_demand - 1e-9
+            dist_demand = np.where(demand_improved, via_lane, dist_demand)
+            pred_demand = np.where(demand_improved, reach_from, pred_demand)
+
+            back = np.where(has_flow, dist_demand[:, None, :] - cost, np.inf)
+            back_from = back.argmin(axis=2)
+            via_back = np.take_along_axis(back, back_from[:, :, None], axis=2)[:, :, 0]
+            supply_improved = via_back < dist_supply - 1e-9
+            if not supply_improved.any():
+                break
+            dist_supply = np.where(supply_improved, via_back, dist_supply)
+            pred_supply = np.where(supply_improved, back_from, pred_supply)
+
+    return dist_demand, pred_demand, pred_supply
+
+
+def solve_transportation(supply, demand, cost, flow=None):
+    """Min-cost max-flow shipment plans from supply rows to demand columns.
+
+    Solves a batch of independent problems in lockstep: ``supply`` is
+    ``(problems, supplies)``, ``demand`` is ``(problems, demands)`` and
+    ``cost`` is ``(problems, supplies, demands)`` with ``np.inf`` on
+    forbidden lanes, so problems of different sizes are padded with zero
+    supply and demand. Uses successive shortest paths, so every
+    intermediate plan is the cheapest one moving its total quantity.
+    Passing a previous ``flow`` continues from it, which lets callers serve
+    demand tiers in order.
+    """
+    supply = np.asarray(supply, dtype=np.int64)
+    demand = np.asarray(demand, dtype=np.int64)
+    flow = np.zeros(cost.shape, dtype=np.int64) if flow is None else flow.copy()
+    supply_left = supply - flow.sum(axis=2)
+    demand_left = demand - flow.sum(axis=1)
+    n_steps = sum(cost.shape[1:])
+
+    active = np.flatnonzero(supply_left.any(axis=1) & demand_left.any(axis=1))
+    while len(active):
+        dist_demand, pred_demand, pred_supply = _shortest_paths(supply_left[active], flow[active], cost[active])
+        open_demand = (demand_left[active] > 0) & np.isfinite(dist_demand)
+        routed = open_demand.any(axis=1)
+        active, open_demand = active[routed], open_demand[routed]
+        dist_demand, pred_demand, pred_supply = dist_demand[routed], pred_demand[routed], pred_supply[routed]
+        if not len(active):
+            break
+        problems = np.arange(len(active))
+        end = np.where(open_demand, dist_demand, np.inf).argmin(axis=1)
+
+        # Walk every path back to its source supply, tracking the bottleneck
+        j = end.copy()
+        amount = demand_left[active, end]
+        source = np.full(len(active), -1)
+        forward, backward = [], []
+        walking = problems
+        for _ in range(n_steps):
+            i = pred_demand[walking, j[walking]]
+            forward.append((walking, i, j[walking]))
+            at_source = pred_supply[walking, i] < 0
+            done, i_done = walking[at_source], i[at_source]
+            source[done] = i_done
+            amount[done] = np.minimum(amount[done], supply_left[active[done], i_done])
+            walking, i = walking[~at_source], i[~at_source]
+            if not len(walking):
+                break
+            j[walking] = pred_supply[walking, i]
+            backward.append((walking, i, j[walking]))
+            amount[walking] = np.minimum(amount[walking], flow[active[walking], i, j[walking]])
+
+        for path, i, j in forward:
+            flow[active[path], i, j] += amount[path]
+        for path, i, j in backward:
+            flow[active[path], i, j] -= amount[path]
+        supply_left[active, source] -= amount
+        demand_left[active, end] -= amount
+        active = active[supply_left[active].any(axis=1) & demand_left[active].any(axis=1)]
+
+    return flow
+
+
+def plan_transfers(surplus, shortage, urgency, cost):
+    """Optimal transfers for a batch of connected problems, most urgent shortages first.
+
+    Shortages are served tier by tier in descending ``urgency``; later tiers
+    never take stock away from earlier ones. A tier a problem has no
+    shortages in leaves its plan unchanged, so every problem is taken
+    through the tiers of the whole batch. Arrays are laid out as for
+    ``solve_transportation``.
+    """
+    flow = None
+    for tier in np.unique(urgency[shortage > 0])[::-1]:
+        tier_demand = np.where(urgency >= tier, shortage, 0)
+        flow = solve_transportation(surplus, tier_demand, cost, flow)
+    return np.zeros(cost.shape, dtype=np.int64) if flow is None else flow
+
+
+def _local_positions(group, rows):
+    """Position of each ``(group, row)`` among the distinct rows of its group, in row order"""
+    n_rows = rows.max() + 1
+    key = group.astype(np.int64) * n_rows + rows
+    distinct = np.unique(key)
+    first = np.searchsorted(distinct, group.astype(np.int64) * n_rows, side='left')
+    return np.searchsorted(distinct, key) - first
+
+
+def _expand(starts, counts):
+    """Positions ``starts[i]`` up to ``starts[i] + counts[i]`` for every ``i``, concatenated"""
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def dedupe_lanes(lane_from, lane_to, lane_cost, n_to):
+    """Lanes with each ``(from, to)`` pair once, keeping the first cost given for it"""
+    key = lane_from.astype(np.int64) * n_to + lane_to
+    _, first = np.unique(key, return_index=True)
+    return lane_from[first], lane_to[first], lane_cost[first]
+
+
+def product_lanes(donor_rows, receiver_rows, store_code, group, lane_from, lane_to, lane_cost, n_stores):
+    """Donor to receiver lanes between rows of the same group, one per store lane.
+
+    Store lanes are ``(from_store, to_store, cost)`` over store codes, each
+    pair at most once; rows with a negative store code have no lanes. Every
+    donor is expanded to the store lanes leaving its store, and each lane is
+    matched to receivers of the same group at its far end with a binary
+    search, so the cost follows the number of candidate lanes.
+    Returns ``(donor_row, receiver_row, cost)`` arrays.
+    """
+    order = np.argsort(lane_from, kind='stable')
+    lane_from, lane_to, lane_cost = lane_from[order], lane_to[order], lane_cost[order]
+    first = np.searchsorted(lane_from, np.arange(n_stores), side='left')
+    last = np.searchsorted(lane_from, np.arange(n_stores), side='right')
+
+    donor_rows = donor_rows[store_code[donor_rows] >= 0]
+    donor_store = store_code[donor_rows]
+    counts = last[donor_store] - first[donor_store]
+    lanes = _expand(first[donor_store], counts)
+    pair_donor = np.repeat(donor_rows, counts)
+    pair_key = group[pair_donor].astype(np.int64) * n_stores + lane_to[lanes]
+
+    receiver_rows = receiver_rows[store_code[receiver_rows] >= 0]
+    receiver_key = group[receiver_rows].astype(np.int64) * n_stores + store_code[receiver_rows]
+    order = np.argsort(receiver_key, kind='stable')
+    sorted_key = receiver_key[order]
+    start = np.searchsorted(sorted_key, pair_key, side='left')
+    matches = np.searchsorted(sorted_key, pair_key, side='right') - start
+    pair_receiver = receiver_rows[order[_expand(start, matches)]]
+    return np.repeat(pair_donor, matches), pair_receiver, np.repeat(lane_cost[lanes], matches)
+
+
+def _fill_in_order(lanes, group, order_keys, quantity_rows, single_rows, amounts, single_amounts):
+    """Allocate the single row of each group across the group's lanes taken in ``order_keys`` order"""
+    order = lanes[np.lexsort(order_keys)]
+    lane_group = group[order]
+    groups, first = np.unique(lane_group, return_index=True)
+    lane_idx, single_idx, quantity = allocate_in_order(amounts[quantity_rows[order]], lane_group,
+                                                       single_amounts[single_rows[order[first]]], groups)
+    return order[lane_idx], quantity
+
+
+def _solve_blocks(lanes, group, lane_from, lane_to, lane_cost, surplus, shortage, urgency, max_cells=1 << 20):
+    """Plan the groups of ``lanes`` as padded batches of dense problems of similar size"""
+    donor_pos = _local_positions(group[lanes], lane_from[lanes])
+    receiver_pos = _local_positions(group[lanes], lane_to[lanes])
+    groups, lane_group = np.unique(group[lanes], return_inverse=True)
+    n_donors = np.zeros(len(groups), dtype=np.int64)
+    n_receivers = np.zeros(len(groups), dtype=np.int64)
+    np.maximum.at(n_donors, lane_group, donor_pos + 1)
+    np.maximum.at(n_receivers, lane_group, receiver_pos + 1)
+
+    # Smallest problems first, each batch padded to its largest problem
+    by_size = np.argsort(n_donors * n_receivers, kind='stable')
+    batches, batch, rows, cols = [], [], 0, 0
+    for g in by_size:
+        rows, cols = max(rows, n_donors[g]), max(cols, n_receivers[g])
+        if batch and (len(batch) + 1) * rows * cols > max_cells:
+            batches.append(batch)
+            batch, rows, cols = [], n_donors[g], n_receivers[g]
+        batch.append(g)
+    batches.append(batch)
+
+    for batch in batches:
+        batch = np.asarray(batch)
+
+        slot = np.full(len(groups), -1)
+        slot[batch] = np.arange(len(batch))
+        in_batch = np.flatnonzero(slot[lane_group] >= 0)
+        b, i, j = slot[lane_group[in_batch]], donor_pos[in_batch], receiver_pos[in_batch]
+        shape = (len(batch), n_donors[batch].max(), n_receivers[batch].max())
+        cost = np.full(shape, np.inf)
+        cost[b, i, j] = lane_cost[lanes[in_batch]]
+        lane_at = np.full(shape, -1, dtype=np.int64)
+        lane_at[b, i, j] = lanes[in_batch]
+        supply = np.zeros(shape[:2], dtype=np.int64)
+        supply[b, i] = surplus[lane_from[lanes[in_batch]]]
+        demand = np.zeros((shape[0], shape[2]), dtype=np.int64)
+        demand[b, j] = shortage[lane_to[lanes[in_batch]]]
+        tiers = np.zeros((shape[0], shape[2]), dtype=urgency.dtype)
+        tiers[b, j] = urgency[lane_to[lanes[in_batch]]]
+
+        flow = plan_transfers(supply, demand, tiers, cost)
+        moved = np.nonzero(flow)
+        yield lane_at[moved], flow[moved]
+
+
+def solve_lanes(lane_from, lane_to, lane_cost, surplus, shortage, urgency):
+    """Optimal transfers over sparse lanes for many products at once.
+
+    Lanes join donor rows (``lane_from``) to receiver rows (``lane_to``) of
+    one shared row numbering, and each connected group of rows is planned
+    like ``plan_transfers``. Groups with a single donor or a single
+    receiver, by far the most common, have a closed-form optimum: the one
+    donor fills receivers by descending urgency, then distance, then row,
+    and the one receiver is filled from donors by distance, then row. Those
+    are all allocated in one vectorized pass, which gives the same plan as
+    the shortest-path solver; only the remaining groups are solved one at a
+    time. Returns ``(from_row, to_row, quantity, cost)`` arrays.
+    """
+    n_rows = len(surplus)
+    lane_from, lane_to, lane_cost = dedupe_lanes(lane_from, lane_to, lane_cost, n_rows)
+    if not len(lane_from):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, np.empty(0)
+
+    graph = coo_matrix((np.ones(len(lane_from)), (lane_from, lane_to)), shape=(n_rows, n_rows))
+    _, labels = connected_components(graph, directed=False)
+    group = labels[lane_from]
+    donors = np.bincount(labels[np.unique(lane_from)], minlength=labels.max() + 1)
+    receivers = np.bincount(labels[np.unique(lane_to)], minlength=labels.max() + 1)
+    single_donor = donors[group] == 1
+    single_receiver = (receivers[group] == 1) & ~single_donor
+
+    results = []
+    lanes = np.flatnonzero(single_donor)
+    if len(lanes):
+        keys = (lane_to[lanes], lane_cost[lanes], -urgency[lane_to[lanes]], group[lanes])
+        results.append(_fill_in_order(lanes, group, keys, lane_to, lane_from, shortage, surplus))
+    lanes = np.flatnonzero(single_receiver)
+    if len(lanes):
+        keys = (lane_from[lanes], lane_cost[lanes], group[lanes])
+        results.append(_fill_in_order(lanes, group, keys, lane_from, lane_to, surplus, shortage))
+
+    lanes = np.flatnonzero(~single_donor & ~single_receiver)
+    if len(lanes):
+        results.extend(_solve_blocks(lanes, group, lane_from, lane_to, lane_cost, surplus, shortage, urgency))
+
+    lane = np.concatenate([lane for lane, _ in results])
+    quantity = np.concatenate([quantity for _, quantity in results])
+    moved = quantity > 0
+    lane, quantity = lane[moved], quantity[moved]
+    return lane_from[lane], lane_to[lane], quantity, lane_cost[lane]
+
+
+def _group_offsets(quantity, group, base):
+    """Start and end of each row on a per-group number line"""
+    end = np.cumsum(quantity)
+    start = end - quantity
+    # Rows are sorted by group, so each group starts at its first row
+    first_row = np.searchsorted(group, group, side='left')
+    group_start = start[first_row]
+    return base[group] + start - group_start, base[group] + end - group_start
+
+
+def allocate_in_order(demand, demand_group, supply, supply_group):
+    """Fill demands from supplies of the same group, both taken in order.
+
+    Both sides must be sorted by group; within a group the first demand is
+    filled from the first supply, spilling into the next supply when that
+    one runs dry, and so on. Each group is laid out on a shared number line
+    and allocations are the overlaps of demand and supply intervals, so the
+    whole table is allocated without a Python loop.
+    Returns ``(demand_row, supply_row, quantity)`` arrays.
+    """
+    demand = np.asarray(demand, dtype=np.int64)
+    supply = np.asarray(supply, dtype=np.int64)
+    n_groups = int(max(demand_group.max(initial=-1), supply_group.max(initial=-1))) + 1
+
+    span = np.maximum(
+        np.bincount(demand_group, weights=demand, minlength=n_groups),
+        np.bincount(supply_group, weights=supply, minlength=n_groups)
+    ).astype(np.int64)
+    base = np.cumsum(span) - span
+
+    demand_start, demand_end = _group_offsets(demand, demand_group, base)
+    supply_start, supply_end = _group_offsets(supply, supply_group, base)
+
+    points = np.unique(np.concatenate([demand_start, demand_end, supply_start, supply_end]))
+    lo, hi = points[:-1], points[1:]
+    demand_row = np.searchsorted(demand_end, lo, side='right')
+    supply_row = np.searchsorted(supply_end, lo, side='right')
+
+    valid = (demand_row < len(demand)) & (supply_row < len(supply))
+    lo, hi = lo[valid], hi[valid]
+    demand_row, supply_row = demand_row[valid], supply_row[valid]
+    valid = (
+        (demand_group[demand_row] == supply_group[supply_row]) &
+        (demand_start[demand_row] <= lo) &
+        (supply_start[supply_row] <= lo)
+    )
+    return demand_row[valid], supply_row[valid], (hi - lo)[valid]
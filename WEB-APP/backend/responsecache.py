@@ -0,0 +1,116 @@
+import hashlib
+import json
+import threading
+import time
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run one computation per key at a time; concurrent callers share its result"""
+
+    def __init__(self):
+        self.shared = 0     # calls answered by another caller's computation
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+def json_etag(value):
+    """Strong ETag for a JSON-serializable value"""
+    body = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(body.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Computed endpoint results keyed on a data version, with a short TTL.
+
+    ``invalidate`` bumps the data version whenever the underlying data
+    changes, which retires every cached entry at once. Entries also expire
+    after ``ttl`` seconds so time-dependent fields stay fresh. Misses go
+    through a ``SingleFlight``, so a burst of identical requests runs the
+    computation once.
+    """
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # key -> [version, expires_at, value, etag or None]
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+    def get(self, key, compute):
+        """Cached value for ``key``, running ``compute()`` on a miss"""
+        return self._entry(key, compute)[2]
+
+    def get_tagged(self, key, compute):
+        """``(value, etag)`` for ``key``; the ETag is computed on first use and kept with the entry"""
+        entry = self._entry(key, compute)
+        if entry[3] is None:
+            entry[3] = json_etag(entry[2])
+        return entry[2], entry[3]
+
+    def _entry(self, key, compute):
+        with self._lock:
+            version = self.version
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        def fill():
+            entry = [version, time.monotonic() + self.ttl, compute(), None]
+            with self._lock:
+                self._entries[key] = entry
+            return entry
+
+        return self._flight.do((key, version), fill)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'version': self.version,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self._flight.shared,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,310 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from geoindex import haversine_km, unit_vectors
+
+
+def haversine_travel_times(lat, lon, speed_kmh, detour_factor, block_size=1024):
+    """Estimated travel seconds between all points, from straight-line distance"""
+    n = len(lat)
+    seconds = np.empty((n, n), dtype=np.float32)
+    for start in range(0, n, block_size):
+        rows = slice(start, start + block_size)
+        km = haversine_km(lat[rows, None], lon[rows, None], lat[None, :], lon[None, :])
+        seconds[rows] = km * detour_factor / speed_kmh * 3600
+    return seconds
+
+
+class RoadGraph:
+    """Directed road network from a local edge list.
+
+    ``edges_path`` is a CSV of ``source,target,travel_time`` (seconds),
+    one row per direction of travel; ``nodes_path`` holds
+    ``node_id,latitude,longitude`` and is used to snap stores to their
+    nearest node.
+    """
+
+    def __init__(self, edges_path, nodes_path):
+        edges = pd.read_csv(edges_path, usecols=['source', 'target', 'travel_time'])
+        nodes = pd.read_csv(nodes_path, usecols=['node_id', 'latitude', 'longitude'])
+        self.node_index = pd.Index(nodes['node_id'])
+        self.latitude = nodes['latitude'].to_numpy(dtype=float)
+        self.longitude = nodes['longitude'].to_numpy(dtype=float)
+
+        source = self.node_index.get_indexer(edges['source'])
+        target = self.node_index.get_indexer(edges['target'])
+        known = (source >= 0) & (target >= 0)
+        n = len(self.node_index)
+        # Parallel edges keep their fastest time
+        edge_list = pd.DataFrame({'s': source[known], 't': target[known],
+                                  'w': edges['travel_time'].to_numpy(dtype=float)[known]})
+        edge_list = edge_list.groupby(['s', 't'], as_index=False)['w'].min()
+        self.graph = csr_matrix((edge_list['w'], (edge_list['s'], edge_list['t'])), shape=(n, n))
+
+    def snap(self, latitude, longitude):
+        """Nearest graph node of each point"""
+        tree = cKDTree(unit_vectors(self.latitude, self.longitude))
+        return tree.query(unit_vectors(np.asarray(latitude, dtype=float), np.asarray(longitude, dtype=float)))[1]
+
+
+# Set once per pool process so the graph is pickled per worker, not per task
+_worker_graph = None
+
+
+def _init_worker(graph):
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _search_from(sources, targets):
+    return dijkstra(_worker_graph, directed=True, indices=sources)[:, targets].astype(np.float32)
+
+
+def shortest_travel_times(graph, nodes, workers=1, block_bytes=64 << 20):
+    """Travel seconds between all pairs of ``nodes`` over a sparse graph.
+
+    Runs one single-source Dijkstra per distinct origin rather than one
+    search per pair, split across ``workers`` processes. Each search
+    returns float64 distances to every graph node, so origins are searched
+    in chunks of about ``block_bytes`` of those rows at a time.
+    """
+    origins, inverse = np.unique(nodes, return_inverse=True)
+    per_worker = -(-len(origins) // workers)
+    chunk_size = max(1, min(block_bytes // (8 * max(graph.shape[0], 1)), per_worker))
+    chunks = [origins[start:start + chunk_size] for start in range(0, len(origins), chunk_size)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(graph,)) as pool:
+            rows = list(pool.map(_search_from, chunks, [origins] * len(chunks)))
+    else:
+        _init_worker(graph)
+        rows = [_search_from(chunk, origins) for chunk in chunks]
+    seconds = np.concatenate(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+    return seconds[inverse][:, inverse]
+
+
+def distance_table_graph(distances_df, store_index, speed_kmh):
+    """Store graph with the known pairwise distances as two-way edges, in seconds"""
+    first = store_index.get_indexer(distances_df['store1_id'].astype(str))
+    second = store_index.get_indexer(distances_df['store2_id'].astype(str))
+    seconds = distances_df['distance_km'].to_numpy(dtype=float) / speed_kmh * 3600
+    known = (first >= 0) & (second >= 0) & (first != second)
+    rows = np.concatenate([first[known], second[known]])
+    cols = np.concatenate([second[known], first[known]])
+    weights = np.concatenate([seconds[known], seconds[known]])
+    edges = pd.DataFrame({'r': rows, 'c': cols, 'w': weights}).groupby(['r', 'c'], as_index=False)['w'].min()
+    n = len(store_index)
+    return csr_matrix((edges['w'], (edges['r'], edges['c'])), shape=(n, n))
+
+
+class TravelTimeMatrix:
+    """Travel seconds between every pair of stores; ``inf`` where unreachable"""
+
+    def __init__(self, store_ids, seconds, method):
+        self.store_index = pd.Index(store_ids)
+        self.seconds = seconds
+        self.method = method
+
+    def indexer(self, store_ids):
+        return self.store_index.get_indexer(store_ids)
+
+    def save(self, path):
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, store_ids=self.store_index.to_numpy(dtype=str), seconds=self.seconds,
+                 method=np.array(self.method))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['store_ids'].astype(object), data['seconds'], str(data['method']))
+
+
+def _cache_key(stores_df, distances_df, method, config):
+    digest = hashlib.sha256()
+    digest.update(repr((method, config['speed_kmh'], config['detour_factor'])).encode())
+    digest.update(pd.util.hash_pandas_object(stores_df.astype(str), index=False).to_numpy().tobytes())
+    if method == 'table':
+        digest.update(pd.util.hash_pandas_object(distances_df.astype(str), index=False).to_numpy().tobytes())
+    if method == 'graph':
+        for path in (config['graph_path'], config['nodes_path']):
+            stat = os.stat(path)
+            digest.update(repr((os.path.abspath(path), stat.st_size, stat.st_mtime_ns)).encode())
+    return digest.hexdigest()[:24]
+
+
+def choose_method(stores_df, config):
+    """The most accurate method the available data supports"""
+    if config['method'] != 'auto':
+        return config['method']
+    has_coordinates = {'latitude', 'longitude'} <= set(stores_df.columns)
+    has_graph = os.path.exists(config['graph_path']) and os.path.exists(config['nodes_path'])
+    if has_coordinates and has_graph:
+        return 'graph'
+    if has_coordinates:
+        return 'haversine'
+    return 'table'
+
+
+def build_travel_times(stores_df, distances_df, config, workers=None):
+    """Travel time matrix for every store, reusing the on-disk copy when inputs are unchanged
+
+    Methods: ``graph`` runs Dijkstra over the local road graph from each
+    store's nearest node, ``haversine`` estimates from coordinates with a
+    detour factor and average speed, and ``table`` runs Dijkstra over the
+    known store-to-store distances.
+    """
+    method = choose_method(stores_df, config)
+    store_ids = stores_df['store_id'].astype(str).to_numpy()
+    cache_path = None
+    if config.get('cache_dir'):
+        key = _cache_key(stores_df, distances_df, method, config)
+        cache_path = os.path.join(config['cache_dir'], f'travel_times_{key}.npz')
+        if os.path.exists(cache_path):
+            try:
+                return TravelTimeMatrix.load(cache_path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring cached travel times: {e}")
+
+    workers = workers or os.cpu_count() or 1
+    if method == 'graph':
+        road = RoadGraph(config['graph_path'], config['nodes_path'])
+        nodes = road.snap(stores_df['latitude'], stores_df['longitude'])
+        seconds = shortest_travel_times(road.graph, nodes, workers)
+    elif method == 'haversine':
+        seconds = haversine_travel_times(
+            stores_df['latitude'].to_numpy(dtype=float), stores_df['longitude'].to_numpy(dtype=float),
+            config['speed_kmh'], config['detour_factor']
+        )
+    elif method == 'table':
+        graph = distance_table_graph(distances_df, pd.Index(store_ids), config['speed_kmh'])
+        seconds = shortest_travel_times(graph, np.arange(len(store_ids)), workers)
+    else:
+        raise ValueError(f"Unknown travel time method: {method}")
+
+    matrix = TravelTimeMatrix(store_ids, seconds, method)
+    if cache_path is not None:
+        os.makedirs(config['cache_dir'], exist_ok=True)
+        for name in os.listdir(config['cache_dir']):
+            if name.startswith('travel_times_') and name.endswith('.npz'):
+                os.remove(os.path.join(config['cache_dir'], name))
+        matrix.save(cache_path)
+    return matrix
+
+
+def _route_seconds(seconds, depot, stops):
+    path = np.concatenate([[depot], stops, [depot]])
+    return float(seconds[path[:-1], path[1:]].sum())
+
+
+def two_opt(seconds, depot, stops):
+    """Improve a closed route's stop order by reversing segments while it gets shorter"""
+    stops = np.asarray(stops)
+    best = _route_seconds(seconds, depot, stops)
+    improved = True
+    while improved and len(stops) > 2:
+        improved = False
+        for i in range(len(stops) - 1):
+            for j in range(i + 1, len(stops)):
+                candidate = np.concatenate([stops[:i], stops[i:j + 1][::-1], stops[j + 1:]])
+                length = _route_seconds(seconds, depot, candidate)
+                if length < best - 1e-6:
+                    stops, best, improved = candidate, length, True
+    return stops
+
+
+def plan_routes(suggestions, travel_times, capacity, max_stops):
+    """Batch store-to-store transfers into multi-stop truck routes.
+
+    Transfers are grouped by donor store, which is each truck's depot.
+    Deliveries to the same receiver form one stop; a stop larger than a
+    truck is split into full loads. Trucks are filled nearest-neighbour,
+    visiting the closest stop that still fits, then each route's order is
+    improved with 2-opt. Returns ``(routes, unrouted)``.
+    """
+    routes, unrouted = [], []
+    seconds = travel_times.seconds
+    by_depot = {}
+    for suggestion in suggestions:
+        by_depot.setdefault(suggestion['from_store'], []).append(suggestion)
+
+    for from_store, transfers in by_depot.items():
+        depot = travel_times.indexer([from_store])[0]
+        stops = {}
+        for transfer in transfers:
+            to = travel_times.indexer([transfer['to_store']])[0]
+            if depot < 0 or to < 0 or not np.isfinite(seconds[depot, to]):
+                unrouted.append(transfer)
+                continue
+            stops.setdefault(to, []).append(transfer)
+
+        loads = []
+        for to, items in stops.items():
+            quantity = sum(int(item['transfer_qty']) for item in items)
+            # Stops bigger than a truck go as full direct loads first
+            while quantity > capacity:
+                direct, items = _take(items, capacity)
+                routes.append(_route(from_store, depot, [(to, direct)], travel_times))
+                quantity -= capacity
+            if quantity:
+                loads.append((to, quantity, items))
+
+        pending = list(loads)
+        while pending:
+            position, space, stops_on_truck = depot, capacity, []
+            while pending and len(stops_on_truck) < max_stops:
+                fitting = [load for load in pending if load[1] <= space]
+                if not fitting:
+                    break
+                nearest = min(fitting, key=lambda load: seconds[position, load[0]])
+                pending.remove(nearest)
+                stops_on_truck.append(nearest)
+                position, space = nearest[0], space - nearest[1]
+            order = two_opt(seconds, depot, [load[0] for load in stops_on_truck])
+            by_stop = {load[0]: load for load in stops_on_truck}
+            routes.append(_route(from_store, depot, [
+                (stop, [(item, int(item['transfer_qty'])) for item in by_stop[stop][2]]) for stop in order
+            ], travel_times))
+
+    return routes, unrouted
+
+
+def _take(items, quantity):
+    """Split transfers into ``(item, units)`` covering ``quantity`` units, and the rest"""
+    taken, left = [], []
+    for item in items:
+        units = int(item['transfer_qty'])
+        moved = min(units, quantity)
+        quantity -= moved
+        if moved:
+            taken.append((item, moved))
+        if units > moved:
+            left.append(dict(item, transfer_qty=units - moved))
+    return taken, left
+
+
+def _route(from_store, depot, stops, travel_times):
+    seconds = travel_times.seconds
+    store_ids = travel_times.store_index
+    elapsed, position, route_stops = 0.0, depot, []
+    for stop, items in stops:
+        elapsed += float(seconds[position, stop])
+        position = stop
+        route_stops.append({
+            'store_id': str(store_ids[stop]),
+            'arrival_minutes': round(elapsed / 60, 1),
+            'items': [{'product_name': item['product_name'], 'quantity': quantity} for item, quantity in items]
+        })
+    total = elapsed + float(seconds[position, depot])
+    return {
+        'from_store': from_store,
+        'stops': route_stops,
+        'total_quantity': sum(item['quantity'] for stop in route_stops for item in stop['items']),
+        'travel_minutes': round(total / 60, 1)
+    }
@@ -0,0 +1,173 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+class DailySalesSeries:
+    """Units sold per product per day, as a dense (product x day) array.
+
+    Column 0 is ``start_date`` and every product's series runs from its
+    first recorded day to the last day in the file; days without a sales
+    row count as zero sales.
+    """
+
+    def __init__(self, product_ids, start_date, units, first_day):
+        self.product_index = pd.Index(product_ids)
+        self.start_date = start_date
+        self.units = units
+        self.first_day = first_day   # column of each product's first sale
+
+    @property
+    def days(self):
+        return self.units.shape[1]
+
+    def matrix(self, product_ids):
+        """Left-aligned histories in the ``(matrix, lengths)`` layout of ``build_sales_matrix``"""
+        pos = self.product_index.get_indexer(product_ids)
+        found = pos >= 0
+        first = np.where(found, self.first_day[pos], self.days)
+        lengths = self.days - first
+
+        cols = first[:, None] + np.arange(int(lengths.max(initial=0)))
+        inside = cols < self.days
+        matrix = np.zeros(cols.shape)
+        rows = np.broadcast_to(pos[:, None], cols.shape)
+        matrix[inside] = self.units[rows[inside], cols[inside]]
+        return matrix, lengths
+
+    def last_days(self, product_ids):
+        """Day number (days since 1970-01-01) each history ends on, -1 for products without one"""
+        last = (self.start_date - EPOCH).astype(np.int64) + self.days - 1
+        return np.where(self.product_index.get_indexer(product_ids) >= 0, last, -1)
+
+    def memory_usage(self):
+        return int(self.units.nbytes + self.first_day.nbytes + self.product_index.memory_usage(deep=True))
+
+
+class _SeriesBuilder:
+    """Growable (product x day) accumulator used while streaming"""
+
+    def __init__(self, retention_days=None, dtype=np.float32):
+        self.retention_days = retention_days
+        self.dtype = dtype
+        self.product_pos = {}
+        self.units = np.zeros((1024, 64), dtype=dtype)
+        self.first_day = np.full(1024, np.iinfo(np.int64).max, dtype=np.int64)
+        self.base = None    # absolute day of column 0
+        self.last = None    # latest absolute day seen
+
+    def add(self, product_ids, days, units):
+        self._cover(int(days.min()), int(days.max()))
+
+        # Products are only registered once a row of theirs is kept
+        keep = days >= self.base
+        if not keep.any():
+            return
+        rows, days, units = self._rows(product_ids[keep]), days[keep], units[keep]
+        np.minimum.at(self.first_day, rows, days)
+
+        # Sum duplicates within the chunk before touching the big array
+        width = self.units.shape[1]
+        key = pd.Series(units).groupby(rows * width + (days - self.base)).sum()
+        flat = key.index.to_numpy()
+        self.units[flat // width, flat % width] += key.to_numpy(dtype=self.dtype)
+
+    def _rows(self, product_ids):
+        codes = pd.Series(product_ids).map(self.product_pos)
+        unseen = codes.isna()
+        if unseen.any():
+            for product_id in pd.unique(product_ids[unseen.to_numpy()]):
+                self.product_pos[product_id] = len(self.product_pos)
+            codes = pd.Series(product_ids).map(self.product_pos)
+            if len(self.product_pos) > len(self.first_day):
+                self._grow_rows(len(self.product_pos))
+        return codes.to_numpy(dtype=np.int64)
+
+    def _grow_rows(self, needed):
+        capacity = max(needed, 2 * len(self.first_day))
+        units = np.zeros((capacity, self.units.shape[1]), dtype=self.dtype)
+        units[:len(self.units)] = self.units
+        first_day = np.full(capacity, np.iinfo(np.int64).max, dtype=np.int64)
+        first_day[:len(self.first_day)] = self.first_day
+        self.units, self.first_day = units, first_day
+
+    def _cutoff(self):
+        """Oldest day inside the retention window"""
+        if self.retention_days:
+            return self.last - self.retention_days + 1
+        return None
+
+    def _cover(self, lo, hi):
+        """Make the day columns span [lo, hi], minus days outside the retention window"""
+        self.last = hi if self.last is None else max(self.last, hi)
+        if self.base is not None:
+            lo = min(lo, self.base)
+        if self.retention_days:
+            lo = max(lo, self._cutoff())
+        width = self.units.shape[1]
+        if self.base is not None and self.base <= lo and self.last < self.base + width:
+            return
+
+        # Leave room on the right so day-ordered files rarely reallocate
+        span = self.last - lo + 1
+        new_width = span + max(64, span)
+        if self.retention_days:
+            new_width = min(new_width, self.retention_days + 64)
+        units = np.zeros((len(self.units), new_width), dtype=self.dtype)
+        if self.base is not None:
+            keep_lo, keep_hi = max(self.base, lo), min(self.base + width, lo + new_width)
+            if keep_lo < keep_hi:
+                units[:, keep_lo - lo:keep_hi - lo] = self.units[:, keep_lo - self.base:keep_hi - self.base]
+        self.units, self.base = units, lo
+
+    def finish(self):
+        n_products = len(self.product_pos)
+        if self.base is None:
+            return DailySalesSeries([], EPOCH, np.zeros((0, 0), dtype=self.dtype), np.zeros(0, dtype=np.int64))
+        start = self.base if self._cutoff() is None else max(self.base, self._cutoff())
+        units = np.ascontiguousarray(self.units[:n_products, start - self.base:self.last - self.base + 1])
+        first_day = np.maximum(self.first_day[:n_products], start) - start
+        return DailySalesSeries(list(self.product_pos), EPOCH + start, units, first_day)
+
+
+def stream_sales_history(path, chunksize=1000000, retention_days=None, progress=None):
+    """Build a ``DailySalesSeries`` from a sales_history CSV in bounded memory.
+
+    The file is parsed ``chunksize`` rows at a time, so peak memory is one
+    chunk plus the (product x day) array. With ``retention_days`` only the
+    most recent days are kept. ``progress`` is called after every chunk
+    with a dict of rows, bytes read and elapsed seconds.
+    """
+    builder = _SeriesBuilder(retention_days)
+    total_bytes = os.path.getsize(path)
+    started = time.time()
+    rows_read = 0
+
+    with open(path, 'rb') as f:
+        chunks = pd.read_csv(
+            f,
+            usecols=['product_id', 'date', 'units_sold'],
+            dtype={'product_id': str, 'date': str, 'units_sold': np.float32},
+            chunksize=chunksize
+        )
+        for chunk in chunks:
+            days = pd.to_datetime(chunk['date'], format='%Y-%m-%d').to_numpy().astype('datetime64[D]')
+            builder.add(
+                chunk['product_id'].to_numpy(),
+                (days - EPOCH).astype(np.int64),
+                chunk['units_sold'].to_numpy()
+            )
+            rows_read += len(chunk)
+            if progress is not None:
+                progress({
+                    'rows': rows_read,
+                    'bytes': min(f.tell(), total_bytes),
+                    'total_bytes': total_bytes,
+                    'elapsed': round(time.time() - started, 2)
+                })
+
+    return builder.finish()
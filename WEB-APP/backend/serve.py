@@ -0,0 +1,453 @@
+"""Prefork production server.
+
+The loader process imports the app once, moves the arrays that change
+at runtime into shared memory and forks the workers, which serve HTTP on
+a shared listening socket:
+
+    python serve.py --workers 4 --port 5000
+
+Read-only data (tables, indexes, sales history, the distance matrix) is
+inherited from the loader copy-on-write and never written, so its pages
+stay shared however many workers run. Current stock, warehouse stock
+and the forecaster's running sums live in shared memory: the loader is the
+only writer, and workers forward transfers, orders and sales to it over a
+pipe. After each write the loader appends the product rows it changed to
+a shared change log; workers read the new entries and refresh their
+derived caches (alert levels, aggregates, cached responses and
+forecasts) for just those rows. Background jobs, including
+the nightly recompute, also run in the loader only: workers submit,
+inspect and cancel them and read their published results over the same
+pipe, so every worker sees the same jobs. Workers send their latency
+counts and finished request profiles to the loader as well, which
+answers /metrics and profile lookups for all of them. Requires fork
+(Linux, macOS).
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from multiprocessing import Pipe
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+# Versions bumped by the loader: job result published
+RESULTS_VERSION = 0
+
+# Kinds of change recorded in the ChangeLog
+STOCK_CHANGED, SALES_CHANGED = 1, 2
+
+
+class SharedArrays:
+    """Arrays in shared memory, inherited by forked workers"""
+
+    def __init__(self):
+        self._blocks = []
+
+    def allocate(self, array):
+        """Shared copy of ``array``"""
+        array = np.asarray(array)
+        block = SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._blocks.append(block)
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        shared[...] = array
+        return shared
+
+    def nbytes(self):
+        return sum(block.size for block in self._blocks)
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+class ChangeLog:
+    """Product rows changed by the loader, in a shared ring buffer
+
+    The loader appends the rows each write touched, with what changed;
+    every worker reads on from its own cursor. A worker that falls more
+    than ``capacity`` entries behind can no longer tell which rows
+    changed and has to refresh everything. Rows of -1 mark changes to
+    other data, like warehouse stock.
+    """
+
+    def __init__(self, allocate, capacity=1 << 16):
+        self.capacity = capacity
+        self.rows = allocate(np.zeros(capacity, dtype=np.int64))
+        self.kinds = allocate(np.zeros(capacity, dtype=np.int8))
+        self._head = allocate(np.zeros(1, dtype=np.int64))     # entries ever appended
+
+    def head(self):
+        return int(self._head[0])
+
+    def append(self, rows, kinds):
+        """Record changed rows; only the loader writes"""
+        head = self.head()
+        slots = (head + np.arange(len(rows))) % self.capacity
+        self.rows[slots] = rows
+        self.kinds[slots] = kinds
+        self._head[0] = head + len(rows)   # publish once the entries are in place
+
+    def read(self, cursor):
+        """``(head, (rows, kinds))`` appended since ``cursor``, or ``(head, None)`` if some were overwritten"""
+        head = self.head()
+        slots = np.arange(cursor, head) % self.capacity
+        rows, kinds = self.rows[slots], self.kinds[slots]
+        if self.head() - cursor > self.capacity:
+            return head, None
+        return head, (rows, kinds)
+
+
+class WriteServer:
+    """Runs ledger writes, job, metrics and profile requests forwarded by workers inside the loader process"""
+
+    METHODS = ('transfer', 'place_order', 'record_sales')
+    TARGET_METHODS = {
+        'jobs': ('submit', 'get', 'list', 'cancel', 'published'),
+        'metrics': ('merge', 'render'),
+        'profiler': ('add', 'get', 'list')
+    }
+
+    def __init__(self, ledger, jobs, metrics, profiler):
+        self.ledger = ledger
+        self.targets = {'jobs': jobs, 'metrics': metrics, 'profiler': profiler}
+
+    def _resolve(self, method):
+        if method in self.METHODS:
+            return getattr(self.ledger, method)
+        target, _, name = method.partition('.')
+        if name in self.TARGET_METHODS.get(target, ()):
+            return getattr(self.targets[target], name)
+        raise ValueError(f'Unknown write method: {method}')
+
+    def serve(self, connection):
+        """Answer one worker's requests until it goes away"""
+        while True:
+            try:
+                method, args = connection.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                reply = ('ok', self._resolve(method)(*args))
+            except Exception as e:
+                reply = ('error', e)
+            connection.send(reply)
+
+    def start(self, connection):
+        thread = threading.Thread(target=self.serve, args=(connection,), name='write-server', daemon=True)
+        thread.start()
+        return thread
+
+
+class WriteClient:
+    """Stand-in for the ledger in a worker, forwarding writes to the loader"""
+
+    def __init__(self, connection, on_write=None):
+        self.connection = connection
+        self.on_write = on_write
+        self._lock = threading.Lock()
+
+    def call(self, method, *args):
+        """Run ``method`` in the loader and return its result"""
+        with self._lock:
+            self.connection.send((method, args))
+            status, result = self.connection.recv()
+        if status == 'error':
+            raise result
+        return result
+
+    def _call(self, method, *args):
+        try:
+            return self.call(method, *args)
+        finally:
+            if self.on_write is not None:
+                self.on_write()     # read-your-writes for the request that made it
+
+    def transfer(self, from_store, to_store, product_name, quantity):
+        return self._call('transfer', from_store, to_store, product_name, quantity)
+
+    def place_order(self, store_id, product_name, quantity, urgency='medium', warehouse_location=None):
+        return self._call('place_order', store_id, product_name, quantity, urgency, warehouse_location)
+
+    def record_sales(self, sales, date=None):
+        return self._call('record_sales', dict(sales), date)
+
+
+class JobClient:
+    """Stand-in for the job manager in a worker; jobs run and publish in the loader"""
+
+    def __init__(self, client, workers):
+        self.client = client
+        self.workers = workers
+        self._published = {}    # key -> (serial, result) last fetched
+
+    def submit(self, kind, params=None):
+        return self.client.call('jobs.submit', kind, params)
+
+    def get(self, job_id):
+        return self.client.call('jobs.get', job_id)
+
+    def list(self):
+        return self.client.call('jobs.list')
+
+    def cancel(self, job_id):
+        return self.client.call('jobs.cancel', job_id)
+
+    def published(self, key, current=False):
+        """Like ``JobManager.published``, copying each result over only once"""
+        cached = self._published.get(key)
+        entry = self.client.call('jobs.published', key, current, cached[0] if cached else None)
+        if entry is None:
+            return None
+        if cached is not None and entry[0] == cached[0]:
+            return cached
+        self._published[key] = entry
+        return entry
+
+
+class MetricsClient:
+    """Stand-in for the metrics in a worker; counts are recorded locally and merged in the loader"""
+
+    def __init__(self, metrics, client):
+        self.metrics = metrics
+        self.client = client
+        metrics.take()  # counts inherited from the loader are already there
+
+    def __getattr__(self, name):
+        return getattr(self.metrics, name)   # recording stays local
+
+    def flush(self):
+        """Send the counts recorded since the last flush to the loader"""
+        counts = self.metrics.take()
+        if any(counts.values()):
+            self.client.call('metrics.merge', counts)
+
+    def render(self):
+        self.flush()
+        return self.client.call('metrics.render')
+
+    def start(self, interval):
+        """Also flush in the background so scrapes of any worker count this one's requests"""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.flush()
+        threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+
+
+class ProfilerClient:
+    """Stand-in for the profiler in a worker; finished profiles are kept in the loader"""
+
+    def __init__(self, profiler, client):
+        self.profiler = profiler
+        self.client = client
+        profiler.on_stop = lambda profile: client.call('profiler.add', profile)
+
+    def start(self):
+        return self.profiler.start()
+
+    def get(self, profile_id):
+        return self.client.call('profiler.get', profile_id)
+
+    def list(self):
+        return self.client.call('profiler.list')
+
+
+class WorkerSync:
+    """Refreshes a worker's derived state for the changes the loader has logged"""
+
+    def __init__(self, app_module, changes, versions, interval=0.5):
+        self.app = app_module
+        self.changes = changes
+        self.versions = versions
+        self.interval = interval
+        self.cursor = changes.head()
+        self.seen = versions.copy()
+        self._lock = threading.Lock()
+
+    def sync(self):
+        if self.changes.head() == self.cursor and np.array_equal(self.versions, self.seen):
+            return
+        with self._lock:
+            head, changes = self.changes.read(self.cursor)
+            if changes is None:
+                # Fell too far behind to know which rows changed
+                self.app.predictor.cache.invalidate()
+                self.app.aggregates.rebuild()
+                self.app.alert_detector.resync()
+            elif head != self.cursor:
+                self._apply(*changes)
+            current = self.versions.copy()
+            if current[RESULTS_VERSION] != self.seen[RESULTS_VERSION]:
+                self.app.adopt_published_forecasts()
+            self.app.response_cache.invalidate()
+            self.cursor, self.seen = head, current
+
+    def _apply(self, rows, kinds):
+        inventory = self.app.inventory
+        stocked = np.unique(rows[(kinds & STOCK_CHANGED) != 0])
+        sold = np.unique(rows[(kinds & SALES_CHANGED) != 0])
+        if len(stocked):
+            product_ids = inventory.product_ids_at(stocked)
+            self.app.aggregates.update(product_ids)
+            self.app.alert_detector.update(product_ids)
+        if len(sold):
+            self.app.predictor.cache.sales_changed(inventory.product_ids_at(sold))
+
+    def start(self):
+        """Also poll in the background so alert streams update on idle workers"""
+        def run():
+            while True:
+                time.sleep(self.interval)
+                self.sync()
+        threading.Thread(target=run, name='worker-sync', daemon=True).start()
+
+
+def share_inventory(app_module, shared):
+    """Move the runtime-mutable arrays into shared memory, before forking"""
+    inventory = app_module.inventory
+    inventory.relocate_columns('products', ['current_stock'], shared.allocate)
+    inventory.relocate_columns('warehouse_inventory', ['available_stock'], shared.allocate)
+    app_module.forecaster.relocate_state(shared.allocate)
+
+    # Module-level aliases used by the endpoints
+    app_module.products_df = inventory.tables['products']
+    app_module.warehouse_df = inventory.tables['warehouse_inventory']
+
+    # Built once here so workers inherit it instead of each building their own
+    app_module.rebalancer.get_distance_matrix(app_module.distances_df)
+
+    changes = ChangeLog(shared.allocate)
+    versions = shared.allocate(np.zeros(1, dtype=np.int64))
+
+    def log_change(event):
+        stock = inventory.product_rows(list(event.get('stock') or {}))
+        kinds = np.full(len(stock), STOCK_CHANGED, dtype=np.int8)
+        if event['type'] == 'sales':
+            kinds |= np.int8(SALES_CHANGED)    # sales events carry stock for the products sold
+        stock, kinds = stock[stock >= 0], kinds[stock >= 0]
+        if not len(stock) and event.get('warehouse'):
+            stock, kinds = np.array([-1]), np.zeros(1, dtype=np.int8)
+        if len(stock):
+            changes.append(stock, kinds)
+    app_module.ledger.subscribe(log_change)
+
+    def published(key):
+        versions[RESULTS_VERSION] += 1
+    app_module.jobs.subscribe(published)
+    return changes, versions
+
+
+def run_worker(app_module, listener, connection, changes, versions, sync_interval, host, port):
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    from werkzeug.serving import make_server
+
+    worker_sync = WorkerSync(app_module, changes, versions, sync_interval)
+    app_module.ledger = WriteClient(connection, on_write=worker_sync.sync)
+    app_module.jobs = JobClient(app_module.ledger, app_module.jobs.workers)
+    app_module.metrics = MetricsClient(app_module.metrics, app_module.ledger)
+    app_module.metrics.start(sync_interval)
+    app_module.profiler = ProfilerClient(app_module.profiler, app_module.ledger)
+    app_module.app.before_request(worker_sync.sync)
+    worker_sync.start()
+
+    server = make_server(host, port, app_module.app, threaded=True, fd=listener.fileno())
+    server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the inventory API from prefork worker processes')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--sync-interval', type=float, default=0.5,
+                        help='seconds between worker checks for new data versions')
+    args = parser.parse_args(argv)
+
+    import app as app_module
+
+    shared = SharedArrays()
+    changes, versions = share_inventory(app_module, shared)
+    write_server = WriteServer(app_module.ledger, app_module.jobs, app_module.metrics, app_module.profiler)
+    print(f"Moved {shared.nbytes()} bytes of mutable inventory state to shared memory")
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(1024)
+    listener.set_inheritable(True)
+
+    # Keep the loaded objects out of the collector so it doesn't dirty their shared pages
+    gc.collect()
+    gc.freeze()
+
+    workers = {}
+
+    def spawn():
+        parent_end, child_end = Pipe()
+        pid = os.fork()
+        if pid == 0:
+            parent_end.close()
+            try:
+                run_worker(app_module, listener, child_end, changes, versions, args.sync_interval,
+                           args.host, args.port)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(1)
+        child_end.close()
+        write_server.start(parent_end)
+        workers[pid] = parent_end
+
+    for _ in range(args.workers):
+        spawn()
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        while not stopping:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(0.2)
+                continue
+            workers.pop(pid).close()
+            if not stopping:
+                print(f"Worker {pid} exited with status {status}, restarting")
+                time.sleep(1)   # don't spin if workers crash at startup
+                spawn()
+    finally:
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(workers):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        app_module.ledger.journal.close()
+        shared.close()
+        listener.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
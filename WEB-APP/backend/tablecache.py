@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 2   # bump when the manifest or column file layout changes
+
+
+def _file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_crc32(path, block_size=1 << 20):
+    crc = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+class TableCache:
+    """Binary columnar copies of the prepared CSV tables.
+
+    Each table is stored as one ``.npy`` file per column (category codes
+    plus a categories file for text) and a manifest recording the source
+    CSV's mtime, size and SHA-256, the cache format and the ``version`` of
+    the code that prepared the table; a mismatch in any rebuilds it.
+    Columns are memory-mapped copy-on-write on load, so startup skips CSV
+    parsing entirely, processes share the pages through the OS page
+    cache, and in-place stock updates stay private to the process making
+    them.
+    """
+
+    def __init__(self, directory, verify=False, version=None):
+        self.directory = directory
+        self.verify = verify    # re-check column checksums on every load
+        self.version = version  # e.g. datastore.preparation_version()
+
+    def read(self, name, source_path):
+        """The cached table if it is still current for ``source_path``, else None"""
+        table_dir = os.path.join(self.directory, name)
+        manifest_path = os.path.join(table_dir, MANIFEST)
+        if not os.path.exists(manifest_path) or not os.path.exists(source_path):
+            return None
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if not self._is_current(manifest, source_path, manifest_path):
+                return None
+            return self._read_columns(table_dir, manifest)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring table cache for {name}: {e}")
+            return None
+
+    def write(self, name, source_path, df):
+        """Store a prepared table, keyed on the current state of ``source_path``"""
+        if not os.path.exists(source_path):
+            return   # generated sample data is never cached
+        table_dir = os.path.join(self.directory, name)
+        os.makedirs(table_dir, exist_ok=True)
+        manifest_path = os.path.join(table_dir, MANIFEST)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)   # invalidate while columns are rewritten
+
+        stat = os.stat(source_path)
+        columns = []
+        for position, (column_name, column) in enumerate(df.items()):
+            entry = {'name': column_name, 'file': f'{position}.npy'}
+            if isinstance(column.dtype, pd.CategoricalDtype) or column.dtype == object:
+                if column.dtype == object:
+                    entry['kind'] = 'text'
+                    values, categories = pd.factorize(column)
+                else:
+                    entry['kind'] = 'category'
+                    values, categories = column.cat.codes.to_numpy(), column.cat.categories
+                entry['categories'] = f'{position}.categories.npy'
+                self._save(table_dir, entry['categories'], categories.to_numpy(dtype=str))
+            else:
+                entry['kind'] = 'numeric'
+                values = column.to_numpy()
+            entry['crc32'] = self._save(table_dir, entry['file'], values)
+            columns.append(entry)
+
+        manifest = {
+            'format': FORMAT_VERSION,
+            'version': self.version,
+            'source': os.path.abspath(source_path),
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': _file_sha256(source_path),
+            'rows': len(df),
+            'columns': columns
+        }
+        self._write_json(manifest_path, manifest)
+
+    def _is_current(self, manifest, source_path, manifest_path):
+        if manifest.get('format') != FORMAT_VERSION or manifest.get('version') != self.version:
+            return False
+        stat = os.stat(source_path)
+        if stat.st_size != manifest['size']:
+            return False
+        if stat.st_mtime_ns == manifest['mtime_ns']:
+            return True
+        # Touched but possibly unchanged: compare content before reparsing
+        if _file_sha256(source_path) != manifest['sha256']:
+            return False
+        manifest['mtime_ns'] = stat.st_mtime_ns
+        self._write_json(manifest_path, manifest)
+        return True
+
+    def _read_columns(self, table_dir, manifest):
+        columns = {}
+        for entry in manifest['columns']:
+            path = os.path.join(table_dir, entry['file'])
+            if self.verify and _file_crc32(path) != entry['crc32']:
+                raise ValueError(f"checksum mismatch in {path}")
+            values = np.load(path, mmap_mode='c')
+            if entry['kind'] == 'numeric':
+                columns[entry['name']] = values
+                continue
+            categories = np.load(os.path.join(table_dir, entry['categories'])).astype(object)
+            column = pd.Categorical.from_codes(values, categories=pd.Index(categories))
+            columns[entry['name']] = column if entry['kind'] == 'category' else column.astype(object)
+        return pd.DataFrame(columns, index=pd.RangeIndex(manifest['rows']), copy=False)
+
+    @staticmethod
+    def _save(table_dir, filename, values):
+        path = os.path.join(table_dir, filename)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(values), allow_pickle=False)
+        os.replace(tmp_path, path)
+        return _file_crc32(path)
+
+    @staticmethod
+    def _write_json(path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
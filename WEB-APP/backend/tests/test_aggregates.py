@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from aggregates import StockAggregates
+from datastore import SALES_COLUMNS, InventoryStore, prepare_table
+from journal import Journal
+from ledger import InventoryLedger
+
+
+def make_inventory():
+    products = pd.DataFrame({
+        'product_id': ['P1_S1', 'P2_S1', 'P1_S2', 'P2_S2', 'P1_S3'],
+        'store_id': ['S1', 'S1', 'S2', 'S2', 'S3'],
+        'name': ['Milk', 'Bread', 'Milk', 'Bread', 'Milk'],
+        'current_stock': [50, 12, 8, 40, 100],
+        'min_threshold': [20, 10, 10, 15, 30],
+        'max_capacity': [100, 60, 80, 90, 150]
+    })
+    warehouse = pd.DataFrame({
+        'product_name': ['Milk', 'Bread'],
+        'available_stock': [500, 300],
+        'warehouse_location': ['Central Warehouse', 'Central Warehouse']
+    })
+    tables = {
+        'products': products,
+        'sales_history': pd.DataFrame(columns=SALES_COLUMNS),
+        'warehouse_inventory': warehouse
+    }
+    return InventoryStore({name: prepare_table(name, df) for name, df in tables.items()})
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = InventoryLedger(make_inventory(), Journal(str(tmp_path / 'journal'), commit_interval=0))
+    yield ledger
+    ledger.journal.close()
+
+
+def test_counters_match_after_writes(ledger):
+    aggregates = StockAggregates(ledger.inventory)
+    ledger.subscribe(lambda event: aggregates.update(list(event.get('stock', {}))))
+    ledger.start()
+
+    ledger.transfer('S1', 'S2', 'Milk', 35)
+    ledger.transfer('S3', 'S1', 'Milk', 10)
+    ledger.place_order('S1', 'Bread', 30, 'high')
+    ledger.record_sales({'P2_S1': 7, 'P2_S2': 30, 'P1_S3': 70, 'P9_S9': 1})
+
+    assert aggregates.verify() == []
+    totals = aggregates.network()
+    assert totals['products'] == 5
+    assert totals['low_stock'] == 3        # P2_S1, P2_S2 and P1_S3
+    assert totals['critical_stock'] == 1   # P2_S1
+
+
+def test_verify_reports_drift_without_fixing_it(ledger):
+    aggregates = StockAggregates(ledger.inventory)
+    ledger.start()   # no listener, so the counters fall behind
+
+    ledger.record_sales({'P1_S2': 8})
+    assert aggregates.verify() == ['S2']
+    assert aggregates.verify() == ['S2']
+
+    aggregates.rebuild()
+    assert aggregates.verify() == []
@@ -0,0 +1,37 @@
+import numpy as np
+
+from forecasting import IncrementalForecaster, simulate_stockouts
+
+
+def test_simulation_does_not_depend_on_blocks_or_shards():
+    rng = np.random.default_rng(0)
+    n = 300
+    model = (rng.uniform(0, 10, n), rng.normal(0, 0.05, n), np.full(n, 60), np.full(n, 100.0),
+             rng.uniform(0, 4, n), rng.uniform(0, 300, n))
+    curve, stock_needed = simulate_stockouts(*model, paths=200, seed=5)
+
+    shards = [(0, 7), (7, 150), (150, n)]
+    parts = [simulate_stockouts(*(column[start:end] for column in model), paths=200, seed=5,
+                                streams=np.arange(start, end), block_bytes=1 << 16)
+             for start, end in shards]
+    assert (np.concatenate([part[0] for part in parts]) == curve).all()
+    assert (np.concatenate([part[1] for part in parts]) == stock_needed).all()
+
+
+def test_observed_sales_are_placed_by_date():
+    history = np.array([[3.0, 5.0, 4.0], [1.0, 0.0, 0.0]])
+    lengths = np.array([3, 1])
+    last_day = np.datetime64('2026-03-03').astype(np.int64)
+    forecaster = IncrementalForecaster(['a', 'b'], decay=0.9)
+    forecaster.load_history(lambda ids: (history, lengths), lambda ids: np.full(len(ids), last_day))
+
+    forecaster.observe(['a', 'b'], [2, 1], '2026-03-03')   # adds into the last day
+    forecaster.observe(['a', 'b'], [6, 2], '2026-03-06')   # after two days without sales
+    taken = forecaster.observe(['a', 'b'], [9, 9], '2026-03-05')
+    assert not taken.any()
+
+    expected = IncrementalForecaster(['a', 'b'], decay=0.9)
+    expected.load_history(lambda ids: (np.array([[3.0, 5.0, 6.0, 0.0, 0.0, 6.0], [2.0, 0.0, 0.0, 2.0, 0.0, 0.0]]),
+                                       np.array([6, 4])))
+    for name in ('count', 'total', 'weight', 'sum_x', 'sum_y', 'sum_xx', 'sum_xy', 'sum_yy', 'last_sales'):
+        assert np.allclose(getattr(forecaster, name)[:2], getattr(expected, name)[:2])
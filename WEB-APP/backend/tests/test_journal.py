@@ -0,0 +1,29 @@
+from journal import Journal
+
+
+def write_events(journal, count):
+    for i in range(count):
+        journal.wait_durable(journal.append({'type': 'x', 'i': i}))
+
+
+def test_torn_tail_is_cut_before_new_writes(tmp_path):
+    journal = Journal(str(tmp_path), commit_interval=0)
+    journal.replay()
+    journal.open()
+    write_events(journal, 3)
+    journal.close()
+    with open(journal.log_path, 'a') as f:
+        f.write('{"type":"x","i":')    # crashed mid-write
+
+    journal = Journal(str(tmp_path), commit_interval=0)
+    state, events = journal.replay()
+    assert [event['lsn'] for event in events] == [1, 2, 3]
+    journal.open()
+    write_events(journal, 3)
+    journal.close()
+
+    journal = Journal(str(tmp_path), commit_interval=0)
+    state, events = journal.replay()
+    assert state is None
+    assert [event['lsn'] for event in events] == [1, 2, 3, 4, 5, 6]
+    assert journal.lsn == 6
@@ -0,0 +1,40 @@
+import csv
+
+import pytest
+
+from journal import Journal
+from ledger import InventoryLedger, LedgerError
+from test_aggregates import make_inventory
+
+
+def open_ledger(tmp_path, path):
+    ledger = InventoryLedger(make_inventory(), Journal(str(tmp_path / 'journal'), commit_interval=0),
+                             compact_every=0, archive_paths={'transfer_history': str(path)})
+    ledger.start()
+    return ledger
+
+
+def test_records_are_appended_to_a_table_replaced_by_a_shorter_one(tmp_path):
+    path = tmp_path / 'transfer_history.csv'
+    path.write_text('transfer_id,from_store,to_store,product_name,quantity\nT0,S1,S2,Milk,1\nT00,S1,S2,Milk,2\n')
+    ledger = open_ledger(tmp_path, path)
+    ledger.transfer('S1', 'S2', 'Milk', 3)
+    ledger.journal.close()
+
+    path.write_text('transfer_id,from_store,to_store,product_name,quantity\nT9,S3,S1,Milk,4')
+    ledger = open_ledger(tmp_path, path)
+    ledger.compact()
+    ledger.journal.close()
+
+    assert '\0' not in path.read_text()
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [(row['transfer_id'], row['quantity']) for row in rows] == [('T9', '4'), ('T0000000001', '3')]
+
+
+def test_sales_dates_are_checked(tmp_path):
+    ledger = open_ledger(tmp_path, tmp_path / 'transfer_history.csv')
+    with pytest.raises(LedgerError):
+        ledger.record_sales({'P1_S1': 1}, '17/10/2026')
+    ledger.record_sales({'P1_S1': 1}, '2026-10-17')
+    ledger.journal.close()
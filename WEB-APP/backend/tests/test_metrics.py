@@ -0,0 +1,28 @@
+import pickle
+
+from metrics import Metrics, Profiler
+
+
+def test_counts_taken_from_workers_merge_into_one_total():
+    loader, worker = Metrics((0.1, 1.0)), Metrics((0.1, 1.0))
+    for seconds in (0.05, 0.5, 2.0):
+        worker.observe_request('/api/stores', 'GET', 200, seconds)
+    loader.merge(worker.take())
+    worker.observe_request('/api/stores', 'GET', 200, 0.05)
+    loader.merge(worker.take())
+
+    text = loader.render()
+    assert 'inventory_http_request_duration_seconds_bucket{route="/api/stores",method="GET",status="200",le="0.1"} 2' in text
+    assert 'inventory_http_request_duration_seconds_count{route="/api/stores",method="GET",status="200"} 4' in text
+    assert worker.take() == {'requests': {}, 'stages': {}}
+
+
+def test_stopped_profiles_are_handed_over():
+    loader, worker = Profiler(), Profiler()
+    worker.on_stop = lambda profile: loader.add(pickle.loads(pickle.dumps(profile)))
+    profile = worker.start()
+    profile.stop('/api/stores', 'GET', 200)
+
+    copy = loader.get(profile.id)
+    assert copy.summary() == profile.summary()
+    copy.stop()     # already stopped, nothing to do
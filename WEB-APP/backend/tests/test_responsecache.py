@@ -0,0 +1,18 @@
+import responsecache
+from responsecache import ResponseCache
+
+
+def test_etag_is_computed_only_for_tagged_lookups(monkeypatch):
+    hashed = []
+    monkeypatch.setattr(responsecache, 'json_etag', lambda value: hashed.append(value) or 'tag')
+    cache = ResponseCache(ttl=60)
+
+    assert cache.get('k', lambda: [1, 2]) == [1, 2]
+    assert hashed == []
+    assert cache.get_tagged('k', lambda: [3]) == ([1, 2], 'tag')
+    assert cache.get_tagged('k', lambda: [3]) == ([1, 2], 'tag')
+    assert hashed == [[1, 2]]
+
+    cache.invalidate()
+    assert cache.get_tagged('k', lambda: [3]) == ([3], 'tag')
+    assert hashed == [[1, 2], [3]]
@@ -0,0 +1,17 @@
+import numpy as np
+
+from sales_ingest import stream_sales_history
+
+
+def test_products_outside_retention_are_left_out(tmp_path):
+    path = tmp_path / 'sales_history.csv'
+    rows = [f'P_NEW,2025-06-{day:02d},{day}' for day in range(1, 11)] + ['P_OLD,2025-01-15,4']
+    path.write_text('product_id,date,units_sold\n' + '\n'.join(rows) + '\n')
+
+    series = stream_sales_history(str(path), chunksize=1, retention_days=30)
+
+    assert list(series.product_index) == ['P_NEW']
+    matrix, lengths = series.matrix(['P_NEW', 'P_OLD'])
+    assert lengths.tolist() == [10, 0]
+    assert matrix[0].tolist() == list(range(1, 11))
+    assert (series.first_day >= 0).all() and (series.first_day <= series.days).all()
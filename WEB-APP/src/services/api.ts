@@ -33,6 +33,10 @@ export interface Alert {
   timestamp: string
 }
 
+export interface AlertDelta extends Alert {
+  change: 'new' | 'escalated' | 'eased' | 'resolved'
+}
+
 export interface AIInsight {
   type: string
   title: string
@@ -101,6 +105,18 @@ class ApiService {
     }
   }
 
+  // Pushes alert threshold crossings as they happen; returns an unsubscribe function
+  subscribeStoreAlerts(storeId: string | null, onDelta: (delta: AlertDelta) => void): () => void {
+    const url = storeId ? `${API_BASE_URL}/stores/${storeId}/alerts/stream` : `${API_BASE_URL}/alerts/stream`
+    const source = new EventSource(url)
+    const handler = (event: MessageEvent) => onDelta(JSON.parse(event.data))
+    for (const change of ['new', 'escalated', 'eased', 'resolved']) {
+      source.addEventListener(change, handler)
+    }
+    source.onerror = (error) => console.error('Alert stream error:', error)
+    return () => source.close()
+  }
+
   async fetchAIInsights(storeId: string): Promise<AIInsight[]> {
     try {
       const response = await fetch(`${API_BASE_URL}/stores/${storeId}/insights`)